@@ -0,0 +1,133 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+"""
+import random, math
+import numpy as np
+
+# Bits come from a 32-bit maximal-length LFSR (Galois form, period 2^32-1 bits). Its output
+# satisfies s[n+32] = s[n] ^ s[n+2] ^ s[n+6] ^ s[n+7] (x^32+x^7+x^6+x^2+1), which is
+# used to regenerate the sequence offline
+LFSR_MASK = 0xA3000000
+LFSR_LEN = 32
+LFSR_TAPS = (0, 2, 6, 7)
+
+def make_seed():
+    '''
+    Returns:
+        seed - random non-zero state of the LFSR (int)
+    '''
+    return random.SystemRandom().randrange(1, 1 << LFSR_LEN)
+
+class AlignSignal():
+    '''
+    pseudo-random signal sent on a digital out channel to align behavior and ephys clocks.
+    Bit k is set at 'start_t' + k*'flip_duration' (device time, sec.) on a fixed grid, so
+    from 'seed', 'start_t' and 'flip_duration' the expected signal can be regenerated
+    offline with 'align_bits' and 'align_signal_at'. Bits due while the FSM loop stalled
+    (e.g., pulling data) are skipped, not sent late, so the signal stays on the grid.
+    In FSM loop:
+        if t >= align_signal.next_t:
+            dout.set('random', align_signal.bit_at(t))
+    '''
+    def __init__(self, flip_duration, seed=None):
+        '''
+        Arguments:
+            flip_duration - duration of each bit, in sec. (float)
+            seed - state of the LFSR at start; random if None (int)
+        '''
+        self.flip_duration = flip_duration
+        self.seed = make_seed() if seed is None else int(seed)
+        if not 0 < self.seed < (1 << LFSR_LEN):
+            raise ValueError('seed must be a non-zero ' + str(LFSR_LEN) + '-bit integer')
+        self.start(math.nan)
+
+    def start(self, start_t):
+        '''
+        restarts the sequence from 'seed'; first bit is due at 'start_t'
+        '''
+        self.start_t = start_t
+        self.state = self.seed
+        self.num_bit = 0
+        self.next_t = start_t
+
+    def next_bit(self):
+        '''
+        Returns:
+            bit - next bit of the sequence (int)
+        '''
+        bit = self.state & 1
+        self.state >>= 1
+        if bit:
+            self.state ^= LFSR_MASK
+        self.num_bit += 1
+        self.next_t = self.start_t + self.num_bit*self.flip_duration # on grid; no drift
+        return bit
+
+    def bit_at(self, t):
+        '''
+        advances the sequence to the bit due at 't', skipping any due before it
+        Arguments:
+            t - current device time, in sec.; at or after 'next_t' (float)
+        Returns:
+            bit - bit to show from 't' until 'next_t' (int)
+        '''
+        bit_idx = max(int(math.floor((t - self.start_t)/self.flip_duration)), self.num_bit)
+        bit = self.next_bit()
+        while self.num_bit <= bit_idx:
+            bit = self.next_bit()
+        return bit
+
+    def attrs(self):
+        '''
+        Returns:
+            attrs - what is needed to regenerate the signal; saved with the session (dict)
+        '''
+        return {'align_seed': self.seed, 'align_start_t': self.start_t, 'align_flip_duration': self.flip_duration}
+
+def align_bits(seed, num_bit):
+    '''
+    regenerates the bits sent by 'AlignSignal' in bulk
+    Arguments:
+        seed - state of the LFSR at start (int)
+        num_bit - num. of bits (int)
+    Returns:
+        bits - bits in order they were sent (np.uint8 array)
+    '''
+    num_bit = int(num_bit)
+    bits = np.empty(max(num_bit, LFSR_LEN), dtype=np.uint8)
+    state = int(seed)
+    for idx in range(LFSR_LEN): # first bits from the register itself
+        bit = state & 1
+        state >>= 1
+        if bit:
+            state ^= LFSR_MASK
+        bits[idx] = bit
+    # Rest from the recurrence; every bit in a block only depends on bits before the block
+    block = LFSR_LEN - max(LFSR_TAPS)
+    for idx in range(LFSR_LEN, len(bits), block):
+        num = min(block, len(bits)-idx)
+        start = idx - LFSR_LEN
+        new_bits = bits[start:start+num].copy()
+        for tap in LFSR_TAPS[1:]:
+            new_bits ^= bits[start+tap:start+tap+num]
+        bits[idx:idx+num] = new_bits
+    return bits[:num_bit]
+
+def align_signal_at(t, seed, start_t, flip_duration):
+    '''
+    expected value of the signal at given (device) times
+    Arguments:
+        t - times, in sec. (array-like)
+        seed, start_t, flip_duration - as saved with the session, i.e., 'AlignSignal.attrs'
+    Returns:
+        signal - value at each time; 0 before 'start_t' (np.uint8 array)
+    '''
+    t = np.asarray(t, dtype=float)
+    bit_idx = np.floor((t - start_t)/flip_duration)
+    valid = bit_idx >= 0
+    bit_idx = np.where(valid, bit_idx, 0).astype(np.int64)
+    bits = align_bits(seed, bit_idx.max()+1 if bit_idx.size else 0)
+    signal = np.zeros(t.shape, dtype=np.uint8)
+    signal[valid] = bits[bit_idx[valid]]
+    return signal
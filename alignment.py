@@ -0,0 +1,251 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Offline alignment of behavior (VPixx device) and ephys times using the random signal sent on
+digital out ch. 3 and recorded by both systems. Edges of the signal are extracted from each
+recording, a coarse offset is found by FFT cross-correlation, edges are matched segment by
+segment, and a line is fit to each segment. The resulting piecewise-linear clock map accounts
+for the drift between the two clocks and is saved with the session (group 'alignment').
+    clock_map = align_session(data_file_path, ephys_signal, ephys_rate)
+    ephys_t = clock_map.to_ephys(behavior_t)
+"""
+import numpy as np
+import h5py
+
+from session_layout import is_session_layout, TIME_KEYS
+
+ALIGN_DOUT_BIT = 2 # bit of the random signal in 'dout_data'; same as DOUT_CHANNELS['random']
+
+def load_behavior_signal(data_file_path, bit=ALIGN_DOUT_BIT):
+    '''
+    Arguments:
+        data_file_path - session file saved by DataManager, in either layout, with or without
+                         '.hdf5' (str)
+        bit - bit of digital out with the signal (int)
+    Returns:
+        t - device time of every 2000 Hz sample of the session, in sec. (np.array)
+        signal - value of the signal at each sample (np.uint8 array)
+    '''
+    if not data_file_path.endswith('.hdf5'):
+        data_file_path += '.hdf5'
+    with h5py.File(data_file_path,'r') as data_file:
+        if is_session_layout(data_file):
+            time_key = next(key for key in TIME_KEYS if key in data_file['columns'])
+            t = data_file['columns'][time_key][()]
+            dout = data_file['columns']['dout_data'][()]
+        else:
+            trial_keys = sorted((key for key in data_file if key.startswith('trial_')), key=lambda key: int(key.split('_')[1]))
+            time_key = next((key for key in TIME_KEYS if trial_keys and key in data_file[trial_keys[0]]), TIME_KEYS[0])
+            t = np.concatenate([data_file[key][time_key][:] for key in trial_keys])
+            dout = np.concatenate([data_file[key]['dout_data'][:] for key in trial_keys])
+    if np.any(np.diff(t) < 0):
+        order = np.argsort(t, kind='stable')
+        t = t[order]
+        dout = dout[order]
+    signal = ((dout.astype(np.int64) >> bit) & 1).astype(np.uint8)
+    return t, signal
+
+def extract_edges(signal, t=None, rate=None, t0=0.0, threshold=0.5):
+    '''
+    Arguments:
+        signal - digital or analog samples of the signal (np.array)
+        t - time of each sample, in sec.; or give 'rate' and 't0' for evenly sampled signals,
+            e.g., ephys, so no time array has to be made (np.array)
+        rate - sampling rate, in Hz (float)
+        t0 - time of first sample, in sec. (float)
+        threshold - samples above this are high (float)
+    Returns:
+        edge_t - time of first sample after each change, in sec. (np.array)
+        edge_level - level after each change; 1 rising, 0 falling (np.uint8 array)
+        initial_level - level at first sample (int)
+    '''
+    level = np.asarray(signal) > threshold
+    edge_idx = np.flatnonzero(level[1:] != level[:-1]) + 1
+    if t is not None:
+        edge_t = np.asarray(t, dtype=float)[edge_idx]
+    else:
+        edge_t = t0 + edge_idx/rate
+    return edge_t, level[edge_idx].astype(np.uint8), int(level[0]) if len(level) else 0
+
+def level_on_grid(edge_t, edge_level, initial_level, grid_t):
+    '''
+    Returns:
+        level - level of the signal at each time of 'grid_t', as -1/1 (np.int8 array)
+    '''
+    idx = np.searchsorted(edge_t, grid_t, side='right') - 1
+    level = np.where(idx >= 0, edge_level[np.maximum(idx,0)], initial_level)
+    return (2*level.astype(np.int8) - 1)
+
+def find_offset(behavior_edges, ephys_edges, behavior_span, ephys_span, bin_width=0.001):
+    '''
+    offset between the clocks by FFT cross-correlation of the signal levels
+    Arguments:
+        behavior_edges, ephys_edges - (edge_t, edge_level, initial_level) of 'extract_edges'
+        behavior_span, ephys_span - (start, end) times to use, in sec. of each clock
+        bin_width - resolution of the cross-correlation, in sec. (float)
+    Returns:
+        offset - ephys time minus behavior time (float)
+    '''
+    behavior_grid = np.arange(behavior_span[0], behavior_span[1], bin_width)
+    ephys_grid = np.arange(ephys_span[0], ephys_span[1], bin_width)
+    behavior_level = level_on_grid(*behavior_edges, behavior_grid).astype(np.float32)
+    ephys_level = level_on_grid(*ephys_edges, ephys_grid).astype(np.float32)
+    n = len(behavior_level) + len(ephys_level)
+    n_fft = 1 << int(np.ceil(np.log2(n)))
+    xcorr = np.fft.irfft(np.fft.rfft(ephys_level, n_fft) * np.conj(np.fft.rfft(behavior_level, n_fft)), n_fft)
+    lag = int(np.argmax(xcorr))
+    if lag > n_fft - len(behavior_level): # negative lag; ephys started after behavior
+        lag -= n_fft
+    return ephys_grid[0] + lag*bin_width - behavior_grid[0]
+
+def match_edges(behavior_t, behavior_level, ephys_t, ephys_level, predicted_t, tolerance):
+    '''
+    Arguments:
+        predicted_t - expected ephys time of each behavior edge (np.array)
+        tolerance - max. difference from the expected time, in sec. (float)
+    Returns:
+        matched - whether each behavior edge was matched (np.bool array)
+        ephys_idx - index of the ephys edge matched to each behavior edge (np.array)
+    '''
+    idx = np.clip(np.searchsorted(ephys_t, predicted_t), 1, len(ephys_t)-1)
+    before_closer = np.abs(predicted_t - ephys_t[idx-1]) < np.abs(ephys_t[idx] - predicted_t)
+    idx = np.where(before_closer, idx-1, idx)
+    matched = (np.abs(ephys_t[idx] - predicted_t) <= tolerance) & (ephys_level[idx] == behavior_level)
+    return matched, idx
+
+class ClockMap():
+    '''
+    piecewise-linear map from behavior to ephys time; linear between knots and extended
+    beyond the first and last knots with the slope of the end segments
+    '''
+    def __init__(self, behavior_t, ephys_t, slope, residual=None):
+        '''
+        Arguments:
+            behavior_t, ephys_t - times of the knots, in sec. of each clock (np.array)
+            slope - ephys/behavior clock rate fit in each segment (np.array)
+            residual - ephys time of matched edges minus mapped time, in sec. (np.array)
+        '''
+        self.behavior_t = np.asarray(behavior_t, dtype=float)
+        self.ephys_t = np.asarray(ephys_t, dtype=float)
+        self.slope = np.asarray(slope, dtype=float)
+        self.residual = np.zeros(0) if residual is None else np.asarray(residual, dtype=float)
+
+    def to_ephys(self, t):
+        t = np.asarray(t, dtype=float)
+        ephys_t = np.interp(t, self.behavior_t, self.ephys_t)
+        before = t < self.behavior_t[0]
+        ephys_t[before] = self.ephys_t[0] + self.slope[0]*(t[before] - self.behavior_t[0])
+        after = t > self.behavior_t[-1]
+        ephys_t[after] = self.ephys_t[-1] + self.slope[-1]*(t[after] - self.behavior_t[-1])
+        return ephys_t
+
+    def to_behavior(self, t):
+        t = np.asarray(t, dtype=float)
+        behavior_t = np.interp(t, self.ephys_t, self.behavior_t)
+        before = t < self.ephys_t[0]
+        behavior_t[before] = self.behavior_t[0] + (t[before] - self.ephys_t[0])/self.slope[0]
+        after = t > self.ephys_t[-1]
+        behavior_t[after] = self.behavior_t[-1] + (t[after] - self.ephys_t[-1])/self.slope[-1]
+        return behavior_t
+
+    def save(self, data_file_path):
+        '''
+        writes the map to group 'alignment' of the session file, replacing an old one
+        '''
+        if not data_file_path.endswith('.hdf5'):
+            data_file_path += '.hdf5'
+        with h5py.File(data_file_path,'a',libver='latest') as data_file:
+            if 'alignment' in data_file:
+                del data_file['alignment']
+            grp = data_file.create_group('alignment')
+            grp.create_dataset('behavior_t', data=self.behavior_t)
+            grp.create_dataset('ephys_t', data=self.ephys_t)
+            grp.create_dataset('slope', data=self.slope)
+            grp.attrs['num_matched'] = len(self.residual)
+            grp.attrs['residual_rms'] = np.sqrt(np.mean(self.residual**2)) if len(self.residual) else np.nan
+            grp.attrs['residual_max'] = np.max(np.abs(self.residual)) if len(self.residual) else np.nan
+
+    @classmethod
+    def load(cls, data_file_path):
+        if not data_file_path.endswith('.hdf5'):
+            data_file_path += '.hdf5'
+        with h5py.File(data_file_path,'r') as data_file:
+            grp = data_file['alignment']
+            return cls(grp['behavior_t'][:], grp['ephys_t'][:], grp['slope'][:])
+
+def align_edges(behavior_edges, ephys_edges, segment_duration=60.0, tolerance=0.005, search_duration=120.0, min_match=20):
+    '''
+    Arguments:
+        behavior_edges, ephys_edges - (edge_t, edge_level, initial_level) of 'extract_edges'
+        segment_duration - duration of each linear piece, in sec. of behavior time (float)
+        tolerance - max. difference between matched edges after the offset is known, in sec.;
+                    must be less than half the bit duration of the signal (float)
+        search_duration - duration of the start of behavior data used to find the offset by
+                          cross-correlation; searched over the whole ephys data (float)
+        min_match - segments with fewer matched edges are skipped (int)
+    Returns:
+        clock_map - (ClockMap)
+    '''
+    behavior_t, behavior_level, _ = behavior_edges
+    ephys_t, ephys_level, _ = ephys_edges
+    if len(behavior_t) < min_match or len(ephys_t) < min_match:
+        raise ValueError('not enough edges of alignment signal')
+    start = behavior_t[0]
+    offset = find_offset(behavior_edges, ephys_edges, (start, min(start+search_duration, behavior_t[-1])), (ephys_t[0], ephys_t[-1]))
+    # Last fit, used to predict ephys time of next segment
+    ref_behavior_t = start
+    ref_ephys_t = start + offset
+    slope = 1.0
+    seg_bounds = np.searchsorted(behavior_t, np.arange(start, behavior_t[-1] + segment_duration, segment_duration))
+    knot_behavior_t, knot_ephys_t, knot_slope = [], [], []
+    matched_behavior_t, matched_ephys_t = [], []
+    for seg_start, seg_end in zip(seg_bounds[:-1], seg_bounds[1:]):
+        seg_t = behavior_t[seg_start:seg_end]
+        seg_level = behavior_level[seg_start:seg_end]
+        if len(seg_t) < min_match:
+            continue
+        # Match with prediction, then again with the fit of this segment
+        for _ in range(2):
+            predicted_t = ref_ephys_t + slope*(seg_t - ref_behavior_t)
+            matched, ephys_idx = match_edges(seg_t, seg_level, ephys_t, ephys_level, predicted_t, tolerance)
+            if np.count_nonzero(matched) < min_match:
+                break
+            x = seg_t[matched]
+            y = ephys_t[ephys_idx[matched]]
+            center = np.mean(x)
+            slope, intercept = np.polyfit(x - center, y, 1)
+            ref_behavior_t = center
+            ref_ephys_t = intercept
+        else:
+            knot_behavior_t.append(ref_behavior_t)
+            knot_ephys_t.append(ref_ephys_t)
+            knot_slope.append(slope)
+            matched_behavior_t.append(x)
+            matched_ephys_t.append(y)
+    if not knot_behavior_t:
+        raise ValueError('no segment of alignment signal matched')
+    clock_map = ClockMap(knot_behavior_t, knot_ephys_t, knot_slope)
+    matched_behavior_t = np.concatenate(matched_behavior_t)
+    clock_map.residual = np.concatenate(matched_ephys_t) - clock_map.to_ephys(matched_behavior_t)
+    return clock_map
+
+def align_session(data_file_path, ephys_signal, ephys_rate, ephys_t0=0.0, threshold=0.5, **kwargs):
+    '''
+    aligns a session file to an ephys recording and saves the map to the session file
+    Arguments:
+        data_file_path - session file saved by DataManager (str)
+        ephys_signal - digitized signal recorded by ephys system, evenly sampled (np.array)
+        ephys_rate - sampling rate of ephys system, in Hz (float)
+        ephys_t0 - ephys time of first sample, in sec. (float)
+        threshold - ephys samples above this are high (float)
+        kwargs - passed to 'align_edges'
+    Returns:
+        clock_map - (ClockMap)
+    '''
+    t, signal = load_behavior_signal(data_file_path)
+    behavior_edges = extract_edges(signal, t=t)
+    ephys_edges = extract_edges(ephys_signal, rate=ephys_rate, t0=ephys_t0, threshold=threshold)
+    clock_map = align_edges(behavior_edges, ephys_edges, **kwargs)
+    clock_map.save(data_file_path)
+    return clock_map
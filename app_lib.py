@@ -3,10 +3,12 @@ Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
 @author: Jay Pi <jay.s.314159@gmail.com>
 """
 from pypixxlib._libdpx import DPxSelectDevice, TPxSetupTPxSchedule, TPxEnableFreeRun, DPxUpdateRegCache, TPxDisableFreeRun
+from parameter_store import read_parameter_file, set_parameter
+from target_geometry import prim_target_pos, corr_target_pos
+from polygon import inpolygon
 
-import math, simpleaudio, ctypes, json, os
+import math, simpleaudio, ctypes, os
 import numpy as np
-from matplotlib import path
 from pathlib import Path
 
 def playSound(freq, duration):
@@ -53,52 +55,21 @@ def load_parameter(folder_name,file_name,multi_instance,multi_monkey,default_par
                             - e.g., 'C\\Users\\a\\app\\exp_parameter.json'
     '''
     parameter_file_path = os.path.join(str(Path().absolute()),folder_name,file_name)
+    # Where parameters are in the file
+    keys = []
+    if multi_monkey == True:
+        keys.append(monkey_name)
+    if multi_instance == True:
+        keys.append(instance_name)
     if os.path.exists(parameter_file_path):
-        with open(parameter_file_path,'r+') as file:
-            if multi_monkey == True:
-                all_parameter = json.load(file)
-                if multi_instance == True:
-                    if monkey_name in all_parameter and instance_name in all_parameter[monkey_name]:
-                        parameter = all_parameter[monkey_name][instance_name]
-                    else:
-                        parameter = default_parameter_fnc()
-                        if monkey_name not in all_parameter: # if specific monkey not found
-                            all_parameter[monkey_name] = {}
-                        all_parameter[monkey_name][instance_name] = parameter
-                        file.seek(0)
-                        json.dump(all_parameter,file,indent=4)
-                    # If specific instance of parameters not exist
-                else:
-                    parameter = default_parameter_fnc()
-                    all_parameter[instance_name] = parameter
-                    file.seek(0)
-                    json.dump(all_parameter,file,indent=4)
-            else:
-                if multi_instance == True:
-                    all_parameter = json.load(file)
-                    if instance_name in all_parameter:
-                        parameter = all_parameter[instance_name]
-                    else: # if specific instance not found
-                        parameter = default_parameter_fnc()
-                        all_parameter[instance_name] = parameter
-                        file.seek(0)
-                        json.dump(all_parameter,file,indent=4)
-                else:
-                    parameter = json.load(file)
-    # If no file exists
-    else:
-        parameter = default_parameter_fnc()
-        with open(parameter_file_path,'w') as file:
-            if multi_monkey == True:
-                if multi_instance == True:
-                    json.dump({monkey_name: {instance_name: parameter}}, file, indent=4)
-                else:
-                    json.dump({monkey_name: parameter}, file, indent=4)
-            else:
-                if multi_instance == True:
-                    json.dump({instance_name: parameter}, file, indent=4)
-                else:
-                    json.dump(parameter, file, indent=4)
+        parameter = read_parameter_file(parameter_file_path)
+        for key in keys:
+            parameter = parameter.get(key) if isinstance(parameter, dict) else None
+        if parameter is not None:
+            return parameter, parameter_file_path
+    # If no file exists or specific monkey/instance not found, save default parameters
+    parameter = default_parameter_fnc()
+    set_parameter(parameter_file_path, parameter, *keys)
     return parameter, parameter_file_path
 
 def set_default_sys_parameter():
@@ -145,28 +116,6 @@ def set_default_tgt_parameter():
                 'pos':[0,0]
                 }
     return parameter
-def inpolygon(xq, yq, xv, yv):
-    """
-    checks which points are inside of the specified polygon
-    Arguments:
-        xv - np.array([xv1, xv2, xv3, ..., xvN, xv1])
-        yv - np.array([yv1, yv2, yv3, ..., yvN, yv1])
-        xq - np.array([xq1, xq2, xq3, ..., xqN])
-        yq - np.array([yq1, yq2, yq3, ..., yqN])
-    Returns:
-        contained_p - np.bool array indicating if the query points specified by xq and yq
-                      are inside of the polygon area defined by xv and yv
-    """
-    shape = xq.shape
-    xq = xq.reshape(-1)
-    yq = yq.reshape(-1)
-    xv = xv.reshape(-1)
-    yv = yv.reshape(-1)
-    q = [(xq[i], yq[i]) for i in range(xq.shape[0])]
-    p = path.Path([(xv[i], yv[i]) for i in range(xv.shape[0])])
-    contained_p = p.contains_points(q).reshape(shape)
-    return contained_p
-
 def VPixx_turn_on_schedule():
     '''
     ready VPixx to get data.
@@ -213,19 +162,9 @@ def make_prim_target(parameter):
     tgt_list - a list of target positions uniformly distributed around a circle according to a
                   number of targets and their amplitude
              - each element is a dictionary with all parameters needed for a target
+             - FSMs use 'target_geometry.prim_target_pos' directly, which gives an array
     '''
-    tgt_list = []
-    num_prim_sac_dir = parameter['num_prim_sac_dir']
-    prim_sac_amp = parameter['prim_sac_amp']
-    first_dir = parameter['first_prim_sac_dir']
-
-    for prim_tgt_idx in range(num_prim_sac_dir):
-        prim_tgt_dir = 2*math.pi/num_prim_sac_dir*prim_tgt_idx + first_dir*math.pi/180
-        prim_tgt_x = prim_sac_amp*math.cos(prim_tgt_dir)
-        prim_tgt_y = prim_sac_amp*math.sin(prim_tgt_dir)
-
-        tgt_list.append({'prim_tgt_pos': [prim_tgt_x, prim_tgt_y]})
-    return tgt_list
+    return [{'prim_tgt_pos': pos} for pos in prim_target_pos(parameter).tolist()]
 
 def make_corr_target(parameter):
     '''
@@ -236,27 +175,10 @@ def make_corr_target(parameter):
                   number of targets and their amplitude
              - each element is a dictionary with all parameters needed for a set of
                primary and secondary targets
+             - FSMs use 'target_geometry.corr_target_pos' directly, which gives arrays
     '''
-    tgt_list = []
-    num_prim_sac_dir = parameter['num_prim_sac_dir']
-    prim_sac_amp = parameter['prim_sac_amp']
-    first_prim_sac_dir = parameter['first_prim_sac_dir']
-    num_corr_sac_dir = parameter['num_corr_sac_dir']
-    corr_sac_amp = parameter['corr_sac_amp']
-    first_corr_sac_dir = parameter['first_corr_sac_dir']
-
-    for prim_tgt_idx in range(num_prim_sac_dir):
-        prim_tgt_dir = 2*math.pi/num_prim_sac_dir*prim_tgt_idx + first_prim_sac_dir*math.pi/180
-        prim_tgt_x = prim_sac_amp*math.cos(prim_tgt_dir)
-        prim_tgt_y = prim_sac_amp*math.sin(prim_tgt_dir)
-        for corr_tgt_idx in range (num_corr_sac_dir):
-            corr_tgt_dir = 2*math.pi/num_corr_sac_dir*corr_tgt_idx + first_corr_sac_dir*math.pi/180
-            corr_tgt_x = corr_sac_amp*math.cos(corr_tgt_dir) + prim_tgt_x
-            corr_tgt_y = corr_sac_amp*math.sin(corr_tgt_dir) + prim_tgt_y
-            tgt_list.append({'prim_tgt_pos': [prim_tgt_x, prim_tgt_y],
-                             'corr_tgt_pos': [corr_tgt_x, corr_tgt_y]})
-
-    return tgt_list
+    prim_pos, corr_pos = corr_target_pos(parameter)
+    return [{'prim_tgt_pos': prim, 'corr_tgt_pos': corr} for prim, corr in zip(prim_pos.tolist(), corr_pos.tolist())]
 
 def raw_to_deg(raw_data, cal_matrix):
     '''
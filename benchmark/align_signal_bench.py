@@ -0,0 +1,50 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Checks that 'align_bits' and 'align_signal_at' regenerate exactly what AlignSignal sends in
+the FSM loop, also when the loop stalls for up to 100 ms (bits due meanwhile are skipped),
+and times the per-tick cost against 'random.random() > 0.5' used previously.
+Run from the repository root: python benchmark/align_signal_bench.py
+"""
+import sys, time, random
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+
+from align_signal import AlignSignal, align_bits, align_signal_at
+
+if __name__ == '__main__':
+    # FSM loop at 2 kHz with jitter for ~10 min.
+    flip_duration = 0.015
+    align_signal = AlignSignal(flip_duration)
+    start_t = 1234.5678
+    align_signal.start(start_t)
+    rng = np.random.default_rng(0)
+    interval = rng.uniform(0.0004,0.0006,size=1200000)
+    interval[rng.integers(0, len(interval), size=200)] = rng.uniform(0.015,0.1,size=200) # stalls
+    t = start_t + np.cumsum(interval)
+    sample_signal = np.empty(len(t), dtype=np.uint8)
+    value = 0
+    for idx, sample_t in enumerate(t.tolist()):
+        if sample_t >= align_signal.next_t:
+            value = align_signal.bit_at(sample_t)
+        sample_signal[idx] = value
+    attrs = align_signal.attrs()
+    expected = align_signal_at(t, attrs['align_seed'], attrs['align_start_t'], attrs['align_flip_duration'])
+    print('samples mismatched: {} of {} ({} stalls of 15-100 ms)'.format(np.sum(expected != sample_signal), len(t), 200))
+
+    num_tick = 1000000
+    start = time.perf_counter()
+    for _ in range(num_tick):
+        random.random() > 0.5
+    ref_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(num_tick):
+        align_signal.next_bit()
+    lfsr_time = time.perf_counter() - start
+    print('random.random: {:.3f} us/tick'.format(ref_time/num_tick*1e6))
+    print('next_bit:      {:.3f} us/tick'.format(lfsr_time/num_tick*1e6))
+    start = time.perf_counter()
+    bits = align_bits(attrs['align_seed'], 240000) # 1 hr. at 15 ms
+    print('align_bits, 1 hr.: {:.1f} ms'.format((time.perf_counter() - start)*1e3))
@@ -0,0 +1,74 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Aligns a synthetic session to a synthetic ephys recording of the same alignment signal, with
+an unknown offset, clock drift that changes over the session and sampling jitter, and checks
+the recovered clock map against the true one. The session is saved as simple_saccade and
+corr_saccade save it, which name the device time column differently.
+Run from the repository root: python benchmark/alignment_bench.py [session duration in hr.]
+"""
+import sys, time, os, tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+import h5py
+
+from align_signal import AlignSignal, align_signal_at
+from alignment import align_session, ClockMap, ALIGN_DOUT_BIT
+
+def true_ephys_t(t, start_t):
+    # 12.3 s offset, 25 ppm drift plus slow wander of +-2 ms
+    rel_t = t - start_t
+    return 12.3 + rel_t*(1 + 25e-6) + 0.002*np.sin(2*np.pi*rel_t/1800)
+
+if __name__ == '__main__':
+    duration = float(sys.argv[1]) * 3600 if len(sys.argv) > 1 else 3600.0
+    behavior_rate = 2000
+    ephys_rate = 30000
+    rng = np.random.default_rng(0)
+    align_signal = AlignSignal(0.015)
+    start_t = 523.1
+    align_signal.start(start_t)
+    attrs = align_signal.attrs()
+
+    # Behavior session in DataManager layout; one trial every ~3 s
+    t = start_t + np.arange(int(duration*behavior_rate))/behavior_rate
+    signal = align_signal_at(t, attrs['align_seed'], attrs['align_start_t'], attrs['align_flip_duration'])
+    dout = (signal.astype(np.float64)*(1 << ALIGN_DOUT_BIT)) + 1 # PD on
+    # simple_saccade saves device time as 'vpixx_time_data', corr_saccade as 'device_time_data'
+    tmp_dir = tempfile.mkdtemp()
+    data_file_paths = {}
+    for exp_name, time_key in (('simple_saccade', 'vpixx_time_data'), ('corr_saccade', 'device_time_data')):
+        data_file_paths[exp_name] = os.path.join(tmp_dir, exp_name)
+        with h5py.File(data_file_paths[exp_name] + '.hdf5','w') as data_file:
+            for counter, idx in enumerate(np.array_split(np.arange(len(t)), max(1,int(duration/3)))):
+                trial_grp = data_file.create_group('trial_' + str(counter+1))
+                trial_grp.create_dataset(time_key, data=t[idx])
+                trial_grp.create_dataset('dout_data', data=dout[idx])
+
+    # Ephys recording starts 5 s before behavior; each edge lands with up to 0.1 ms jitter
+    ephys_len = int((duration + 10)*ephys_rate)
+    edge_idx = np.flatnonzero(np.diff(signal)) + 1
+    edge_ephys_t = true_ephys_t(t[edge_idx], start_t) + rng.uniform(0, 1e-4, size=len(edge_idx))
+    ephys_t0 = true_ephys_t(start_t, start_t) - 5
+    toggle = np.zeros(ephys_len, dtype=np.uint8)
+    toggle[np.round((edge_ephys_t - ephys_t0)*ephys_rate).astype(np.int64)] = 1
+    toggle[int(5*ephys_rate)] ^= signal[0] # initial level
+    ephys_signal = np.cumsum(toggle, dtype=np.uint8) & 1
+    del toggle
+    print('behavior samples: {}, ephys samples: {}, edges: {}'.format(len(t), ephys_len, len(edge_idx)))
+
+    for exp_name, data_file_path in data_file_paths.items():
+        print(exp_name + ':')
+        start = time.perf_counter()
+        clock_map = align_session(data_file_path, ephys_signal, ephys_rate, ephys_t0=ephys_t0)
+        print('align_session: {:.2f} s'.format(time.perf_counter() - start))
+        clock_map = ClockMap.load(data_file_path)
+        test_t = np.linspace(start_t, start_t + duration, 100000)
+        error = clock_map.to_ephys(test_t) - true_ephys_t(test_t, start_t)
+        print('knots: {}, max. error vs true map: {:.3f} ms'.format(len(clock_map.behavior_t), np.max(np.abs(error))*1e3))
+        back_error = clock_map.to_behavior(clock_map.to_ephys(test_t)) - test_t
+        print('max. round-trip error: {:.6f} ms'.format(np.max(np.abs(back_error))*1e3))
+        with h5py.File(data_file_path + '.hdf5','r') as data_file:
+            print('saved: matched {}, residual rms {:.3f} ms'.format(data_file['alignment'].attrs['num_matched'], data_file['alignment'].attrs['residual_rms']*1e3))
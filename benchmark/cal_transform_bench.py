@@ -0,0 +1,52 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Checks that CalTransform is bit-identical to 'raw_to_deg' (same expression as app_lib.raw_to_deg,
+which cannot be imported without pypixxlib) and times both.
+Run from the repository root: python benchmark/cal_transform_bench.py
+"""
+import sys, time
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+
+from cal_transform import CalTransform
+
+def raw_to_deg(raw_data, cal_matrix):
+    deg_data = np.array(raw_data) @ cal_matrix
+    return deg_data[0:2]
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    num_mismatch = 0
+    num_compared = 0
+    for _ in range(100):
+        cal_matrix = rng.normal(size=(3,3))
+        cal_matrix[:,2] = [0,0,1]
+        cal_matrix = cal_matrix.tolist() # stored as nested list in cal_parameter.json
+        raw_xy = rng.normal(scale=rng.choice([1e-3,1,1e3]), size=(2000,2))
+        ref = np.array([raw_to_deg([x,y,1], cal_matrix) for x,y in raw_xy.tolist()])
+        cal = CalTransform(cal_matrix)
+        single = np.array([cal.apply(x,y).copy() for x,y in raw_xy.tolist()])
+        batch = cal.apply_batch(raw_xy)
+        num_mismatch += np.sum(single != ref) + np.sum(batch != ref)
+        num_compared += 2*ref.size
+    print('mismatched values: {} of {}'.format(num_mismatch, num_compared))
+
+    num_samp = 200000
+    raw_xy = rng.normal(size=(num_samp,2)).tolist()
+    start = time.perf_counter()
+    for x,y in raw_xy:
+        raw_to_deg([x,y,1], cal_matrix)
+    ref_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for x,y in raw_xy:
+        cal.apply(x,y)
+    cal_time = time.perf_counter() - start
+    start = time.perf_counter()
+    cal.apply_batch(raw_xy)
+    batch_time = time.perf_counter() - start
+    print('raw_to_deg:  {:.3f} us/sample'.format(ref_time/num_samp*1e6))
+    print('apply:       {:.3f} us/sample'.format(cal_time/num_samp*1e6))
+    print('apply_batch: {:.3f} us/sample'.format(batch_time/num_samp*1e6))
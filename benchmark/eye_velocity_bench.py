@@ -0,0 +1,82 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Micro-benchmark of per-sample eye velocity computation in the FSM loop:
+deque + NumPy (previous implementation) vs. VelocityEstimator.
+Run from the repository root: python benchmark/eye_velocity_bench.py
+"""
+import sys, time, math
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from collections import deque
+import numpy as np
+
+from eye_velocity import VelocityEstimator
+
+def make_samples(num_samp, fs=2000.0, seed=0):
+    '''
+    simulated eye position with jittered sample times, i.e., what the FSM loop sees
+    Returns:
+        t, x, y - lists of floats
+    '''
+    rng = np.random.default_rng(seed)
+    t = 1000.0 + np.cumsum(1/fs + rng.uniform(0, 0.2/fs, num_samp))
+    x = 10*np.sin(2*np.pi*0.5*t) + rng.normal(0, 0.01, num_samp)
+    y = 5*np.cos(2*np.pi*0.3*t) + rng.normal(0, 0.01, num_samp)
+    return t.tolist(), x.tolist(), y.tolist()
+
+def run_deque(t, x, y, vel_samp_num):
+    vel_t_data = deque(maxlen=vel_samp_num)
+    eye_x_data = deque(maxlen=vel_samp_num)
+    eye_y_data = deque(maxlen=vel_samp_num)
+    eye_vel = [0,0]
+    eye_speed = 0.0
+    speed = []
+    for i in range(len(t)):
+        vel_t_data.append(t[i])
+        eye_x_data.append(x[i])
+        eye_y_data.append(y[i])
+        if len(vel_t_data)==vel_samp_num:
+            eye_vel[0] = np.mean(np.diff(eye_x_data)/np.diff(vel_t_data))
+            eye_vel[1] = np.mean(np.diff(eye_y_data)/np.diff(vel_t_data))
+            eye_speed = np.sqrt(eye_vel[0]**2 + eye_vel[1]**2)
+        speed.append(eye_speed)
+    return speed
+
+def run_estimator(t, x, y, vel_samp_num, method):
+    eye_vel_estimator = VelocityEstimator(vel_samp_num, method)
+    eye_vel = [0,0]
+    eye_speed = 0.0
+    speed = []
+    for i in range(len(t)):
+        eye_vel_estimator.update(t[i], x[i], y[i])
+        eye_vel[0] = eye_vel_estimator.vel_x
+        eye_vel[1] = eye_vel_estimator.vel_y
+        eye_speed = eye_vel_estimator.speed
+        speed.append(eye_speed)
+    return speed
+
+def time_it(fnc, *args, repeat=3):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fnc(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+if __name__ == '__main__':
+    num_samp = 200000
+    t, x, y = make_samples(num_samp)
+    print('samples: ' + str(num_samp))
+    for vel_samp_num in (3, 5, 11):
+        deque_time, deque_speed = time_it(run_deque, t, x, y, vel_samp_num)
+        print('window = ' + str(vel_samp_num))
+        print('  {:<14s}{:8.3f} us/sample'.format('deque+numpy', deque_time/num_samp*1e6))
+        for method in VelocityEstimator.methods:
+            est_time, est_speed = time_it(run_estimator, t, x, y, vel_samp_num, method)
+            line = '  {:<14s}{:8.3f} us/sample  ({:5.1f}x)'.format(method, est_time/num_samp*1e6, deque_time/est_time)
+            if method == 'mean_diff':
+                max_err = np.max(np.abs(np.array(est_speed) - np.array(deque_speed)))
+                line += '  max |diff| vs deque+numpy = {:.2e} deg/s'.format(max_err)
+            print(line)
@@ -0,0 +1,339 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Per-iteration cost of the saccade task FSM: chain of 'if state == ...' string comparisons
+(previous implementation) vs. StateMachine dispatch table. Both run the same simplified
+simple saccade task against a simulated tracker; screen, digital out and sound are no-ops
+so only the FSM logic is timed.
+Run from the repository root: python benchmark/fsm_engine_bench.py
+"""
+import sys, time, math, random
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from eye_velocity import VelocityEstimator
+from fsm_engine import StateMachine
+
+fsm_parameter = {'rew_area':3.0, 'min_fix_time':0.1, 'max_wait_for_fixation':1.5, 'pun_time':0.1, 'ITI':0.5,
+                 'sac_detect_threshold':150.0, 'sac_on_off_threshold':75.0, 'pursuit_amp':0.1, 'pursuit_dur':0.1}
+target_pos_list = [(10*math.cos(2*math.pi/8*i), 10*math.sin(2*math.pi/8*i)) for i in range(8)]
+
+class SimulatedTracker():
+    '''
+    eye follows the target with a saccade after a fixed latency; sampled at 2 kHz
+    '''
+    def __init__(self, fs=2000.0, latency=0.15, sac_dur=0.04, seed=0):
+        self.dt = 1/fs
+        self.latency = latency
+        self.sac_dur = sac_dur
+        self.rng = random.Random(seed)
+        self.t = 1000.0
+        self.eye_x = 0.0
+        self.eye_y = 0.0
+        self.goal_x = 0.0
+        self.goal_y = 0.0
+        self.sac_start_t = -math.inf
+        self.sac_from = (0.0, 0.0)
+
+    def sample(self, tgt_x, tgt_y):
+        self.t += self.dt
+        if (abs(tgt_x - self.goal_x) > 1 or abs(tgt_y - self.goal_y) > 1) and self.t > self.sac_start_t + self.sac_dur:
+            self.goal_x = tgt_x
+            self.goal_y = tgt_y
+            self.sac_from = (self.eye_x, self.eye_y)
+            self.sac_start_t = self.t + self.latency
+        s = (self.t - self.sac_start_t)/self.sac_dur
+        if 0 <= s <= 1:
+            s = 0.5 - 0.5*math.cos(math.pi*s)
+            self.eye_x = self.sac_from[0] + s*(self.goal_x - self.sac_from[0])
+            self.eye_y = self.sac_from[1] + s*(self.goal_y - self.sac_from[1])
+        elif s > 1:
+            self.eye_x = self.goal_x
+            self.eye_y = self.goal_y
+        return self.t, self.eye_x + self.rng.gauss(0, 0.01), self.eye_y + self.rng.gauss(0, 0.01)
+
+class Task():
+    '''
+    common state of both implementations; screen/dout/sound are no-ops
+    '''
+    def __init__(self):
+        self.tracker = SimulatedTracker()
+        self.vel = VelocityEstimator(3)
+        self.t = self.tracker.t
+        self.tgt_x = self.tgt_y = self.eye_x = self.eye_y = 0.0
+        self.start_x = self.start_y = self.cue_x = self.cue_y = 0.0
+        self.eye_speed = 0.0
+        self.eye_vel = [0,0]
+        self.trial_num = 1
+        self.num_trial_success = 0
+        self.trial_data = {key: [] for key in ('state_start_t_str_tgt_pursuit','state_start_t_str_tgt_present','state_start_t_str_tgt_fixation',
+                                               'state_start_t_cue_tgt_present','state_start_t_detect_sac_start','state_start_t_saccade',
+                                               'state_start_t_detect_sac_end','state_start_t_deliver_rew','state_start_t_end_tgt_fixation',
+                                               'state_start_t_trial_success','state_start_t_incorrect_saccade')}
+
+    def flip(self): pass
+    def set_dout(self, pd_led): pass
+    def play_sound(self, freq, duration): pass
+
+    def sample(self):
+        self.t, self.eye_x, self.eye_y = self.tracker.sample(self.tgt_x, self.tgt_y)
+        self.vel.update(self.t, self.eye_x, self.eye_y)
+        self.eye_vel[0] = self.vel.vel_x
+        self.eye_vel[1] = self.vel.vel_y
+        self.eye_speed = self.vel.speed
+
+    def pick_target(self):
+        self.cue_x, self.cue_y = target_pos_list[random.randrange(len(target_pos_list))]
+        angle = random.random()*2*math.pi
+        self.pursuit_start_x = math.cos(angle)*fsm_parameter['pursuit_amp']
+        self.pursuit_start_y = math.sin(angle)*fsm_parameter['pursuit_amp']
+        self.pursuit_v_x = -self.pursuit_start_x/fsm_parameter['pursuit_dur']
+        self.pursuit_v_y = -self.pursuit_start_y/fsm_parameter['pursuit_dur']
+
+    def dir_ok(self):
+        dot = (self.cue_x-self.start_x)*self.eye_vel[0] + (self.cue_y-self.start_y)*self.eye_vel[1]
+        return dot > 0
+
+def run_if_chain(num_samp):
+    task = Task()
+    state = 'INIT'
+    state_start_time = state_inter_time = task.t
+    for _ in range(num_samp):
+        task.sample()
+        t = task.t
+        if state == 'INIT':
+            task.pick_target()
+            state_start_time = state_inter_time = t
+            task.trial_data['state_start_t_str_tgt_pursuit'].append(t)
+            task.set_dout(0); task.flip()
+            state = 'STR_TARGET_PURSUIT'
+        if state == 'STR_TARGET_PURSUIT':
+            task.tgt_x = task.pursuit_v_x*(t-state_start_time) + task.pursuit_start_x
+            task.tgt_y = task.pursuit_v_y*(t-state_start_time) + task.pursuit_start_y
+            task.flip()
+            if (t-state_start_time) > fsm_parameter['pursuit_dur']:
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_str_tgt_present'].append(t)
+                task.set_dout(1); task.flip()
+                state = 'STR_TARGET_PRESENT'
+        if state == 'STR_TARGET_PRESENT':
+            task.tgt_x = task.start_x
+            task.tgt_y = task.start_y
+            task.flip()
+            state_start_time = state_inter_time = t
+            task.trial_data['state_start_t_str_tgt_fixation'].append(t)
+            state = 'STR_TARGET_FIXATION'
+        if state == 'STR_TARGET_FIXATION':
+            if math.sqrt((task.tgt_x-task.eye_x)**2 + (task.tgt_y-task.eye_y)**2) > fsm_parameter['rew_area']/2:
+                state_inter_time = t
+            if (t-state_inter_time) >= fsm_parameter['min_fix_time']:
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_cue_tgt_present'].append(t)
+                task.tgt_x = task.cue_x
+                task.tgt_y = task.cue_y
+                task.set_dout(0); task.flip(); task.play_sound(1000,0.1)
+                state = 'CUE_TARGET_PRESENT'
+            elif (t-state_start_time) >= fsm_parameter['max_wait_for_fixation']:
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_str_tgt_pursuit'].append(t)
+                task.set_dout(0); task.flip()
+                state = 'STR_TARGET_PURSUIT'
+        if state == 'CUE_TARGET_PRESENT':
+            state_start_time = state_inter_time = t
+            task.trial_data['state_start_t_detect_sac_start'].append(t)
+            state = 'DETECT_SACCADE_START'
+        if state == 'DETECT_SACCADE_START':
+            if task.eye_speed >= fsm_parameter['sac_detect_threshold']:
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_saccade'].append(t)
+                state = 'SACCADE'
+            elif math.sqrt((task.start_x-task.eye_x)**2 + (task.start_y-task.eye_y)**2) > fsm_parameter['rew_area']/2:
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_incorrect_saccade'].append(t)
+                task.set_dout(1); task.flip()
+                state = 'INCORRECT_SACCADE'
+            elif (t - state_start_time) >= fsm_parameter['max_wait_for_fixation']:
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_str_tgt_pursuit'].append(t)
+                task.set_dout(0); task.flip()
+                state = 'STR_TARGET_PURSUIT'
+        if state == 'SACCADE':
+            if not task.dir_ok():
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_incorrect_saccade'].append(t)
+                task.set_dout(1); task.flip()
+                state = 'INCORRECT_SACCADE'
+            else:
+                task.flip()
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_detect_sac_end'].append(t)
+                state = 'DETECT_SACCADE_END'
+        if state == 'DETECT_SACCADE_END':
+            if task.eye_speed < fsm_parameter['sac_on_off_threshold'] and (t-state_start_time) > 0.005:
+                if math.sqrt((task.tgt_x-task.eye_x)**2 + (task.tgt_y-task.eye_y)**2) < fsm_parameter['rew_area']/2:
+                    state_start_time = state_inter_time = t
+                    task.trial_data['state_start_t_deliver_rew'].append(t)
+                    state = 'DELIVER_REWARD'
+                else:
+                    state_start_time = state_inter_time = t
+                    task.trial_data['state_start_t_incorrect_saccade'].append(t)
+                    task.set_dout(1); task.flip()
+                    state = 'INCORRECT_SACCADE'
+            elif (t - state_start_time) >= fsm_parameter['max_wait_for_fixation']:
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_str_tgt_pursuit'].append(t)
+                task.set_dout(0); task.flip()
+                state = 'STR_TARGET_PURSUIT'
+        if state == 'DELIVER_REWARD':
+            task.play_sound(2000,0.1)
+            state_start_time = state_inter_time = t
+            task.trial_data['state_start_t_end_tgt_fixation'].append(t)
+            task.set_dout(1); task.flip()
+            state = 'END_TARGET_FIXATION'
+        if state == 'END_TARGET_FIXATION':
+            if (t - state_inter_time) >= fsm_parameter['min_fix_time']:
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_trial_success'].append(t)
+                task.flip()
+                state = 'TRIAL_SUCCESS'
+            elif (t-state_start_time) >= fsm_parameter['max_wait_for_fixation']:
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_str_tgt_pursuit'].append(t)
+                task.set_dout(0); task.flip()
+                state = 'STR_TARGET_PURSUIT'
+        if state == 'INCORRECT_SACCADE':
+            if (t - state_start_time) > fsm_parameter['pun_time']:
+                state_start_time = state_inter_time = t
+                task.trial_data['state_start_t_str_tgt_pursuit'].append(t)
+                task.set_dout(0); task.flip()
+                state = 'STR_TARGET_PURSUIT'
+        if state == 'TRIAL_SUCCESS':
+            if (t-state_start_time) > fsm_parameter['ITI']:
+                task.num_trial_success += 1
+                task.trial_num += 1
+                state = 'INIT'
+    return task
+
+(INIT, STR_TARGET_PURSUIT, STR_TARGET_PRESENT, STR_TARGET_FIXATION, CUE_TARGET_PRESENT, DETECT_SACCADE_START,
+ SACCADE, DETECT_SACCADE_END, DELIVER_REWARD, END_TARGET_FIXATION, INCORRECT_SACCADE, TRIAL_SUCCESS) = range(12)
+
+class EngineTask(Task):
+    def __init__(self):
+        super().__init__()
+        fsm = StateMachine(['INIT','STR_TARGET_PURSUIT','STR_TARGET_PRESENT','STR_TARGET_FIXATION','CUE_TARGET_PRESENT','DETECT_SACCADE_START',
+                            'SACCADE','DETECT_SACCADE_END','DELIVER_REWARD','END_TARGET_FIXATION','INCORRECT_SACCADE','TRIAL_SUCCESS'])
+        fsm.add_state(INIT, self.init_state)
+        fsm.add_state(STR_TARGET_PURSUIT, self.str_tgt_pursuit_state, on_enter=self.enter_pd_off, t_key='state_start_t_str_tgt_pursuit')
+        fsm.add_state(STR_TARGET_PRESENT, self.str_tgt_present_state, on_enter=self.enter_pd_on, t_key='state_start_t_str_tgt_present')
+        fsm.add_state(STR_TARGET_FIXATION, self.str_tgt_fixation_state, on_enter=self.flip, t_key='state_start_t_str_tgt_fixation')
+        fsm.add_state(CUE_TARGET_PRESENT, None, on_enter=self.enter_cue_tgt_present, t_key='state_start_t_cue_tgt_present')
+        fsm.add_state(DETECT_SACCADE_START, self.detect_sac_start_state, t_key='state_start_t_detect_sac_start')
+        fsm.add_state(SACCADE, None, on_enter=self.enter_saccade, t_key='state_start_t_saccade')
+        fsm.add_state(DETECT_SACCADE_END, self.detect_sac_end_state, on_enter=self.flip, t_key='state_start_t_detect_sac_end')
+        fsm.add_state(DELIVER_REWARD, None, on_enter=self.enter_deliver_rew, t_key='state_start_t_deliver_rew')
+        fsm.add_state(END_TARGET_FIXATION, self.end_tgt_fixation_state, on_enter=self.enter_pd_on, t_key='state_start_t_end_tgt_fixation')
+        fsm.add_state(INCORRECT_SACCADE, self.incorrect_sac_state, on_enter=self.enter_pd_on, t_key='state_start_t_incorrect_saccade')
+        fsm.add_state(TRIAL_SUCCESS, self.trial_success_state, on_enter=self.flip, t_key='state_start_t_trial_success')
+        fsm.state_t_data = self.trial_data
+        self.fsm = fsm
+
+    def enter_pd_off(self):
+        self.set_dout(0); self.flip()
+    def enter_pd_on(self):
+        self.set_dout(1); self.flip()
+    def init_state(self):
+        self.pick_target()
+        self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    def str_tgt_pursuit_state(self):
+        self.tgt_x = self.pursuit_v_x*(self.t-self.fsm.state_start_time) + self.pursuit_start_x
+        self.tgt_y = self.pursuit_v_y*(self.t-self.fsm.state_start_time) + self.pursuit_start_y
+        self.flip()
+        if (self.t-self.fsm.state_start_time) > fsm_parameter['pursuit_dur']:
+            self.fsm.transition(STR_TARGET_PRESENT, self.t)
+    def str_tgt_present_state(self):
+        self.tgt_x = self.start_x
+        self.tgt_y = self.start_y
+        self.fsm.transition(STR_TARGET_FIXATION, self.t)
+    def str_tgt_fixation_state(self):
+        if math.sqrt((self.tgt_x-self.eye_x)**2 + (self.tgt_y-self.eye_y)**2) > fsm_parameter['rew_area']/2:
+            self.fsm.state_inter_time = self.t
+        if (self.t-self.fsm.state_inter_time) >= fsm_parameter['min_fix_time']:
+            self.fsm.transition(CUE_TARGET_PRESENT, self.t)
+        elif (self.t-self.fsm.state_start_time) >= fsm_parameter['max_wait_for_fixation']:
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    def enter_cue_tgt_present(self):
+        self.tgt_x = self.cue_x
+        self.tgt_y = self.cue_y
+        self.set_dout(0); self.flip(); self.play_sound(1000,0.1)
+        self.fsm.transition(DETECT_SACCADE_START, self.t)
+    def detect_sac_start_state(self):
+        if self.eye_speed >= fsm_parameter['sac_detect_threshold']:
+            self.fsm.transition(SACCADE, self.t)
+        elif math.sqrt((self.start_x-self.eye_x)**2 + (self.start_y-self.eye_y)**2) > fsm_parameter['rew_area']/2:
+            self.fsm.transition(INCORRECT_SACCADE, self.t)
+        elif (self.t - self.fsm.state_start_time) >= fsm_parameter['max_wait_for_fixation']:
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    def enter_saccade(self):
+        if not self.dir_ok():
+            self.fsm.transition(INCORRECT_SACCADE, self.t)
+        else:
+            self.fsm.transition(DETECT_SACCADE_END, self.t)
+    def detect_sac_end_state(self):
+        if self.eye_speed < fsm_parameter['sac_on_off_threshold'] and (self.t-self.fsm.state_start_time) > 0.005:
+            if math.sqrt((self.tgt_x-self.eye_x)**2 + (self.tgt_y-self.eye_y)**2) < fsm_parameter['rew_area']/2:
+                self.fsm.transition(DELIVER_REWARD, self.t)
+            else:
+                self.fsm.transition(INCORRECT_SACCADE, self.t)
+        elif (self.t - self.fsm.state_start_time) >= fsm_parameter['max_wait_for_fixation']:
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    def enter_deliver_rew(self):
+        self.play_sound(2000,0.1)
+        self.fsm.transition(END_TARGET_FIXATION, self.t)
+    def end_tgt_fixation_state(self):
+        if (self.t - self.fsm.state_inter_time) >= fsm_parameter['min_fix_time']:
+            self.fsm.transition(TRIAL_SUCCESS, self.t)
+        elif (self.t-self.fsm.state_start_time) >= fsm_parameter['max_wait_for_fixation']:
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    def incorrect_sac_state(self):
+        if (self.t - self.fsm.state_start_time) > fsm_parameter['pun_time']:
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    def trial_success_state(self):
+        if (self.t-self.fsm.state_start_time) > fsm_parameter['ITI']:
+            self.num_trial_success += 1
+            self.trial_num += 1
+            self.fsm.transition(INIT, self.t)
+
+def run_engine(num_samp):
+    task = EngineTask()
+    task.fsm.start(INIT, task.t)
+    for _ in range(num_samp):
+        task.sample()
+        task.fsm.step()
+    return task
+
+def run_sample_only(num_samp):
+    task = Task()
+    for _ in range(num_samp):
+        task.sample()
+    return task
+
+def time_it(fnc, num_samp, repeat=3):
+    best = math.inf
+    for _ in range(repeat):
+        random.seed(1)
+        start = time.perf_counter()
+        task = fnc(num_samp)
+        best = min(best, time.perf_counter() - start)
+    return best, task
+
+if __name__ == '__main__':
+    num_samp = 2000*60*5 # 5 min. at 2 kHz
+    base_time, _ = time_it(run_sample_only, num_samp)
+    if_time, if_task = time_it(run_if_chain, num_samp)
+    engine_time, engine_task = time_it(run_engine, num_samp)
+    print('samples: {}'.format(num_samp))
+    print('{:<26s}{:8.3f} us/iteration'.format('tracker + velocity only', base_time/num_samp*1e6))
+    for name, fsm_time, task in (('if-chain', if_time, if_task), ('StateMachine', engine_time, engine_task)):
+        print('{:<26s}{:8.3f} us/iteration  (FSM part {:6.3f} us; {} successful trials)'.format(
+              name, fsm_time/num_samp*1e6, (fsm_time-base_time)/num_samp*1e6, task.num_trial_success))
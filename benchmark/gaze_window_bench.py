@@ -0,0 +1,73 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Checks gaze windows against the checks previously written in the saccade FSMs (np.sqrt
+distance vs. 'rew_area'/2; np.arccos of unit vectors for saccade direction) and times both.
+Run from the repository root: python benchmark/gaze_window_bench.py
+"""
+import sys, time
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+
+from gaze_window import CircleWindow, EllipseWindow, RectWindow, PolygonWindow, DirectionWindow
+
+def old_dist_check(tgt_x, tgt_y, eye_x, eye_y, rew_area):
+    eye_dist_from_tgt = np.sqrt((tgt_x-eye_x)**2 + (tgt_y-eye_y)**2)
+    return eye_dist_from_tgt > rew_area/2
+
+def old_dir_check(cue_x, cue_y, start_x, start_y, eye_vel):
+    target_dir_vector = [cue_x-start_x,cue_y-start_y]
+    unit_target_dir_vector = target_dir_vector/np.linalg.norm(target_dir_vector)
+    saccade_dir_vector = eye_vel
+    unit_saccade_dir_vector = saccade_dir_vector/np.linalg.norm(saccade_dir_vector)
+    angle_diff = np.arccos(np.dot(unit_target_dir_vector, unit_saccade_dir_vector))
+    return angle_diff >= np.pi/2
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    num_samp = 100000
+    rew_area = 3.0
+    tgt = rng.uniform(-10, 10, size=2).tolist()
+    eye = rng.uniform(-15, 15, size=(num_samp,2)).tolist()
+    vel = rng.normal(scale=300, size=(num_samp,2)).tolist()
+    window = CircleWindow(rew_area/2)
+    window.arm(*tgt)
+    dir_window = DirectionWindow(90)
+    dir_window.arm(tgt[0], tgt[1])
+
+    mismatch = sum(old_dist_check(tgt[0], tgt[1], x, y, rew_area) == window.contains(x, y) for x, y in eye)
+    print('circle mismatches: {} of {}'.format(mismatch, num_samp))
+    mismatch = sum(old_dir_check(tgt[0], tgt[1], 0, 0, v) == dir_window.contains(*v) for v in vel)
+    print('direction mismatches: {} of {}'.format(mismatch, num_samp))
+    eye_array = np.array(eye)
+    vel_array = np.array(vel)
+    print('batch == scalar: circle {}, direction {}'.format(
+        np.array_equal(window.contains_batch(eye_array[:,0], eye_array[:,1]), [window.contains(x, y) for x, y in eye]),
+        np.array_equal(dir_window.contains_batch(vel_array[:,0], vel_array[:,1]), [dir_window.contains(*v) for v in vel])))
+    # Same window as circle, ellipse, square and 64-gon; only differ near the edge
+    angle = np.linspace(0, 2*np.pi, 64, endpoint=False)
+    windows = {'ellipse': EllipseWindow(rew_area/2, rew_area/2, 30),
+               'rect': RectWindow(rew_area/2, rew_area/2),
+               'polygon': PolygonWindow(np.stack((np.cos(angle), np.sin(angle)), axis=1)*rew_area/2)}
+    for name, other in windows.items():
+        other.arm(*tgt)
+        agree = np.mean(other.contains_batch(eye_array[:,0], eye_array[:,1]) == window.contains_batch(eye_array[:,0], eye_array[:,1]))
+        same = np.array_equal(other.contains_batch(eye_array[:,0], eye_array[:,1]), [other.contains(x, y) for x, y in eye])
+        print('{}: batch == scalar {}, agrees with circle {:.4f}'.format(name, same, agree))
+
+    for name, old, new in (('circle', lambda x, y, _: old_dist_check(tgt[0], tgt[1], x, y, rew_area), lambda x, y, _: window.contains(x, y)),
+                           ('direction', lambda _x, _y, v: old_dir_check(tgt[0], tgt[1], 0, 0, v), lambda _x, _y, v: dir_window.contains(v[0], v[1]))):
+        start = time.perf_counter()
+        for (x, y), v in zip(eye, vel):
+            old(x, y, v)
+        old_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for (x, y), v in zip(eye, vel):
+            new(x, y, v)
+        new_time = time.perf_counter() - start
+        print('{}: numpy {:.3f} us/sample, window {:.3f} us/sample'.format(name, old_time/num_samp*1e6, new_time/num_samp*1e6))
+    start = time.perf_counter()
+    window.contains_batch(eye_array[:,0], eye_array[:,1])
+    print('circle batch: {:.4f} us/sample'.format((time.perf_counter() - start)/num_samp*1e6))
@@ -0,0 +1,121 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Writes a simulated session with TrialWriter and converts it to .mat with mat_export (v7.3,
+streamed) and with the loop previously in DataManager.convert_data (copied below). Checks
+that both have the same data, that the v5 fallback matches, and that MatExportProcess
+reports progress, and prints time and peak memory (tracemalloc) of both.
+Run from the repository root: python benchmark/mat_export_bench.py [num. of trials]
+"""
+import sys, time, os, tempfile, tracemalloc, multiprocessing
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+import h5py
+from scipy.io import savemat, loadmat
+
+from trial_writer import TrialWriter
+from mat_export import convert_to_mat, write_mat5, MatExportProcess
+
+def old_convert_data(data_file_path):
+    data_file = h5py.File(data_file_path +'.hdf5','a',libver='latest')
+    # Init. data var. to save
+    data_dict = {}
+    # Read attributes (exp. parameters)
+    for key,value in data_file.attrs.items():
+        data_dict[key] = value
+    # Read data
+    for trial_key,_ in data_file.items():
+        data_dict[trial_key] = {}
+        for data_key, data_value in data_file[trial_key].items():
+            data_dict[trial_key][data_key] = data_value[:]
+    data_file.close()
+    savemat(data_file_path + '.mat',{'data':data_dict})
+
+def make_session(data_file_path, num_trial, rng):
+    writer = TrialWriter(data_file_path + '.hdf5')
+    writer.set_attrs({'exp_name': 'corr_saccade', 'rew_area': 3.0, 'num_prim_sac_dir': 8, 'loop_timing': False,
+                      'right_eye_tracked': 1, 'tgt_weights': [1.0, 2.0, 1.0], 'computer': 'plot'})
+    for trial_num in range(1, num_trial+1):
+        num_samp = int(rng.uniform(1.5, 3.0)*2000)
+        trial_data = {key: rng.normal(size=num_samp) for key in ['vpixx_time_data','eye_lx_raw_data','eye_ly_raw_data','eye_rx_raw_data',
+                                                                  'eye_ry_raw_data','din_data','dout_data','tgt_x_data','tgt_y_data','eye_x_data','eye_y_data']}
+        trial_data['right_cal_matrix'] = rng.normal(size=(3,2))
+        trial_data['tgt_idx'] = [int(rng.integers(8))]
+        trial_data['state_start_t_saccade'] = [] if trial_num % 3 else [float(trial_num)]
+        writer.write_trial(trial_num, trial_data)
+    writer.close()
+
+def matlab_value(mat_value):
+    # v7.3 data as it would appear in MATLAB, in numpy order
+    if mat_value.attrs.get('MATLAB_empty', 0):
+        return np.zeros(tuple(int(dim) for dim in mat_value[()]))
+    value = mat_value[()].T
+    if mat_value.attrs['MATLAB_class'] == b'char':
+        return value.tobytes().decode('utf-16-le')
+    return value
+
+def time_and_memory(func, *args):
+    # Timed without tracemalloc, which slows down Python code
+    start = time.perf_counter()
+    func(*args)
+    run_time = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return run_time, peak
+
+if __name__ == '__main__':
+    num_trial = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_file_path = os.path.join(tmp_dir, 'session')
+        make_session(data_file_path, num_trial, rng)
+        print('session: {} trials, {:.0f} MB'.format(num_trial, os.path.getsize(data_file_path + '.hdf5')/1e6))
+        old_time, old_peak = time_and_memory(old_convert_data, data_file_path)
+        new_time, new_peak = time_and_memory(convert_to_mat, data_file_path + '.hdf5', os.path.join(tmp_dir, 'new.mat'))
+        print('old (savemat):     {:5.1f} s, peak {:6.1f} MB'.format(old_time, old_peak/1e6))
+        print('new (v7.3 stream): {:5.1f} s, peak {:6.1f} MB'.format(new_time, new_peak/1e6))
+
+        old_mat = loadmat(data_file_path + '.mat', squeeze_me=False)['data'][0,0]
+        mismatch = 0
+        with h5py.File(os.path.join(tmp_dir, 'new.mat'), 'r') as new_mat:
+            data_grp = new_mat['data']
+            for key in old_mat.dtype.names:
+                old_value = old_mat[key]
+                if key.startswith('trial_'):
+                    for data_key in old_value.dtype.names:
+                        old_data = old_value[0,0][data_key]
+                        new_data = matlab_value(data_grp[key][data_key])
+                        mismatch += old_data.shape != new_data.shape or not np.array_equal(old_data, new_data)
+                else:
+                    new_value = matlab_value(data_grp[key])
+                    if isinstance(new_value, str):
+                        mismatch += old_value[0] != new_value
+                    else:
+                        mismatch += old_value.shape != new_value.shape or not np.array_equal(old_value, new_value)
+        with open(os.path.join(tmp_dir, 'new.mat'), 'rb') as mat_file:
+            header = mat_file.read(128)
+        print('v7.3 vs. old: {} mismatched of {} fields; header {}'.format(mismatch, len(old_mat.dtype.names), header[:20]))
+
+        with h5py.File(data_file_path + '.hdf5', 'r') as data_file:
+            write_mat5(data_file, os.path.join(tmp_dir, 'v5.mat'))
+        v5_mat = loadmat(os.path.join(tmp_dir, 'v5.mat'))['data'][0,0]
+        same = all(np.array_equal(v5_mat[key][0,0][data_key], old_mat[key][0,0][data_key])
+                   for key in old_mat.dtype.names if key.startswith('trial_') for data_key in old_mat[key].dtype.names)
+        print('v5 fallback vs. old: same {}'.format(same))
+
+        progress_rcvr, progress_sndr = multiprocessing.Pipe(duplex=False)
+        process = MatExportProcess(data_file_path + '.hdf5', os.path.join(tmp_dir, 'process.mat'), progress_sndr)
+        process.start()
+        progress_sndr.close()
+        msg_list = []
+        while True:
+            try:
+                msg_list.append(progress_rcvr.recv())
+            except EOFError:
+                break
+        process.join()
+        print('process: {} progress messages, last {}'.format(len(msg_list)-1, msg_list[-1][0]))
@@ -0,0 +1,60 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Checks that a parameter file saved by another process is picked up, that concurrent
+read-modify-writes don't lose each other's changes, and times a cached read against
+opening and parsing the file as 'load_parameter' used to.
+Run from the repository root: python benchmark/parameter_store_bench.py
+"""
+import sys, time, json, os, tempfile, multiprocessing
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from parameter_store import read_parameter_file, set_parameter, parameter_file_changed
+
+def set_many(file_path, monkey_name, num_set):
+    for counter in range(num_set):
+        set_parameter(file_path, {'trial': counter}, monkey_name, 'exp')
+
+if __name__ == '__main__':
+    folder = tempfile.mkdtemp()
+    file_path = os.path.join(folder, 'exp_parameter.json')
+    all_parameter = {'monkey_' + str(counter): {'exp_' + str(exp): {'rew_area': 2.0, 'tgt_list': list(range(50))} for exp in range(5)} for counter in range(10)}
+    set_parameter(file_path, all_parameter)
+
+    # Change from another process
+    process = multiprocessing.Process(target=set_parameter, args=(file_path, {'rew_area': 4.0}, 'monkey_0', 'exp_0'))
+    process.start()
+    process.join()
+    print('change seen: {}'.format(parameter_file_changed(file_path) and read_parameter_file(file_path)['monkey_0']['exp_0'] == {'rew_area': 4.0}))
+
+    # Concurrent writers, each to its own key
+    num_process = 4
+    num_set = 50
+    processes = [multiprocessing.Process(target=set_many, args=(file_path, 'writer_' + str(counter), num_set)) for counter in range(num_process)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    all_parameter = read_parameter_file(file_path)
+    num_kept = sum(all_parameter.get('writer_' + str(counter)) == {'exp': {'trial': num_set-1}} for counter in range(num_process))
+    print('writers kept: {} of {}'.format(num_kept, num_process))
+
+    num_read = 2000
+    start = time.perf_counter()
+    for _ in range(num_read):
+        with open(file_path,'r') as file:
+            json.load(file)
+    ref_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(num_read):
+        read_parameter_file(file_path)
+    cached_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(num_read):
+        parameter_file_changed(file_path)
+    check_time = time.perf_counter() - start
+    print('open+json.load:         {:.1f} us/read'.format(ref_time/num_read*1e6))
+    print('read_parameter_file:    {:.1f} us/read'.format(cached_time/num_read*1e6))
+    print('parameter_file_changed: {:.1f} us/check'.format(check_time/num_read*1e6))
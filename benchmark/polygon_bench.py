@@ -0,0 +1,65 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Checks that polygon.inpolygon gives the same mask as the matplotlib version previously in
+app_lib (copied below, since app_lib cannot be imported without pypixxlib), including points
+on vertices and edges, and times both for 10k to 1M points.
+Run from the repository root: python benchmark/polygon_bench.py
+"""
+import sys, time
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+from matplotlib import path
+
+from polygon import inpolygon
+
+def old_inpolygon(xq, yq, xv, yv):
+    shape = xq.shape
+    xq = xq.reshape(-1)
+    yq = yq.reshape(-1)
+    xv = xv.reshape(-1)
+    yv = yv.reshape(-1)
+    q = [(xq[i], yq[i]) for i in range(xq.shape[0])]
+    p = path.Path([(xv[i], yv[i]) for i in range(xv.shape[0])])
+    contained_p = p.contains_points(q).reshape(shape)
+    return contained_p
+
+def random_roi(rng, num_vertex):
+    # Star-shaped, possibly concave, closed like ROIs drawn in calibration
+    angle = np.sort(rng.uniform(0, 2*np.pi, num_vertex))
+    radius = rng.uniform(2, 10, num_vertex)
+    xv = np.append(radius*np.cos(angle), radius[0]*np.cos(angle[0])) + rng.uniform(-5, 5)
+    yv = np.append(radius*np.sin(angle), radius[0]*np.sin(angle[0])) + rng.uniform(-5, 5)
+    return xv, yv
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    mismatch = 0
+    num_test = 0
+    for _ in range(200):
+        xv, yv = random_roi(rng, int(rng.integers(3, 40)))
+        # Random points, on a coarse grid (hits vertices/edges), and on vertices and edge midpoints
+        xq = np.concatenate((rng.uniform(-20, 20, 2000), np.repeat(np.arange(-20, 21, 0.5), 81), xv, (xv[:-1]+xv[1:])/2))
+        yq = np.concatenate((rng.uniform(-20, 20, 2000), np.tile(np.arange(-20, 21, 0.5), 81), yv, (yv[:-1]+yv[1:])/2))
+        mismatch += np.count_nonzero(old_inpolygon(xq, yq, xv, yv) != inpolygon(xq, yq, xv, yv))
+        mismatch += np.count_nonzero(old_inpolygon(xq, yq, xv, yv) != inpolygon(xq, yq, xv, yv, chunk_size=97))
+        num_test += 2*xq.shape[0]
+    print('mismatches: {} of {}'.format(mismatch, num_test))
+    xq = rng.uniform(-20, 20, (50, 40))
+    yq = rng.uniform(-20, 20, (50, 40))
+    print('2-D query keeps shape: {}'.format(np.array_equal(old_inpolygon(xq, yq, xv, yv), inpolygon(xq, yq, xv, yv))))
+
+    xv, yv = random_roi(rng, 12)
+    for num_point in (10000, 100000, 1000000):
+        # Calibration data: mostly around the ROI, some far from it
+        xq = rng.normal(scale=8, size=num_point)
+        yq = rng.normal(scale=8, size=num_point)
+        start = time.perf_counter()
+        old_mask = old_inpolygon(xq, yq, xv, yv)
+        old_time = time.perf_counter() - start
+        start = time.perf_counter()
+        new_mask = inpolygon(xq, yq, xv, yv)
+        new_time = time.perf_counter() - start
+        print('{:>7} points: matplotlib {:8.1f} ms, numpy {:6.1f} ms, same {}'.format(num_point, old_time*1e3, new_time*1e3, np.array_equal(old_mask, new_mask)))
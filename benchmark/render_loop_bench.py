@@ -0,0 +1,124 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+FSM loop timing with rendering on: flipping in the FSM loop (previous implementation) vs.
+RenderLoop in the main thread and the FSM in a worker thread, as in the saccade tasks. The
+window is simulated: flip blocks until the next 60 Hz vsync, as with 'waitBlanking=True',
+and drawing costs some Python work. The tracker read releases the GIL for 0.3 ms, like the
+ctypes device call. The scene changes every sample, as during start target pursuit. Loop
+timing is reset every 'trial' (1 s), the flip timer through the render thread's call queue.
+Prints p50/p99/max and misses (> 1 ms) of the loop and the flip timers, and of the loop
+without rendering as a baseline.
+Run from the repository root: python benchmark/render_loop_bench.py [duration in s]
+"""
+import sys, time, math, threading
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from loop_timer import LoopTiming
+from render_loop import Scene, RenderLoop
+
+FRAME_INTERVAL = 1/60
+READ_TIME = 0.0003 # s, simulated tracker read
+LOOP_DEADLINE = 0.001 # same as the saccade tasks
+TRIAL_DUR = 1.0
+
+class SimulatedWindow():
+    def __init__(self):
+        self.start_t = time.perf_counter()
+
+    def flip(self):
+        # Blocks until next vsync; GIL is released meanwhile, as in the driver call
+        frame_t = time.perf_counter() - self.start_t
+        time.sleep((math.floor(frame_t/FRAME_INTERVAL) + 1)*FRAME_INTERVAL - frame_t)
+
+def draw(tgt_pos, pd):
+    # Roughly the Python work of setting a stimulus position and drawing two stimuli
+    x = 0.0
+    for i in range(300):
+        x += i*0.5
+    return x
+
+def fsm_step(scene, t):
+    # Pursuit target moves every sample
+    tgt_pos = (math.cos(t), math.sin(t))
+    if scene is None:
+        return tgt_pos
+    scene.show(tgt_pos, pd=True)
+
+def run_no_rendering(duration):
+    # Baseline: timing of the loop itself, incl. the OS waking the thread after the read
+    return run_flip_in_loop(duration, render=False)
+
+def run_flip_in_loop(duration, render=True):
+    window = SimulatedWindow()
+    loop_timing = LoopTiming(True)
+    loop_tick = loop_timing.ticker('loop', LOOP_DEADLINE)
+    flip = loop_timing.wrap('flip', window.flip)
+    end_t = time.perf_counter() + duration
+    trial_end_t = time.perf_counter() + TRIAL_DUR
+    summaries = []
+    while time.perf_counter() < end_t:
+        loop_tick()
+        time.sleep(READ_TIME)
+        tgt_pos = fsm_step(None, time.perf_counter())
+        if render:
+            draw(tgt_pos, True)
+            flip()
+        if time.perf_counter() > trial_end_t:
+            summaries.append(loop_timing.summaries())
+            loop_timing.reset()
+            trial_end_t += TRIAL_DUR
+    return summaries
+
+def run_render_loop(duration):
+    scene = Scene()
+    render_loop = RenderLoop(SimulatedWindow(), scene, draw)
+    summaries = []
+    def run_fsm():
+        loop_timing = LoopTiming(True)
+        loop_tick = loop_timing.ticker('loop', LOOP_DEADLINE)
+        flip_timer = render_loop.flip_timer
+        loop_timing.attach(flip_timer, lambda: scene.call(flip_timer.reset))
+        flip_queue = scene.flip_queue
+        end_t = time.perf_counter() + duration
+        trial_end_t = time.perf_counter() + TRIAL_DUR
+        while time.perf_counter() < end_t:
+            loop_tick()
+            time.sleep(READ_TIME)
+            while not flip_queue.empty():
+                flip_queue.get()
+            fsm_step(scene, time.perf_counter())
+            if time.perf_counter() > trial_end_t:
+                summaries.append(loop_timing.summaries())
+                loop_timing.reset()
+                trial_end_t += TRIAL_DUR
+    fsm_thread = threading.Thread(target=run_fsm)
+    fsm_thread.start()
+    try:
+        render_loop.run(fsm_thread.is_alive)
+    finally:
+        fsm_thread.join()
+    return summaries
+
+def print_summaries(name, summaries):
+    # Worst trial of each timer, as [count, p50, p99, max, misses]
+    for timer_name in summaries[0]:
+        trial_summaries = [summary[timer_name] for summary in summaries if summary[timer_name][0]]
+        if not trial_summaries:
+            continue
+        count = sum(summary[0] for summary in trial_summaries)
+        p50 = max(summary[1] for summary in trial_summaries)
+        p99 = max(summary[2] for summary in trial_summaries)
+        max_time = max(summary[3] for summary in trial_summaries)
+        misses = sum(summary[4] for summary in trial_summaries)
+        print('{:16s} {:6s}: {:7d} iterations, worst trial p50 {:6.2f}, p99 {:6.2f}, max {:6.2f} ms, misses {} ({:.1f} %)'.format(
+              name, timer_name[7:], count, p50*1e3, p99*1e3, max_time*1e3, misses, misses/count*100))
+
+if __name__ == '__main__':
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    sys.setswitchinterval(0.0005) # as in the saccade tasks
+    print_summaries('no rendering', run_no_rendering(duration))
+    print_summaries('flip in FSM loop', run_flip_in_loop(duration))
+    print_summaries('render loop', run_render_loop(duration))
@@ -0,0 +1,130 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Makes a 10 min session of synthetic 2000 Hz raw eye data with main-sequence saccades
+(minimum-jerk profile, duration 2.2 ms/deg + 21 ms, 3-20 deg), fixation noise and drift,
+blinks, gaps between some trials and a new calibration every 20 trials, saved in both
+layouts. Detects the saccades with saccade_detection, prints the time per session and
+compares every detected saccade to the one it was made from.
+Run from the repository root: python benchmark/saccade_detection_bench.py
+"""
+import sys, time, os, tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+
+from trial_writer import TrialWriter
+from session_layout import SessionWriter
+from saccade_detection import detect_session_saccades, SAMPLE_RATE
+
+SESSION_DUR = 600.0
+TRIAL_DUR = 2.0
+NOISE_SD = 0.01 # deg
+
+def min_jerk(s):
+    return 10*s**3 - 15*s**4 + 6*s**5
+
+def make_session(rng):
+    '''
+    Returns:
+        trials - trial num. and trial data of each trial (list of tuple)
+        true_saccades - onset, offset (s), amplitude (deg), peak velocity (deg/s), end x, y
+                        and endpoint error (deg) of each saccade (dict of np.array)
+    '''
+    trials = []
+    true_saccades = {key: [] for key in ('onset_t','offset_t','amplitude','peak_velocity','end_x','end_y','endpoint_error')}
+    num_trial = int(SESSION_DUR/TRIAL_DUR)
+    num_samp = int(TRIAL_DUR*SAMPLE_RATE)
+    t0 = 0.0
+    pos = np.zeros(2)
+    cal_matrix = None
+    tgt_pos = np.zeros(2)
+    for trial_num in range(1, num_trial+1):
+        if trial_num % 50 == 0:
+            t0 += 0.02 # gap in the data
+        if (trial_num - 1) % 20 == 0:
+            gain = rng.uniform(0.8, 1.2, size=2)*np.array([1e-2, -1e-2])
+            cal_matrix = np.array([[gain[0], rng.normal(0, 1e-4), 0], [rng.normal(0, 1e-4), gain[1], 0],
+                                   [rng.normal(0, 0.5), rng.normal(0, 0.5), 1]])
+        t = t0 + np.arange(num_samp)/SAMPLE_RATE
+        xy = np.tile(pos, (num_samp, 1))
+        tgt = np.tile(tgt_pos, (num_samp, 1))
+        sac_start = rng.uniform(0.3, 0.7)
+        # Primary saccade, then a corrective one in half the trials
+        for amp in ([rng.uniform(6, 20), rng.uniform(3, 6)] if rng.uniform() < 0.5 else [rng.uniform(3, 20)]):
+            direction = rng.uniform(0, 2*np.pi)
+            end = pos + amp*np.array([np.cos(direction), np.sin(direction)])
+            if np.hypot(*end) > 25: # stay on the screen
+                end = pos - amp*np.array([np.cos(direction), np.sin(direction)])
+            dur = 0.0022*amp + 0.021
+            onset_idx = int(sac_start*SAMPLE_RATE)
+            s = np.clip((np.arange(num_samp) - onset_idx)/(dur*SAMPLE_RATE), 0, 1)
+            in_sac = np.arange(num_samp) >= onset_idx
+            xy[in_sac] = pos + np.outer(min_jerk(s[in_sac]), end - pos)
+            error = rng.normal(0, 0.5, size=2)
+            tgt[in_sac] = end + error # target shown from saccade onset
+            true_saccades['onset_t'].append(t[onset_idx])
+            true_saccades['offset_t'].append(t[onset_idx] + dur)
+            true_saccades['amplitude'].append(amp)
+            true_saccades['peak_velocity'].append(1.875*amp/dur)
+            true_saccades['end_x'].append(end[0])
+            true_saccades['end_y'].append(end[1])
+            true_saccades['endpoint_error'].append(np.hypot(*error))
+            pos = end
+            tgt_pos = end + error
+            sac_start += dur + rng.uniform(0.15, 0.25)
+        # Slow drift and noise
+        xy += np.cumsum(rng.normal(0, 2e-4, size=(num_samp, 2)), axis=0) + rng.normal(0, NOISE_SD, size=(num_samp, 2))
+        pos = xy[-1].copy()
+        raw = (xy - cal_matrix[2,:2]) @ np.linalg.inv(cal_matrix[:2,:2])
+        blink = np.zeros(num_samp, dtype=np.uint8)
+        if trial_num % 10 == 5: # at the end of the trial, after the saccades
+            blink[int(1.7*SAMPLE_RATE):int(1.8*SAMPLE_RATE)] = 1
+            raw[blink == 1] = rng.uniform(-5000, 5000, size=(int(blink.sum()), 2))
+        fsm_idx = np.arange(0, num_samp, 2) # FSM runs at ~1 kHz
+        trials.append((trial_num, {'vpixx_time_data': t, 'eye_rx_raw_data': raw[:,0], 'eye_ry_raw_data': raw[:,1],
+                                   'eye_r_blink_data': blink, 'right_cal_matrix': cal_matrix.copy(), 'tgt_time_data': t[fsm_idx],
+                                   'tgt_x_data': tgt[fsm_idx,0], 'tgt_y_data': tgt[fsm_idx,1]}))
+        t0 = t[-1] + 1/SAMPLE_RATE
+    return trials, {key: np.array(value) for key, value in true_saccades.items()}
+
+def compare(saccades, true_saccades):
+    # Match each true saccade to the detected one with the closest onset, within 20 ms
+    match = np.searchsorted(saccades['onset_t'], true_saccades['onset_t'])
+    match = np.clip(match, 1, max(len(saccades)-1, 1))
+    closer = np.abs(saccades['onset_t'][match-1] - true_saccades['onset_t']) < np.abs(saccades['onset_t'][match] - true_saccades['onset_t'])
+    match = match - closer
+    is_found = np.abs(saccades['onset_t'][match] - true_saccades['onset_t']) < 0.02
+    found = saccades[match[is_found]]
+    true = {key: value[is_found] for key, value in true_saccades.items()}
+    print('detected {} of {} saccades; {} false detections'.format(is_found.sum(), len(is_found), len(saccades) - len(np.unique(match[is_found]))))
+    for name, error, unit in (('onset', (found['onset_t'] - true['onset_t'])*1e3, 'ms'),
+                              ('offset', (found['offset_t'] - true['offset_t'])*1e3, 'ms'),
+                              ('amplitude', (found['amplitude']/true['amplitude'] - 1)*100, '%'),
+                              ('peak velocity', (found['peak_velocity']/true['peak_velocity'] - 1)*100, '%'),
+                              ('end position', np.hypot(found['end_x'] - true['end_x'], found['end_y'] - true['end_y']), 'deg'),
+                              ('endpoint error', found['endpoint_error'] - true['endpoint_error'], 'deg')):
+        print('  {:15s} error: median {:7.3f} {}, 95% within {:.3f} {}'.format(name, np.median(error), unit, np.percentile(np.abs(error), 95), unit))
+    slope, intercept = np.polyfit(found['amplitude'], found['duration'], 1)
+    print('  main sequence of detected saccades: duration = {:.2f} ms/deg * amplitude + {:.1f} ms (true 2.20, 21.0; onset/offset '
+          'are threshold crossings)'.format(slope*1e3, intercept*1e3))
+
+if __name__ == '__main__':
+    trials, true_saccades = make_session(np.random.default_rng(0))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for layout, writer_class in (('trial', TrialWriter), ('session', SessionWriter)):
+            data_file_path = os.path.join(tmp_dir, layout + '.hdf5')
+            writer = writer_class(data_file_path)
+            writer.set_attrs({'right_eye_tracked': 1, 'left_eye_tracked': 0})
+            for trial_num, trial_data in trials:
+                writer.write_trial(trial_num, trial_data)
+            writer.close()
+            run_time = []
+            for _ in range(3):
+                start = time.perf_counter()
+                saccades = detect_session_saccades(data_file_path)
+                run_time.append(time.perf_counter() - start)
+            print('{} layout: {:.0f} min of data, {} trials, {:.0f} ms per session (incl. reading the file)'.format(
+                layout, SESSION_DUR/60, len(trials), min(run_time)*1e3))
+            compare(saccades, true_saccades)
@@ -0,0 +1,93 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Makes a folder of sessions ('data/<date>/<exp_name>_<HHMMSS>.hdf5', both layouts, a few
+monkeys and experiments) and finds "corr_saccade sessions of one monkey with more than N
+successful trials" by opening every file, as before, and with the session catalog. Prints
+the time of a full rescan, of a rescan with nothing changed and of the query, and checks
+both ways find the same sessions.
+Run from the repository root: python benchmark/session_catalog_bench.py
+"""
+import sys, time, os, tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+import h5py
+
+from trial_writer import TrialWriter
+from session_layout import SessionWriter
+from session_catalog import SessionCatalog, _trial_outcomes
+
+NUM_SESSION = 32
+NUM_TRIAL = 400
+MONKEYS = ['ALPHA', 'BRAVO', 'CHARLIE']
+EXP_NAMES = ['corr_saccade', 'simple_saccade']
+
+def make_sessions(data_dir, rng):
+    for session_idx in range(NUM_SESSION):
+        day_dir = Path(data_dir)/'2024-05-{:02d}'.format(1 + session_idx//4)
+        day_dir.mkdir(parents=True, exist_ok=True)
+        exp_name = EXP_NAMES[session_idx % 2]
+        writer_class = SessionWriter if session_idx % 3 == 0 else TrialWriter
+        writer = writer_class(str(day_dir/'{}_{:02d}0000.hdf5'.format(exp_name, 8 + session_idx % 4)))
+        writer.set_attrs({'monkey': MONKEYS[session_idx % 3], 'computer': 'rig', 'rew_area': float(2 + session_idx % 2),
+                          'version': 1.0})
+        success_rate = rng.uniform(0.5, 0.95)
+        for trial_num in range(1, NUM_TRIAL + 1):
+            is_success = rng.uniform() < success_rate
+            writer.write_trial(trial_num, {'eye_x_data': rng.normal(size=2000), 'eye_y_data': rng.normal(size=2000),
+                                           'state_start_t_trial_success': [1.0] if is_success else [],
+                                           'state_start_t_incorrect_saccade': [] if is_success else [0.8],
+                                           'tgt_idx': [trial_num % 8]})
+        writer.close()
+
+def find_by_opening(data_dir, exp_name, monkey, min_success):
+    found = []
+    for file_path in sorted(Path(data_dir).rglob('*.hdf5')):
+        if exp_name is not None and not file_path.stem.startswith(exp_name + '_'):
+            continue
+        with h5py.File(file_path, 'r') as data_file:
+            if monkey is not None and data_file.attrs.get('monkey') != monkey:
+                continue
+            if _trial_outcomes(data_file).count(1) >= min_success:
+                found.append(str(file_path.resolve()))
+    return found
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = os.path.join(tmp_dir, 'data')
+        make_sessions(data_dir, np.random.default_rng(0))
+        total_mb = sum(path.stat().st_size for path in Path(data_dir).rglob('*.hdf5'))/1e6
+        print('{} sessions of {} trials, {:.0f} MB'.format(NUM_SESSION, NUM_TRIAL, total_mb))
+        queries = [('corr_saccade', 'ALPHA', 300), (None, None, 300)]
+        opened = []
+        for query in queries:
+            start = time.perf_counter()
+            opened.append(find_by_opening(data_dir, *query))
+            print('{}, opening the files: {:.0f} ms'.format(query, (time.perf_counter() - start)*1e3))
+
+        catalog = SessionCatalog(os.path.join(tmp_dir, 'session_catalog.sqlite'))
+        for name, num_process in (('rescan, 1 process', 1), ('rescan, {} processes'.format(os.cpu_count()), None)):
+            if os.path.exists(catalog.catalog_path):
+                os.remove(catalog.catalog_path)
+            catalog = SessionCatalog(catalog.catalog_path)
+            start = time.perf_counter()
+            num_indexed, errors = catalog.rescan([data_dir], num_process)
+            print('{}: {} files in {:.0f} ms'.format(name, num_indexed, (time.perf_counter() - start)*1e3))
+        start = time.perf_counter()
+        num_indexed, errors = catalog.rescan([data_dir])
+        print('rescan with nothing changed: {} files in {:.0f} ms'.format(num_indexed, (time.perf_counter() - start)*1e3))
+
+        repeat = 100
+        for query, query_opened in zip(queries, opened):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                found = catalog.find_sessions(exp_name=query[0], monkey=query[1], min_success=query[2])
+            print('{}, catalog: {:.2f} ms; same sessions found: {} ({} sessions)'.format(query, (time.perf_counter() - start)/repeat*1e3,
+                  sorted(row['path'] for row in found) == query_opened, len(query_opened)))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            found_attr = catalog.find_sessions(exp_name='corr_saccade', rew_area=2.0)
+        print('catalog query on an attribute: {:.2f} ms ({} sessions)'.format((time.perf_counter() - start)/repeat*1e3, len(found_attr)))
+        print('errors: {}'.format(errors))
@@ -0,0 +1,133 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Writes the same synthetic session (trials from storage_profile_bench, some sent in two
+pieces) with TrialWriter (a group per trial) and SessionWriter (a column per entry), checks
+that SessionReader, mat_export and alignment.load_behavior_signal give the same data for
+both, and prints object count, write time, open time, full-session scan time and random
+trial access time of each.
+Run from the repository root: python benchmark/session_layout_bench.py [num. of trials]
+"""
+import sys, time, os, tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+import h5py
+
+from trial_writer import TrialWriter
+from session_layout import SessionWriter, SessionReader
+from mat_export import convert_to_mat
+from alignment import load_behavior_signal
+from storage_profile_bench import make_trial
+
+def write_session(writer, trials):
+    start = time.perf_counter()
+    for trial_num, trial_data in enumerate(trials, start=1):
+        if trial_num % 5 == 0:
+            # Sent mid-trial and at the end of the trial
+            half = {key: value[:len(value)//2] for key, value in trial_data.items()}
+            rest = {key: value[len(value)//2:] for key, value in trial_data.items()}
+            writer.write_trial(trial_num, half)
+            writer.write_trial(trial_num, rest)
+        else:
+            writer.write_trial(trial_num, trial_data)
+    writer.close()
+    return time.perf_counter() - start
+
+def count_objects(file_path):
+    num_object = []
+    with h5py.File(file_path, 'r') as data_file:
+        data_file.visit(num_object.append)
+    return len(num_object)
+
+def scan_trial_layout(file_path):
+    total = 0.0
+    with h5py.File(file_path, 'r') as data_file:
+        for trial_key in data_file:
+            for dataset in data_file[trial_key].values():
+                total += np.sum(dataset[()])
+    return total
+
+def scan_session_layout(file_path):
+    total = 0.0
+    with SessionReader(file_path) as reader:
+        for key in reader.keys:
+            total += np.sum(reader.column(key))
+    return total
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+if __name__ == '__main__':
+    num_trial = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rng = np.random.default_rng(0)
+    trials = []
+    t0 = 100.0
+    for _ in range(num_trial):
+        trial_data, t0 = make_trial(rng, t0)
+        trial_data['vpixx_time_data'] = trial_data.pop('device_time_data')
+        trial_data['state_start_t_trial_success'] = [t0] if rng.uniform() < 0.7 else []
+        trials.append(trial_data)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trial_path = os.path.join(tmp_dir, 'trial.hdf5')
+        session_path = os.path.join(tmp_dir, 'session.hdf5')
+        trial_write = write_session(TrialWriter(trial_path), trials)
+        session_write = write_session(SessionWriter(session_path), trials)
+
+        # Same data
+        mismatch = 0
+        with h5py.File(trial_path, 'r') as data_file, SessionReader(session_path) as reader:
+            outcome = reader.index['outcome']
+            for trial_num in reader.trial_nums():
+                trial_data = reader.trial(trial_num)
+                for key, dataset in data_file['trial_'+str(trial_num)].items():
+                    mismatch += not np.array_equal(dataset[()], trial_data[key])
+                    mismatch += not np.array_equal(dataset[()], reader.read_trial(trial_num, [key])[key])
+        print('{} trials; mismatched entries: {}; outcome 1/0/-1: {}/{}/{}'.format(
+            num_trial, mismatch, np.sum(outcome == 1), np.sum(outcome == 0), np.sum(outcome == -1)))
+        t_trial, signal_trial = load_behavior_signal(trial_path)
+        t_session, signal_session = load_behavior_signal(session_path)
+        print('alignment signal same: {}'.format(np.array_equal(t_trial, t_session) and np.array_equal(signal_trial, signal_session)))
+        convert_to_mat(trial_path, os.path.join(tmp_dir, 'trial.mat'))
+        convert_to_mat(session_path, os.path.join(tmp_dir, 'session.mat'))
+        with h5py.File(os.path.join(tmp_dir, 'trial.mat'), 'r') as trial_mat, h5py.File(os.path.join(tmp_dir, 'session.mat'), 'r') as session_mat:
+            same = all(np.array_equal(trial_mat['data'][trial_key][key][()], session_mat['data'][trial_key][key][()])
+                       for trial_key in trial_mat['data'] for key in trial_mat['data'][trial_key])
+        print('.mat same: {}'.format(same))
+
+        print('{:>8}: {:>7} {:>9} {:>9} {:>9} {:>10} {:>12}'.format('layout', 'objects', 'MB', 'write s', 'open ms', 'scan s', 'random ms'))
+        random_trial = rng.integers(1, num_trial+1, 100).tolist()
+        def open_trial_layout():
+            with h5py.File(trial_path, 'r') as data_file:
+                return list(data_file.keys())
+        def open_session_layout():
+            with SessionReader(session_path) as reader:
+                return reader.trial_nums()
+        def random_trial_layout():
+            with h5py.File(trial_path, 'r') as data_file:
+                for trial_num in random_trial:
+                    {key: dataset[()] for key, dataset in data_file['trial_'+str(trial_num)].items()}
+        def random_session_layout():
+            with SessionReader(session_path) as reader:
+                for trial_num in random_trial:
+                    reader.read_trial(trial_num)
+        for name, path, write_time, open_func, scan_func, random_func in (
+                ('trial', trial_path, trial_write, open_trial_layout, scan_trial_layout, random_trial_layout),
+                ('session', session_path, session_write, open_session_layout, scan_session_layout, random_session_layout)):
+            open_time, _ = timed(open_func)
+            scan_time, total = timed(scan_func, path)
+            random_time, _ = timed(random_func)
+            print('{:>8}: {:7d} {:9.0f} {:9.2f} {:9.2f} {:10.2f} {:12.1f}'.format(name, count_objects(path), os.path.getsize(path)/1e6,
+                                                                         write_time, open_time*1e3, scan_time, random_time/len(random_trial)*1e3))
+        with SessionReader(session_path) as reader:
+            reader.trial(1)
+            start = time.perf_counter()
+            for trial_num in reader.trial_nums():
+                reader.trial(trial_num)
+            print('session layout, all trials from cached columns: {:.1f} us/trial'.format((time.perf_counter() - start)/num_trial*1e6))
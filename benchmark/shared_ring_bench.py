@@ -0,0 +1,63 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Times what publishing one sample costs the FSM loop: five writes to a 'multiprocessing.Array'
+under its lock (original) against 'SharedRing.write'. Then runs a producer process at ~2 kHz
+for 2 s while this process reads the ring every 1/60 s, as the GUI does, and checks that
+every sample arrives in order.
+Run from the repository root: python benchmark/shared_ring_bench.py
+"""
+import sys, time, multiprocessing
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+
+from shared_ring import SharedRing
+
+NUM_SAMP = 4000
+
+def write_array(real_time_data_Array, sample):
+    with real_time_data_Array.get_lock():
+        real_time_data_Array[0] = sample[0]
+        real_time_data_Array[1] = sample[1]
+        real_time_data_Array[2] = sample[2]
+        real_time_data_Array[3] = sample[3]
+        real_time_data_Array[4] = sample[4]
+
+def produce(ring, num_samp):
+    start = time.perf_counter()
+    for i in range(num_samp):
+        while time.perf_counter() - start < i/2000:
+            pass
+        ring.write((i, 0.0, 0.0, 0.0, 0.0))
+
+if __name__ == '__main__':
+    multiprocessing.set_start_method('spawn')
+    real_time_data_Array = multiprocessing.Array('d', range(5))
+    ring = SharedRing(5)
+    sample = (1.0, 2.0, 3.0, 4.0, 5.0)
+    num_write = 200000
+    start = time.perf_counter()
+    for _ in range(num_write):
+        write_array(real_time_data_Array, sample)
+    print('locked Array: {:.3f} us per sample'.format((time.perf_counter() - start)/num_write*1e6))
+    start = time.perf_counter()
+    for _ in range(num_write):
+        ring.write(sample)
+    print('SharedRing:   {:.3f} us per sample'.format((time.perf_counter() - start)/num_write*1e6))
+
+    ring.read() # skip samples written above
+    ring.dropped = 0
+    producer = multiprocessing.Process(target=produce, args=(ring, NUM_SAMP))
+    producer.start()
+    received = []
+    while producer.is_alive():
+        received.append(ring.read()[:,0])
+        time.sleep(1/60)
+    producer.join()
+    received.append(ring.read()[:,0])
+    received = np.concatenate(received)
+    print('received {} of {} samples, dropped {}, in order: {}'.format(
+        len(received), NUM_SAMP, ring.dropped, np.array_equal(received, np.arange(NUM_SAMP))))
+    ring.unlink()
@@ -0,0 +1,106 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Writes a synthetic session of 2000 Hz trials with TrialWriter under each storage profile
+and prints bytes per trial, write latency per trial and read throughput of each, and the
+same per column for the 2000 Hz columns. Columns are shaped like the real ones: time
+stamps every 0.5 ms, eye position with fixations, saccades and ~0.01 deg noise, pupil
+size, blink flags and digital in/out words that rarely change, all as doubles.
+Run from the repository root: python benchmark/storage_profile_bench.py [num. of trials]
+"""
+import sys, time, os, tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+import h5py
+
+from trial_writer import TrialWriter, STORAGE_PROFILE, DEFAULT_STORAGE
+
+DEVICE_RATE = 2000
+
+def eye_trace(rng, num_samp):
+    # Fixations joined by saccades, plus noise; raw (uncalibrated) units
+    num_fix = max(num_samp//600, 1)
+    fix_pos = rng.uniform(-2000, 2000, num_fix)
+    trace = np.repeat(fix_pos, -(-num_samp//num_fix))[:num_samp]
+    trace = np.convolve(trace, np.ones(40)/40, mode='same')
+    return trace + rng.normal(scale=2.0, size=num_samp)
+
+def step_signal(rng, num_samp, num_step, levels):
+    signal = np.zeros(num_samp)
+    for start in np.sort(rng.integers(0, num_samp, num_step)):
+        signal[start:] = rng.choice(levels)
+    return signal
+
+def make_trial(rng, t0):
+    num_samp = int(rng.uniform(1.5, 3.0)*DEVICE_RATE)
+    t = t0 + np.arange(num_samp)/DEVICE_RATE
+    trial_data = {'device_time_data': t}
+    for eye in ('l','r'):
+        trial_data[f'eye_{eye}x_raw_data'] = eye_trace(rng, num_samp)
+        trial_data[f'eye_{eye}y_raw_data'] = eye_trace(rng, num_samp)
+        trial_data[f'eye_{eye}_pupil_data'] = 3000 + np.cumsum(rng.normal(scale=0.5, size=num_samp)) + rng.normal(scale=5, size=num_samp)
+        trial_data[f'eye_{eye}_blink_data'] = step_signal(rng, num_samp, int(rng.integers(0,3)), [0.0, 1.0])
+    trial_data['din_data'] = step_signal(rng, num_samp, 4, [0.0, 1.0, 16.0, 17.0])
+    trial_data['dout_data'] = step_signal(rng, num_samp, 6, [0.0, 3.0, 4.0, 7.0])
+    # FSM iteration data, ~1 kHz
+    num_iter = num_samp//2
+    trial_data['tgt_time_data'] = t[:2*num_iter:2] + rng.uniform(0, 2e-4, num_iter)
+    trial_data['tgt_x_data'] = step_signal(rng, num_iter, 3, [0.0, 8.0, -8.0, 5.66])
+    trial_data['tgt_y_data'] = step_signal(rng, num_iter, 3, [0.0, 8.0, -8.0, 5.66])
+    trial_data['eye_x_data'] = trial_data['eye_lx_raw_data'][:2*num_iter:2]/250
+    trial_data['eye_y_data'] = trial_data['eye_ly_raw_data'][:2*num_iter:2]/250
+    trial_data['state_start_t_saccade'] = [t0 + 1.0]
+    trial_data['tgt_idx'] = [int(rng.integers(8))]
+    return trial_data, t[-1] + 1/DEVICE_RATE
+
+def run_profile(tmp_dir, name, storage, trials):
+    file_path = os.path.join(tmp_dir, name + '.hdf5')
+    writer = TrialWriter(file_path, storage=storage)
+    write_time = []
+    for trial_num, trial_data in enumerate(trials, start=1):
+        start = time.perf_counter()
+        writer.write_trial(trial_num, trial_data)
+        write_time.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    writer.close()
+    close_time = time.perf_counter() - start
+    column_bytes = {}
+    num_bytes = 0
+    start = time.perf_counter()
+    with h5py.File(file_path, 'r') as data_file:
+        for trial_key in data_file:
+            for data_key, dataset in data_file[trial_key].items():
+                value = dataset[()]
+                num_bytes += value.nbytes
+                column_bytes[data_key] = column_bytes.get(data_key, 0) + dataset.id.get_storage_size()
+    read_time = time.perf_counter() - start
+    return {'file_bytes': os.path.getsize(file_path), 'write_ms': (np.sum(write_time) + close_time)/len(trials)*1e3,
+            'write_p99_ms': np.percentile(write_time, 99)*1e3, 'read_mb_s': num_bytes/read_time/1e6, 'column_bytes': column_bytes}
+
+if __name__ == '__main__':
+    num_trial = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rng = np.random.default_rng(0)
+    trials = []
+    t0 = 100.0
+    for _ in range(num_trial):
+        trial_data, t0 = make_trial(rng, t0)
+        trials.append(trial_data)
+    raw_bytes = sum(np.asarray(value).nbytes for trial_data in trials for value in trial_data.values())
+    print('{} trials, {:.0f} kB raw per trial'.format(num_trial, raw_bytes/num_trial/1e3))
+    profiles = dict((name, name) for name in STORAGE_PROFILE)
+    profiles['DEFAULT_STORAGE'] = DEFAULT_STORAGE
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        run_profile(tmp_dir, 'warm_up', 'none', trials[:50])
+        for name, storage in profiles.items():
+            result[name] = run_profile(tmp_dir, name, storage, trials)
+            res = result[name]
+            print('{:>15}: {:7.1f} kB/trial ({:5.1f} %), write {:5.2f} ms/trial (p99 {:5.2f}), read {:6.0f} MB/s'.format(
+                name, res['file_bytes']/num_trial/1e3, res['file_bytes']/raw_bytes*100, res['write_ms'], res['write_p99_ms'], res['read_mb_s']))
+    print('\nkB/trial by column')
+    columns = [key for key, value in trials[0].items() if len(value) > 1]
+    print('{:>22} '.format('') + ' '.join('{:>13}'.format(name) for name in STORAGE_PROFILE))
+    for key in columns:
+        print('{:>22} '.format(key) + ' '.join('{:13.1f}'.format(result[name]['column_bytes'][key]/num_trial/1e3) for name in STORAGE_PROFILE))
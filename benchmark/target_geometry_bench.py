@@ -0,0 +1,63 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Checks that target_geometry gives the same positions as the loops previously in
+app_lib.make_prim_target/make_corr_target (copied below, since app_lib cannot be imported
+without pypixxlib) and times both, with and without the cache.
+Run from the repository root: python benchmark/target_geometry_bench.py
+"""
+import sys, time, math
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+
+import target_geometry
+from target_geometry import prim_target_pos, corr_target_pos
+
+def make_corr_target(parameter):
+    tgt_list = []
+    for prim_tgt_idx in range(parameter['num_prim_sac_dir']):
+        prim_tgt_dir = 2*math.pi/parameter['num_prim_sac_dir']*prim_tgt_idx + parameter['first_prim_sac_dir']*math.pi/180
+        prim_tgt_x = parameter['prim_sac_amp']*math.cos(prim_tgt_dir)
+        prim_tgt_y = parameter['prim_sac_amp']*math.sin(prim_tgt_dir)
+        for corr_tgt_idx in range (parameter['num_corr_sac_dir']):
+            corr_tgt_dir = 2*math.pi/parameter['num_corr_sac_dir']*corr_tgt_idx + parameter['first_corr_sac_dir']*math.pi/180
+            corr_tgt_x = parameter['corr_sac_amp']*math.cos(corr_tgt_dir) + prim_tgt_x
+            corr_tgt_y = parameter['corr_sac_amp']*math.sin(corr_tgt_dir) + prim_tgt_y
+            tgt_list.append({'prim_tgt_pos': [prim_tgt_x, prim_tgt_y],
+                             'corr_tgt_pos': [corr_tgt_x, corr_tgt_y]})
+    return tgt_list
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    max_diff = 0.0
+    for _ in range(200):
+        parameter = {'num_prim_sac_dir': int(rng.integers(1,37)), 'prim_sac_amp': float(rng.uniform(1,20)), 'first_prim_sac_dir': int(rng.integers(0,360)),
+                     'num_corr_sac_dir': int(rng.integers(1,37)), 'corr_sac_amp': float(rng.uniform(1,5)), 'first_corr_sac_dir': int(rng.integers(0,360))}
+        tgt_list = make_corr_target(parameter)
+        prim_pos, corr_pos = corr_target_pos(parameter)
+        max_diff = max(max_diff, np.max(np.abs(np.array([tgt['prim_tgt_pos'] for tgt in tgt_list]) - prim_pos)),
+                       np.max(np.abs(np.array([tgt['corr_tgt_pos'] for tgt in tgt_list]) - corr_pos)))
+        max_diff = max(max_diff, np.max(np.abs(np.array([tgt['prim_tgt_pos'] for tgt in tgt_list[::parameter['num_corr_sac_dir']]]) - prim_target_pos(parameter))))
+    print('max. difference from loops: {}'.format(max_diff))
+
+    parameter = {'num_prim_sac_dir': 36, 'prim_sac_amp': 8.0, 'first_prim_sac_dir': 0, 'num_corr_sac_dir': 36, 'corr_sac_amp': 2.0, 'first_corr_sac_dir': 0}
+    num_run = 200
+    start = time.perf_counter()
+    for _ in range(num_run):
+        make_corr_target(parameter)
+    loop_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(num_run):
+        target_geometry._corr_target_pos.cache_clear()
+        target_geometry._prim_target_pos.cache_clear()
+        corr_target_pos(parameter)
+    vector_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(num_run):
+        corr_target_pos(parameter)
+    cached_time = time.perf_counter() - start
+    print('1296 target sets; loops:  {:.1f} us'.format(loop_time/num_run*1e6))
+    print('1296 target sets; vector: {:.1f} us'.format(vector_time/num_run*1e6))
+    print('1296 target sets; cached: {:.1f} us'.format(cached_time/num_run*1e6))
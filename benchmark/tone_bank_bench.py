@@ -0,0 +1,40 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Times what a beep costs the FSM loop: synthesizing the tone on every call (as in
+app_lib.playSound, minus playback) against queueing a request for ToneBank's worker thread.
+sound.py cannot be imported without PyQt5/simpleaudio, so both are reproduced here.
+Run from the repository root: python benchmark/tone_bank_bench.py
+"""
+import sys, time, queue
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+
+from loop_timer import LoopTimer
+
+def make_tone(freq, duration, fs=44100):
+    t = np.linspace(0, duration, int(duration * fs), False)
+    note = np.sin(freq * t * 2 * np.pi)
+    audio = note * (2**15 - 1) / np.max(np.abs(note))
+    return audio.astype(np.int16)
+
+if __name__ == '__main__':
+    num_call = 2000
+    synth_timer = LoopTimer('synthesize')
+    for _ in range(num_call):
+        start = time.perf_counter()
+        make_tone(2000, 0.1)
+        synth_timer.record(time.perf_counter() - start)
+
+    play_queue = queue.SimpleQueue()
+    request_timer = LoopTimer('tone_request')
+    for _ in range(num_call):
+        start = time.perf_counter()
+        play_queue.put((2000, 0.1, start))
+        request_timer.record(time.perf_counter() - start)
+
+    for timer in [synth_timer, request_timer]:
+        count, p50, p99, max_time, _ = timer.summary()
+        print('{:13s}: p50 {:7.3f} ms, p99 {:7.3f} ms, max {:7.3f} ms'.format(timer.name, p50*1e3, p99*1e3, max_time*1e3))
@@ -0,0 +1,60 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Times decoding a 10,000-sample (5 s) 'TPxReadTPxData' pull into trial data:
+eleven stride-22 slices extended into lists (original 'pull_data') against 'tpx_columns'
+extended into TrialRecorder columns, for the buffer as a list, a ctypes array of doubles
+and a decoded Nx22 array; the pull is done in the FSM loop. Columns extended with lists
+are converted when viewed for sending, so that is timed too. Checks that all give the
+same values.
+Run from the repository root: python benchmark/tpx_data_bench.py
+"""
+import sys, time, ctypes
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+
+from tpx_data import TPX_NUM_FIELD, TPX_FIELD_IDX, decode_tpx_data, tpx_columns
+from trial_recorder import ColumnGroup
+
+FIELDS = ['time','eye_lx_raw','eye_ly_raw','eye_l_pupil','eye_l_blink','eye_rx_raw','eye_ry_raw',
+          'eye_r_pupil','eye_r_blink','din','dout']
+FIELD_IDX = [TPX_FIELD_IDX[field] for field in FIELDS]
+NUM_SAMP = 10000
+NUM_REPEAT = 100
+
+def slice_to_list(tpx_buffer):
+    data = [[] for _ in FIELD_IDX]
+    for column, idx in zip(data, FIELD_IDX):
+        column.extend(tpx_buffer[idx::TPX_NUM_FIELD])
+    return data
+
+def columns_to_recorder(tpx_buffer, group):
+    group.reset()
+    group.extend(tpx_columns(tpx_buffer, FIELD_IDX))
+    return group
+
+def columns_to_recorder_views(tpx_buffer, group):
+    return columns_to_recorder(tpx_buffer, group).views()
+
+def time_it(func, *args):
+    start = time.perf_counter()
+    for _ in range(NUM_REPEAT):
+        func(*args)
+    return (time.perf_counter() - start)/NUM_REPEAT
+
+if __name__ == '__main__':
+    tpx_list = np.random.default_rng(0).normal(size=NUM_SAMP*TPX_NUM_FIELD).tolist()
+    tpx_ctypes = (ctypes.c_double*len(tpx_list))(*tpx_list)
+    tpx_samples = decode_tpx_data(tpx_ctypes)
+    print('ctypes buffer decoded without copy: {}'.format(not tpx_samples.flags['OWNDATA']))
+    group = ColumnGroup(FIELDS, 2000*10)
+    ref = np.array(slice_to_list(tpx_list))
+    print('slices -> lists:                  {:.3f} ms'.format(time_it(slice_to_list, tpx_list)*1e3))
+    for name, tpx_buffer in [('list', tpx_list), ('ctypes array', tpx_ctypes), ('Nx22 array', tpx_samples)]:
+        data = np.array(list(columns_to_recorder(tpx_buffer, group).views().values()))
+        elapsed = time_it(columns_to_recorder, tpx_buffer, group)
+        elapsed_views = time_it(columns_to_recorder_views, tpx_buffer, group)
+        print('tpx_columns ({:12s}) -> recorder: {:.3f} ms, incl. views {:.3f} ms, identical: {}'.format(
+              name, elapsed*1e3, elapsed_views*1e3, np.array_equal(ref, data)))
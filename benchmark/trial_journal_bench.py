@@ -0,0 +1,95 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Journals the trial data messages of a 20 min session (2000 Hz device data; every 10th
+trial sent in 5 s pieces) with different sync intervals and prints the time per message,
+next to the time TrialWriter takes to save the same message. Then cuts the journal off in
+the middle of a record, as a crash would, recovers the session from it and checks every
+complete record is in the recovered file with the same data as the saved one.
+Run from the repository root: python benchmark/trial_journal_bench.py
+"""
+import sys, time, os, tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+import h5py
+
+from trial_writer import TrialWriter, DEFAULT_STORAGE
+from trial_journal import Journal, RECORD_ATTRS, RECORD_TRIAL, read_journal, recover_session
+
+DEVICE_KEYS = ['vpixx_time_data','eye_lx_raw_data','eye_ly_raw_data','eye_l_pupil_data','eye_l_blink_data','eye_rx_raw_data',
+               'eye_ry_raw_data','eye_r_pupil_data','eye_r_blink_data','din_data','dout_data','tgt_time_data','tgt_x_data',
+               'tgt_y_data','eye_x_data','eye_y_data']
+
+def session_messages(rng, session_dur):
+    '''
+    Yields:
+        trial_num, trial_data - one message per trial, or per 5 s of long trials
+    '''
+    t = 0.0
+    trial_num = 0
+    while t < session_dur:
+        trial_num += 1
+        trial_dur = 30.0 if trial_num % 10 == 0 else rng.uniform(1.5, 3.0)
+        for piece_start in np.arange(0, trial_dur, 5.0):
+            piece_dur = min(5.0, trial_dur - piece_start)
+            trial_data = {key: rng.normal(size=int(piece_dur*2000)) for key in DEVICE_KEYS}
+            trial_data['state_start_t_trial_success'] = [t + piece_dur] if piece_start + 5.0 >= trial_dur else []
+            trial_data['right_cal_matrix'] = rng.normal(size=(3,2)) if piece_start == 0 else []
+            yield trial_num, trial_data
+            t += piece_dur
+
+def time_journal(journal_path, messages, sync_interval):
+    journal = Journal(journal_path, sync_interval)
+    journal.append(RECORD_ATTRS, {'exp_name': 'bench'})
+    append_time = []
+    for trial_num, trial_data in messages:
+        start = time.perf_counter()
+        journal.append(RECORD_TRIAL, (trial_num, trial_data))
+        append_time.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    journal.close()
+    return np.array(append_time)*1e3, (time.perf_counter() - start)*1e3
+
+if __name__ == '__main__':
+    messages = list(session_messages(np.random.default_rng(0), 20*60))
+    msg_bytes = np.mean([sum(np.asarray(value).nbytes for value in trial_data.values()) for _, trial_data in messages])
+    print('{} messages, {:.2f} MB each on average'.format(len(messages), msg_bytes/1e6))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_file_path = os.path.join(tmp_dir, 'saved.hdf5')
+        writer = TrialWriter(data_file_path, storage=DEFAULT_STORAGE)
+        writer.set_attrs({'exp_name': 'bench'})
+        save_time = []
+        for trial_num, trial_data in messages:
+            start = time.perf_counter()
+            writer.write_trial(trial_num, trial_data)
+            save_time.append(time.perf_counter() - start)
+        writer.close()
+        save_time = np.array(save_time)*1e3
+        print('TrialWriter ({}): mean {:.2f} ms, p99 {:.2f} ms per message'.format(DEFAULT_STORAGE, save_time.mean(), np.percentile(save_time, 99)))
+        for name, sync_interval in (('never (OS)', float('inf')), ('every 1 s', 1.0), ('every message', 0.0)):
+            journal_path = os.path.join(tmp_dir, 'session.journal')
+            append_time, close_time = time_journal(journal_path, messages, sync_interval)
+            print('journal, sync {:13s}: mean {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms per message; close {:.0f} ms; {:.0f} MB'.format(
+                name, append_time.mean(), np.percentile(append_time, 99), append_time.max(), close_time, os.path.getsize(journal_path)/1e6))
+
+        # Crash in the middle of the last record; the file is still at its mapped size
+        file_size = os.path.getsize(journal_path)
+        with open(journal_path, 'r+b') as file:
+            file.truncate(file_size - 1000)
+            file.truncate(file_size + (1 << 20))
+        num_complete = sum(1 for _ in read_journal(journal_path))
+        start = time.perf_counter()
+        recovered_path, num_record = recover_session(journal_path, storage=DEFAULT_STORAGE)
+        print('recovered {} of {} records (last one cut off) in {:.2f} s'.format(num_record, len(messages)+1, time.perf_counter() - start))
+        mismatch = 0
+        last_trial_num = messages[-1][0]
+        with h5py.File(data_file_path,'r') as saved_file, h5py.File(recovered_path,'r') as recovered_file:
+            mismatch += dict(saved_file.attrs) != dict(recovered_file.attrs)
+            for trial_key in saved_file:
+                if trial_key == 'trial_'+str(last_trial_num):
+                    continue # cut off; only its complete messages are recovered
+                for data_key in saved_file[trial_key]:
+                    mismatch += not np.array_equal(saved_file[trial_key][data_key][()], recovered_file[trial_key][data_key][()])
+        print('complete records: {}, mismatched datasets: {}'.format(num_complete, mismatch))
@@ -0,0 +1,82 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Compares trial data kept as a dict of lists (rebuilt every trial) against TrialRecorder
+(allocated once, reset in place): time per trial, memory held by the trial data right
+before it is sent and size of the pickled trial data sent to the GUI.
+Run from the repository root: python benchmark/trial_recorder_bench.py
+"""
+import sys, time, pickle, tracemalloc
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+
+from trial_recorder import TrialRecorder
+
+SAMPLE_KEYS = ['tgt_time_data','tgt_x_data','tgt_y_data','eye_x_data','eye_y_data']
+DEVICE_KEYS = ['device_time_data','eye_lx_raw_data','eye_ly_raw_data','eye_l_pupil_data','eye_l_blink_data',
+               'eye_rx_raw_data','eye_ry_raw_data','eye_r_pupil_data','eye_r_blink_data','din_data','dout_data']
+DEVICE_IDX = [0,16,17,3,8,18,19,6,9,7,10] # column of each key in TPxReadTPxData output
+NUM_TRIAL = 50
+NUM_FSM_SAMP = 5000 # FSM iterations per 5 s chunk
+NUM_DEVICE_SAMP = 10000 # 2000 Hz samples per 5 s chunk (longest between pulls)
+
+def read_tpx_data(tpx_source):
+    '''
+    like TPxReadTPxData, returns a new flat list of 22 values per sample
+    '''
+    return tpx_source.tolist()
+
+def run_list(tpx_source):
+    for trial in range(NUM_TRIAL):
+        trial_data = {}
+        for key in SAMPLE_KEYS + DEVICE_KEYS:
+            trial_data[key] = []
+        for i in range(NUM_FSM_SAMP):
+            t = i*1e-3
+            trial_data['tgt_time_data'].append(t)
+            trial_data['tgt_x_data'].append(t+1)
+            trial_data['tgt_y_data'].append(t+2)
+            trial_data['eye_x_data'].append(t+3)
+            trial_data['eye_y_data'].append(t+4)
+        tpx_data = read_tpx_data(tpx_source)
+        for key, idx in zip(DEVICE_KEYS, DEVICE_IDX):
+            trial_data[key].extend(tpx_data[idx::22])
+        del tpx_data
+        held = tracemalloc.get_traced_memory()[0]
+        msg = pickle.dumps(('trial_data', trial, trial_data))
+    return held, len(msg)
+
+def run_recorder(tpx_source):
+    recorder = TrialRecorder()
+    sample_data = recorder.add_group(SAMPLE_KEYS, 2000*10)
+    device_data = recorder.add_group(DEVICE_KEYS, 2000*10)
+    for trial in range(NUM_TRIAL):
+        recorder.reset()
+        for i in range(NUM_FSM_SAMP):
+            t = i*1e-3
+            sample_data.append(t, t+1, t+2, t+3, t+4)
+        tpx_data = read_tpx_data(tpx_source)
+        device_data.extend([tpx_data[idx::22] for idx in DEVICE_IDX])
+        del tpx_data
+        held = tracemalloc.get_traced_memory()[0]
+        msg = pickle.dumps(('trial_data', trial, recorder.to_dict()))
+    return held, len(msg)
+
+def measure(func, tpx_source):
+    tracemalloc.start()
+    held, msg_size = func(tpx_source)
+    tracemalloc.stop()
+    # Time without tracemalloc overhead
+    start = time.perf_counter()
+    func(tpx_source)
+    elapsed = time.perf_counter() - start
+    return elapsed, held, msg_size
+
+if __name__ == '__main__':
+    tpx_source = np.random.default_rng(0).normal(size=22*NUM_DEVICE_SAMP)
+    for name, func in [('dict of lists', run_list), ('TrialRecorder', run_recorder)]:
+        elapsed, held, msg_size = measure(func, tpx_source)
+        print('{:14s}: {:7.2f} ms/trial, memory held by trial data {:6.2f} MB, pickled trial {:6.1f} kB'
+              .format(name, elapsed/NUM_TRIAL*1e3, held/1e6, msg_size/1e3))
@@ -0,0 +1,64 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Runs sessions of TrialSchedule with 30 % error trials for each error policy and checks
+what each policy promises: 'repeat' shows the failed target again, 'skip' moves on,
+'requeue' shows it again later but never right after the failed trial, also when the
+failed trial is the last of its block. Counts successful trials per target, and times
+'next' and 'error'.
+Run from the repository root: python benchmark/trial_schedule_bench.py
+"""
+import sys, time
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+
+from trial_schedule import TrialSchedule
+
+NUM_TRIAL = 20000
+ERROR_RATE = 0.3
+
+def run_session(schedule, rng):
+    '''
+    Returns:
+        shown - target of each trial (list of int)
+        failed - whether each trial failed (list of bool)
+        last_in_block - whether each trial was the last of its block (list of bool)
+        inserted_next - whether the failed target was put right after the failed trial;
+                        seen only if the entry there was a different target (list of bool)
+    '''
+    shown, failed, last_in_block, inserted_next = [], [], [], []
+    tgt_idx = schedule.next()
+    for _ in range(NUM_TRIAL):
+        shown.append(tgt_idx)
+        idx = schedule.idx
+        if idx + 1 == len(schedule.schedule):
+            schedule.extend(1)
+        last_in_block.append(schedule.block_id[idx+1] != schedule.block_id[idx])
+        failed.append(rng.uniform() < ERROR_RATE)
+        next_entry = schedule.schedule[idx+1]
+        tgt_idx = schedule.error() if failed[-1] else schedule.next()
+        inserted_next.append(failed[-1] and schedule.schedule[idx+1] != next_entry)
+    return shown, failed, last_in_block, inserted_next
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    for num_tgt, weights in ((8, None), (3, [1, 2, 1]), (2, None)):
+        for error_policy in TrialSchedule.policies:
+            schedule = TrialSchedule(num_tgt, weights, error_policy, num_block=10, seed=1)
+            start = time.perf_counter()
+            shown, failed, last_in_block, inserted_next = map(np.array, run_session(schedule, rng))
+            elapsed = time.perf_counter() - start
+            same_next = shown[1:] == shown[:-1]
+            after_error = failed[:-1]
+            success_count = np.bincount(shown[~failed], minlength=num_tgt)
+            text = '{} targets, weights {}, {:7s}: {:.2f} us/trial, successes per target {}'.format(
+                num_tgt, weights, error_policy, elapsed/NUM_TRIAL*1e6, success_count.tolist())
+            if error_policy == 'repeat':
+                text += ', failed target shown next: {:.0f} %'.format(np.mean(same_next[after_error])*100)
+            elif error_policy == 'requeue':
+                # Failed target can still come next by chance, if the next entry is the same target
+                text += ', put right after the failed trial: {} times ({} of {} failed trials last of a block)'.format(
+                    np.sum(inserted_next), np.sum(inserted_next & last_in_block), np.sum(failed & last_in_block))
+            print(text)
@@ -0,0 +1,105 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Simulates the trial data messages of a 2 hr session (2000 Hz device data, state start times,
+calibration matrices; every 10th trial is long and sent in 5 s pieces as in the FSMs) and
+saves them with TrialWriter and with the read-append-rewrite previously in
+DataManager.save_data (copied below, since data_manager cannot be imported without
+pypixxlib). Checks both files have the same data and prints save time per message over the
+session and within long trials.
+Run from the repository root: python benchmark/trial_writer_bench.py
+"""
+import sys, time, os, tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+import numpy as np
+import h5py
+
+from trial_writer import TrialWriter
+
+DEVICE_KEYS = ['vpixx_time_data','eye_lx_raw_data','eye_ly_raw_data','eye_l_pupil_data','eye_l_blink_data','eye_rx_raw_data',
+               'eye_ry_raw_data','eye_r_pupil_data','eye_r_blink_data','din_data','dout_data']
+SAMPLE_KEYS = ['tgt_time_data','tgt_x_data','tgt_y_data','eye_x_data','eye_y_data']
+STATE_KEYS = ['state_start_t_str_tgt_pursuit','state_start_t_str_tgt_present','state_start_t_str_tgt_fixation',
+              'state_start_t_cue_tgt_present','state_start_t_saccade','state_start_t_deliver_rew','state_start_t_trial_success']
+
+def old_save_data(data_file_path, trial_num, trial_data):
+    data_file = h5py.File(data_file_path +'.hdf5','a',libver='latest')
+    group_name = "trial_"+str(trial_num)
+    # If trial already exists, append data. Otherwise create new group
+    try:
+        trial_grp = data_file[group_name]
+        appended_data = {}
+        for trial_key,_ in trial_grp.items():
+            trial_data[trial_key] = np.append(trial_grp[trial_key][:], trial_data[trial_key])
+        del data_file[group_name]
+    except:
+        pass
+    finally:
+        trial_grp = data_file.create_group(group_name)
+        for key,value in trial_data.items():
+            trial_grp.create_dataset(key,data=trial_data[key])
+        data_file.close()
+
+def session_messages(rng, session_dur):
+    '''
+    Yields:
+        t, trial_num, trial_data, piece_idx - one message per trial, or per 5 s of long trials
+    '''
+    t = 0.0
+    trial_num = 0
+    while t < session_dur:
+        trial_num += 1
+        trial_dur = 30.0 if trial_num % 10 == 0 else rng.uniform(1.5, 3.0)
+        num_piece = int(np.ceil(trial_dur/5))
+        for piece_idx in range(num_piece):
+            piece_dur = min(5.0, trial_dur - 5*piece_idx)
+            num_samp = int(piece_dur*2000)
+            trial_data = {key: rng.normal(size=num_samp) for key in DEVICE_KEYS + SAMPLE_KEYS}
+            trial_data.update({key: [t + rng.uniform()] if piece_idx == num_piece-1 else [] for key in STATE_KEYS})
+            trial_data['right_cal_matrix'] = rng.normal(size=(3,2)) if piece_idx == 0 else []
+            trial_data['left_cal_matrix'] = rng.normal(size=(3,2)) if piece_idx == 0 else []
+            trial_data['tgt_idx'] = [int(rng.integers(8))] if piece_idx == 0 else []
+            yield t, trial_num, trial_data, piece_idx
+            t += piece_dur
+
+def report(name, msg_t, msg_piece, save_time):
+    msg_t = np.array(msg_t)
+    save_time = np.array(save_time)*1e3
+    msg_piece = np.array(msg_piece)
+    bins = [np.mean(save_time[(msg_t >= start) & (msg_t < start+1200)]) for start in range(0, 7200, 1200)]
+    pieces = [np.mean(save_time[msg_piece == piece]) for piece in range(6)]
+    print('{}: mean ms/message per 20 min: {}'.format(name, ' '.join('{:6.2f}'.format(b) for b in bins)))
+    print('{}: mean ms/message by 5 s piece of long trials: {}'.format(name, ' '.join('{:6.2f}'.format(p) for p in pieces)))
+
+if __name__ == '__main__':
+    session_dur = 2*3600
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        old_path = os.path.join(tmp_dir, 'old')
+        new_path = os.path.join(tmp_dir, 'new')
+        writer = TrialWriter(new_path + '.hdf5')
+        result = {'old': ([], [], []), 'new': ([], [], [])}
+        for t, trial_num, trial_data, piece_idx in session_messages(np.random.default_rng(0), session_dur):
+            for name in ('old', 'new'):
+                start = time.perf_counter()
+                if name == 'old':
+                    old_save_data(old_path, trial_num, dict(trial_data))
+                else:
+                    writer.write_trial(trial_num, trial_data)
+                save_time = time.perf_counter() - start
+                result[name][0].append(t)
+                result[name][1].append(piece_idx)
+                result[name][2].append(save_time)
+        writer.close()
+        print('{} trials, {} messages'.format(trial_num, len(result['new'][0])))
+        for name in ('old', 'new'):
+            report(name, *result[name])
+        # Same data; old files flatten calibration matrices of trials with more than one message
+        mismatch = 0
+        with h5py.File(old_path + '.hdf5','r') as old_file, h5py.File(new_path + '.hdf5','r') as new_file:
+            for trial_key in old_file:
+                for data_key in old_file[trial_key]:
+                    mismatch += not np.array_equal(old_file[trial_key][data_key][()].ravel(), new_file[trial_key][data_key][()].ravel())
+        print('mismatched datasets: {}'.format(mismatch))
+        print('file size: old {:.0f} MB, new {:.0f} MB'.format(os.path.getsize(old_path + '.hdf5')/1e6, os.path.getsize(new_path + '.hdf5')/1e6))
@@ -0,0 +1,68 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+"""
+import numpy as np
+
+class CalTransform():
+    '''
+    calibration transform from raw VPixx data to screen values in degrees.
+    Build once when calibration is loaded (or changed) instead of calling 'raw_to_deg'
+    on every sample; results are bit-identical to 'app_lib.raw_to_deg' since the same
+    matrix product is computed, but without converting the matrix or allocating arrays
+    on every call.
+    '''
+    def __init__(self, cal_matrix):
+        '''
+        Arguments:
+            cal_matrix - [[c1,c2,0],[c3,c4,0],[c5,c6,1]]
+                         where c5 is x bias and c6 is y bias
+        '''
+        self.raw_data = np.ones(3) # [raw x, raw y, 1]
+        self.deg_data = np.empty(3)
+        self.deg_pos = self.deg_data[0:2] # view returned by 'apply'
+        self.cal_matrix = np.empty((3,3))
+        self.update(cal_matrix)
+
+    def update(self, cal_matrix):
+        '''
+        rebuilds transform in place with a new calibration matrix
+        Arguments:
+            cal_matrix - [[c1,c2,0],[c3,c4,0],[c5,c6,1]] (list or np.array)
+        '''
+        cal_matrix = np.array(cal_matrix, dtype=float)
+        if cal_matrix.shape != (3,3):
+            raise ValueError('calibration matrix must be 3x3')
+        self.cal_matrix[:] = cal_matrix
+
+    def apply(self, x, y):
+        '''
+        converts a single raw sample
+        Arguments:
+            x, y - raw x and y (float)
+        Returns:
+            deg_pos - x and y in degrees (np.array view; overwritten by next call) where
+                      x is c1*x_raw + c3*y_raw + c5 and
+                      y is c2*x_raw + c4*y_raw + c6
+        '''
+        self.raw_data[0] = x
+        self.raw_data[1] = y
+        np.matmul(self.raw_data, self.cal_matrix, out=self.deg_data)
+        return self.deg_pos
+
+    def apply_batch(self, raw_xy):
+        '''
+        converts many raw samples at once, e.g., 2000 Hz 'eye_rx_raw_data'/'eye_ry_raw_data'
+        Arguments:
+            raw_xy - raw data with x in 1st and y in 2nd column (Nx2 array-like)
+        Returns:
+            deg_xy - x and y in degrees (Nx2 np.array)
+        '''
+        raw_xy = np.asarray(raw_xy, dtype=float)
+        if raw_xy.ndim != 2 or raw_xy.shape[1] != 2:
+            raise ValueError('raw data must be Nx2')
+        raw_data = np.empty((raw_xy.shape[0],3))
+        raw_data[:,0:2] = raw_xy
+        raw_data[:,2] = 1
+        deg_data = raw_data @ self.cal_matrix
+        return deg_data[:,0:2]
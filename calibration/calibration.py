@@ -17,22 +17,24 @@ from pypixxlib._libdpx import DPxOpen, TPxSetupTPxSchedule,TPxEnableFreeRun,DPxS
 from fsm_gui import FsmGui
 from target import TargetWidget
 import app_lib as lib
+from parameter_store import set_parameter
+from sound import ToneBank
 
-import multiprocessing, sys, os, json, random, time, copy, ctypes, math, zmq
+import multiprocessing, sys, os, random, time, copy, ctypes, math, zmq
 sys.path.append('../app')
 from pathlib import Path
 import numpy as np
 import pyqtgraph as pg
 
 class CalFsmProcess(multiprocessing.Process):
-    def __init__(self, exp_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array, main_parameter, mon_parameter):
+    def __init__(self, exp_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring, main_parameter, mon_parameter):
         super().__init__()
         self.exp_name = exp_name
         self.fsm_to_gui_sndr = fsm_to_gui_sndr
         self.gui_to_fsm_rcvr = gui_to_fsm_rcvr
         self.stop_exp_Event = stop_exp_Event
         self.stop_fsm_process_Event = stop_fsm_process_Event
-        self.real_time_data_Array = real_time_data_Array
+        self.real_time_data_ring = real_time_data_ring
         self.main_parameter = main_parameter
         self.mon_parameter = mon_parameter
         # Init var.
@@ -56,6 +58,9 @@ class CalFsmProcess(multiprocessing.Process):
         # Make targets
         self.update_target()
         
+        # Synthesize beeps once; played from a separate thread
+        self.tone_bank = ToneBank([(1000,0.1),(2000,0.1)])
+        
         # Check if VPixx available; if so, open
         DPxOpen()
         tracker.TRACKPixx3().open() # this throws error if not device not open           
@@ -142,7 +147,7 @@ class CalFsmProcess(multiprocessing.Process):
                                 state_start_time = self.t
                                 state_inter_time = self.t                   
                                 state = 'CUE_TARGET_PRESENT'
-                            lib.playSound(1000,0.1) # neutral beep
+                            self.tone_bank.play(1000,0.1) # neutral beep
                             
                         if state == 'STR_TARGET_PURSUIT':
                             if cal_parameter['is_pursuit_tgt']:
@@ -168,20 +173,16 @@ class CalFsmProcess(multiprocessing.Process):
                             if (self.t-state_start_time) >= cal_parameter['ITI']:
                                 break # move onto next target
                                 
-                        # Update shared real time data
-                        with self.real_time_data_Array.get_lock():
-                            self.real_time_data_Array[0] = self.tgt_num
-                            self.real_time_data_Array[1] = self.t
-                            self.real_time_data_Array[2] = self.eye_raw_x
-                            self.real_time_data_Array[3] = self.eye_raw_y
+                        # Publish every sample to GUI process
+                        self.real_time_data_ring.write((self.tgt_num, self.t, self.eye_raw_x, self.eye_raw_y))
                 
                 # Signal completion, only if not already manually stopped
                 if run_exp: 
                     self.fsm_to_gui_sndr.send(('fsm_done',0))
                 self.t = math.nan
-                self.real_time_data_Array[1] = self.t
                 run_exp = False
                 self.stop_exp_Event.set()
+        self.tone_bank.close()
         # Close PsychoPy
         core.quit()
         # Turn off VPixx schedule
@@ -204,13 +205,13 @@ class CalFsmProcess(multiprocessing.Process):
         self.window.clearBuffer() # clear the back buffer of previously drawn stimuli - Poth, 2018
                 
 class CalGui(FsmGui):
-    def __init__(self,exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array,main_parameter):
+    def __init__(self,exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring,main_parameter):
         self.exp_name = exp_name
         self.fsm_to_gui_rcvr = fsm_to_gui_rcvr
         self.gui_to_fsm_sndr = gui_to_fsm_sndr
         self.stop_exp_Event = stop_exp_Event
         self.stop_fsm_process_Event = stop_fsm_process_Event
-        self.real_time_data_Array = real_time_data_Array
+        self.real_time_data_ring = real_time_data_ring
         self.main_parameter = main_parameter
         super(CalGui,self).__init__(self.stop_fsm_process_Event)
         self.init_gui()
@@ -467,8 +468,6 @@ class CalGui(FsmGui):
     @pyqtSlot()
     def save_QPushButton_clicked(self):
         try:
-            with open(self.parameter_file_path,'r') as file:
-                all_parameter = json.load(file)
             self.cal_parameter['start_x'] = self.tgt_widgets_dict['tgt_5_horz_QDoubleSpinBox'].value()
             self.cal_parameter['start_y'] = self.tgt_widgets_dict['tgt_5_vert_QDoubleSpinBox'].value()
             self.cal_parameter['pursuit_amp'] = self.pursuit_amp_QDoubleSpinBox.value()
@@ -482,9 +481,7 @@ class CalGui(FsmGui):
                 self.cal_parameter['tgt_'+str(tgt_num)] = [self.tgt_widgets_dict['tgt_'+str(tgt_num)+'_horz_QDoubleSpinBox'].value(),
                                                            self.tgt_widgets_dict['tgt_'+str(tgt_num)+'_vert_QDoubleSpinBox'].value(),
                                                            self.tgt_widgets_dict['tgt_'+str(tgt_num)+'_QCheckBox'].isChecked()]
-            all_parameter[self.main_parameter['current_monkey']][self.exp_name] = self.cal_parameter    
-            with open(self.parameter_file_path,'w') as file:
-                json.dump(all_parameter, file, indent=4)   
+            set_parameter(self.parameter_file_path, self.cal_parameter, self.main_parameter['current_monkey'], self.exp_name)
             self.log_QPlainTextEdit.appendPlainText('Saved calibration along with parameters')
         except Exception as e:
             self.log_QPlainTextEdit.appendPlainText('Calibration save failed')
@@ -495,19 +492,18 @@ class CalGui(FsmGui):
         '''
         getting data from fsm process
         '''   
-        with self.real_time_data_Array.get_lock():
-            tgt_num = int(self.real_time_data_Array[0])   
-            t = self.real_time_data_Array[1]
-            eye_raw_x = self.real_time_data_Array[2]
-            eye_raw_y = self.real_time_data_Array[3]
-        if not math.isnan(t):
+        # All samples since last tick
+        real_time_data = self.real_time_data_ring.read()
+        for tgt_num, t, eye_raw_x, eye_raw_y in real_time_data.tolist():
+            tgt_num = int(tgt_num)
             self.data_dict['eye_raw_x_tgt_'+str(tgt_num)].append(eye_raw_x)
             self.data_dict['eye_raw_y_tgt_'+str(tgt_num)].append(eye_raw_y)
             self.data_dict['t_abs_tgt_'+str(tgt_num)].append(t)
             self.data_dict['t_tgt_'+str(tgt_num)].append(\
                     self.data_dict['t_abs_tgt_'+str(tgt_num)][-1] - 
                     self.data_dict['t_abs_tgt_'+str(tgt_num)][0])
-            # Plot data
+        if len(real_time_data):
+            # Plot data of latest target
             self.plot_1_dict['tgt_'+str(tgt_num)].\
                 setData(np.array(self.data_dict['eye_raw_x_tgt_'+str(tgt_num)]),np.array(self.data_dict['eye_raw_y_tgt_'+str(tgt_num)]))
             self.plot_1_dict['active'].\
@@ -1007,18 +1003,18 @@ class CalGui(FsmGui):
         self.save_QPushButton.setEnabled(True)
            
 class CalGuiProcess(multiprocessing.Process):
-    def __init__(self, exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array,main_parameter,parent=None):
+    def __init__(self, exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring,main_parameter,parent=None):
         super(CalGuiProcess,self).__init__(parent)
         self.exp_name = exp_name
         self.fsm_to_gui_rcvr = fsm_to_gui_rcvr
         self.gui_to_fsm_sndr = gui_to_fsm_sndr
         self.stop_exp_Event = stop_exp_Event
-        self.real_time_data_Array = real_time_data_Array
+        self.real_time_data_ring = real_time_data_ring
         self.stop_fsm_process_Event = stop_fsm_process_Event
         self.main_parameter = main_parameter
     def run(self):  
         fsm_app = QApplication(sys.argv)
-        fsm_app_gui = CalGui(self.exp_name, self.fsm_to_gui_rcvr, self.gui_to_fsm_sndr, self.stop_exp_Event, self.stop_fsm_process_Event, self.real_time_data_Array, self.main_parameter)
+        fsm_app_gui = CalGui(self.exp_name, self.fsm_to_gui_rcvr, self.gui_to_fsm_sndr, self.stop_exp_Event, self.stop_fsm_process_Event, self.real_time_data_ring, self.main_parameter)
         fsm_app_gui.setWindowIcon(QtGui.QIcon(os.path.join('.', 'icon', 'experiment_window.png')))
         fsm_app_gui.show()
         sys.exit(fsm_app.exec())
@@ -17,23 +17,26 @@ from pypixxlib._libdpx import DPxOpen, TPxSetupTPxSchedule,TPxEnableFreeRun,DPxS
 from fsm_gui import FsmGui
 from target import TargetWidget
 import app_lib as lib
+from parameter_store import set_parameter, update_parameter_file
+from eye_velocity import VelocityEstimator
+from cal_transform import CalTransform
+from sound import ToneBank
 
-import multiprocessing, sys, os, json, random, time, copy, ctypes, math, zmq
+import multiprocessing, sys, os, random, time, copy, ctypes, math, zmq
 sys.path.append('../app')
 from pathlib import Path
 import numpy as np
-from collections import deque
 import pyqtgraph as pg
 
 class CalRefineFsmProcess(multiprocessing.Process):
-    def __init__(self,  exp_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array, main_parameter, mon_parameter):
+    def __init__(self,  exp_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring, main_parameter, mon_parameter):
         super().__init__()
         self.exp_name = exp_name
         self.fsm_to_gui_sndr = fsm_to_gui_sndr
         self.gui_to_fsm_rcvr = gui_to_fsm_rcvr
         self.stop_exp_Event = stop_exp_Event
         self.stop_fsm_process_Event = stop_fsm_process_Event
-        self.real_time_data_Array = real_time_data_Array
+        self.real_time_data_ring = real_time_data_ring
         self.main_parameter = main_parameter
         self.mon_parameter = mon_parameter
         # Init var.
@@ -57,6 +60,9 @@ class CalRefineFsmProcess(multiprocessing.Process):
         # Make targets
         self.update_target()
         
+        # Synthesize beeps once; played from a separate thread
+        self.tone_bank = ToneBank([(1000,0.1),(2000,0.1)])
+        
         # Check if VPixx available; if so, open
         DPxOpen()
         tracker.TRACKPixx3().open() # this throws error if not device not open           
@@ -80,11 +86,12 @@ class CalRefineFsmProcess(multiprocessing.Process):
                 # Load exp parameter
                 fsm_parameter, parameter_file_path = lib.load_parameter('calibration','cal_parameter.json',True,True,self.set_default_parameter,self.exp_name,self.main_parameter['current_monkey'])
                 cal_parameter, _ = lib.load_parameter('calibration','cal_parameter.json',True,True,lib.set_default_cal_parameter, 'calibration',self.main_parameter['current_monkey'])
+                # Build calibration transforms once; rebuilt whenever calibration is reloaded
+                right_cal = CalTransform(cal_parameter['right_cal_matrix'])
+                left_cal = CalTransform(cal_parameter['left_cal_matrix'])
                 # Init. var
                 vel_samp_num = 3
-                vel_t_data = deque(maxlen=vel_samp_num)
-                eye_x_data = deque(maxlen=vel_samp_num)
-                eye_y_data = deque(maxlen=vel_samp_num)
+                eye_vel_estimator = VelocityEstimator(vel_samp_num,'mean_diff')
                 eye_pos = [0,0]
                 eye_vel = [0,0]
                 eye_speed = 0.0
@@ -128,18 +135,14 @@ class CalRefineFsmProcess(multiprocessing.Process):
                         if cal_parameter['which_eye_tracked'] == 'Right':
                             if not right_eye_blink:
                                 eye_blink = False
-                                raw_data_right = [raw_data[0], raw_data[1],1] # [(animal's) right x, right y (pink), left x, left y (cyan)]
-                                eye_pos = lib.raw_to_deg(raw_data_right,cal_parameter['right_cal_matrix'])
+                                eye_pos = right_cal.apply(raw_data[0], raw_data[1]) # [(animal's) right x, right y (pink), left x, left y (cyan)]
                                 self.eye_x = eye_pos[0]
                                 self.eye_y = eye_pos[1]
                                 # Compute eye velocity
-                                vel_t_data.append(self.t)
-                                eye_x_data.append(self.eye_x)
-                                eye_y_data.append(self.eye_y)
-                                if len(vel_t_data)==vel_samp_num:
-                                    eye_vel[0] = np.mean(np.diff(eye_x_data)/np.diff(vel_t_data))
-                                    eye_vel[1] = np.mean(np.diff(eye_y_data)/np.diff(vel_t_data))
-                                    eye_speed = np.sqrt(eye_vel[0]**2 + eye_vel[1]**2)
+                                eye_vel_estimator.update(self.t, self.eye_x, self.eye_y)
+                                eye_vel[0] = eye_vel_estimator.vel_x
+                                eye_vel[1] = eye_vel_estimator.vel_y
+                                eye_speed = eye_vel_estimator.speed
                             else:
                                 eye_blink = True
                                 self.eye_x = 9999 # invalid values; more stable than nan values for plotting purposes in pyqtgraph
@@ -147,18 +150,14 @@ class CalRefineFsmProcess(multiprocessing.Process):
                         else:
                             if not left_eye_blink:
                                 eye_blink = False
-                                raw_data_left = [raw_data[2], raw_data[3],1] # [(animal's) right x, right y (pink), left x, left y (cyan)]
-                                eye_pos = lib.raw_to_deg(raw_data_left,cal_parameter['left_cal_matrix'])
+                                eye_pos = left_cal.apply(raw_data[2], raw_data[3]) # [(animal's) right x, right y (pink), left x, left y (cyan)]
                                 self.eye_x = eye_pos[0]
                                 self.eye_y = eye_pos[1]
                                 # Compute eye velocity
-                                vel_t_data.append(self.t)
-                                eye_x_data.append(self.eye_x)
-                                eye_y_data.append(self.eye_y)
-                                if len(vel_t_data)==vel_samp_num:
-                                    eye_vel[0] = np.mean(np.diff(eye_x_data)/np.diff(vel_t_data))
-                                    eye_vel[1] = np.mean(np.diff(eye_y_data)/np.diff(vel_t_data))
-                                    eye_speed = np.sqrt(eye_vel[0]**2 + eye_vel[1]**2)
+                                eye_vel_estimator.update(self.t, self.eye_x, self.eye_y)
+                                eye_vel[0] = eye_vel_estimator.vel_x
+                                eye_vel[1] = eye_vel_estimator.vel_y
+                                eye_speed = eye_vel_estimator.speed
                             else:
                                 eye_blink = True
                                 self.eye_x = 9999 # invalid values; more stable than nan values for plotting purposes in pyqtgraph
@@ -173,7 +172,7 @@ class CalRefineFsmProcess(multiprocessing.Process):
                             state = 'CUE_TARGET_PRESENT'
                             
                         if state == 'CUE_TARGET_PRESENT':
-                            lib.playSound(1000,0.1) # neutral beep
+                            self.tone_bank.play(1000,0.1) # neutral beep
                             self.tgt_x = tgt_pos[0]
                             self.tgt_y = tgt_pos[1]
                             self.tgt.pos = tgt_pos
@@ -204,7 +203,7 @@ class CalRefineFsmProcess(multiprocessing.Process):
                                     state = 'DELIVER_REWARD'
                                     
                         if state == 'DELIVER_REWARD':
-                            lib.playSound(2000,0.1) # reward beep
+                            self.tone_bank.play(2000,0.1) # reward beep
                             if fsm_parameter['auto_pump']:
                                 self.fsm_to_gui_sndr.send(('pump_' + str(1),0))
                             if fsm_parameter['mode'] == 'Auto':
@@ -216,13 +215,8 @@ class CalRefineFsmProcess(multiprocessing.Process):
                         if state == 'ITI':
                             if (self.t-state_start_time) > 0.2:
                                 break # move onto next target
-                        # Update shared real time data
-                        with self.real_time_data_Array.get_lock():
-                            self.real_time_data_Array[0] = self.t
-                            self.real_time_data_Array[1] = self.eye_x
-                            self.real_time_data_Array[2] = self.eye_y
-                            self.real_time_data_Array[3] = self.tgt_x
-                            self.real_time_data_Array[4] = self.tgt_y
+                        # Publish every sample to GUI process
+                        self.real_time_data_ring.write((self.t, self.eye_x, self.eye_y, self.tgt_x, self.tgt_y))
                 # If auto mode, compute bias. Use average bias for all targets 
                 # Skip if user stopped.
                 if run_exp: 
@@ -255,9 +249,9 @@ class CalRefineFsmProcess(multiprocessing.Process):
                 if run_exp: 
                     self.fsm_to_gui_sndr.send(('fsm_done',0))
                 self.t = math.nan
-                self.real_time_data_Array[0] = self.t
                 run_exp = False
                 self.stop_exp_Event.set()
+        self.tone_bank.close()
         # Close PsychoPy
         core.quit()  
         # Turn off VPixx schedule
@@ -297,13 +291,13 @@ class CalRefineFsmProcess(multiprocessing.Process):
         return parameter
     
 class CalRefineGui(FsmGui):
-    def __init__(self, exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array,main_parameter):
+    def __init__(self, exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring,main_parameter):
         self.exp_name = exp_name
         self.fsm_to_gui_rcvr = fsm_to_gui_rcvr
         self.gui_to_fsm_sndr = gui_to_fsm_sndr
         self.stop_exp_Event = stop_exp_Event
         self.stop_fsm_process_Event = stop_fsm_process_Event
-        self.real_time_data_Array = real_time_data_Array
+        self.real_time_data_ring = real_time_data_ring
         self.main_parameter = main_parameter
         super(CalRefineGui,self).__init__(self.stop_fsm_process_Event)       
         self.init_gui()
@@ -407,11 +401,7 @@ class CalRefineGui(FsmGui):
         self.refine_parameter['tgt_auto_list'] = self.tgt_auto_list
         self.refine_parameter['auto_pump'] = self.auto_pump_QCheckBox.isChecked()
         self.refine_parameter['min_fix_time'] = self.min_fix_time_QDoubleSpinBox.value()
-        with open(self.parameter_file_path,'r') as file:
-            all_parameter = json.load(file)
-        all_parameter[self.main_parameter['current_monkey']][self.exp_name] = self.refine_parameter  
-        with open(self.parameter_file_path,'w') as file:
-            json.dump(all_parameter, file, indent=4)   
+        set_parameter(self.parameter_file_path, self.refine_parameter, self.main_parameter['current_monkey'], self.exp_name)
         self.log_QPlainTextEdit.appendPlainText('Saved parameters')
         # If auto or test mode and no target specified, return
         cal_mode = self.cal_mode_QComboBox.currentText()
@@ -561,12 +551,10 @@ class CalRefineGui(FsmGui):
         self.cal_parameter[which_eye_tracked + '_cal_matrix'] = self.old_cal_matrix
         self.cal_parameter[which_eye_tracked + '_RMSE'] = self.new_RMSE
         
-        with open(self.parameter_file_path,'r') as file:
-            all_parameter = json.load(file)
-        all_parameter[self.main_parameter['current_monkey']][self.exp_name] = self.refine_parameter
-        all_parameter[self.main_parameter['current_monkey']]['calibration'] = self.cal_parameter  
-        with open(self.parameter_file_path,'w') as file:
-            json.dump(all_parameter, file, indent=4)   
+        def set_refine_cal_parameter(all_parameter):
+            all_parameter[self.main_parameter['current_monkey']][self.exp_name] = self.refine_parameter
+            all_parameter[self.main_parameter['current_monkey']]['calibration'] = self.cal_parameter
+        update_parameter_file(self.parameter_file_path, set_refine_cal_parameter)
             
         self.log_QPlainTextEdit.appendPlainText('Saved calibration and parameters')
     @pyqtSlot()
@@ -574,21 +562,18 @@ class CalRefineGui(FsmGui):
         '''
         start getting data from fsm thread
         '''
-        with self.real_time_data_Array.get_lock():
-            t = self.real_time_data_Array[0]
-            eye_x = self.real_time_data_Array[1]
-            eye_y = self.real_time_data_Array[2]
-            tgt_x = self.real_time_data_Array[3]
-            tgt_y = self.real_time_data_Array[4]
-        if not math.isnan(t):
-            self.eye_x_data.append(eye_x)
-            self.eye_y_data.append(eye_y)
-            self.tgt_x_data.append(tgt_x)
-            self.tgt_y_data.append(tgt_y)
-            self.t_data.append(t)
+        # All samples since last tick; Nx5 of t, eye_x, eye_y, tgt_x, tgt_y
+        real_time_data = self.real_time_data_ring.read()
+        if len(real_time_data):
+            t, eye_x, eye_y, tgt_x, tgt_y = real_time_data.T
+            self.eye_x_data.extend(eye_x)
+            self.eye_y_data.extend(eye_y)
+            self.tgt_x_data.extend(tgt_x)
+            self.tgt_y_data.extend(tgt_y)
+            self.t_data.extend(t)
             # Plot data
             self.plot_1_eye.setData(self.eye_x_data,self.eye_y_data)
-            self.plot_1_tgt.setData([tgt_x],[tgt_y])
+            self.plot_1_tgt.setData([tgt_x[-1]],[tgt_y[-1]])
             self.plot_2_eye_x.setData(self.t_data,self.eye_x_data)
             self.plot_2_eye_y.setData(self.t_data,self.eye_y_data)
             self.plot_2_tgt_x.setData(self.t_data,self.tgt_x_data)
@@ -982,18 +967,18 @@ class CalRefineGui(FsmGui):
         return parameter
     
 class CalRefineGuiProcess(multiprocessing.Process):
-    def __init__(self, exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array,main_parameter,parent=None):
+    def __init__(self, exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring,main_parameter,parent=None):
         super(CalRefineGuiProcess,self).__init__(parent)
         self.exp_name = exp_name
         self.fsm_to_gui_rcvr = fsm_to_gui_rcvr
         self.gui_to_fsm_sndr = gui_to_fsm_sndr
         self.stop_exp_Event = stop_exp_Event
-        self.real_time_data_Array = real_time_data_Array
+        self.real_time_data_ring = real_time_data_ring
         self.stop_fsm_process_Event = stop_fsm_process_Event
         self.main_parameter = main_parameter
     def run(self):  
         fsm_app = QApplication(sys.argv)
-        fsm_app_gui = CalRefineGui(self.exp_name, self.fsm_to_gui_rcvr, self.gui_to_fsm_sndr, self.stop_exp_Event, self.stop_fsm_process_Event, self.real_time_data_Array, self.main_parameter)
+        fsm_app_gui = CalRefineGui(self.exp_name, self.fsm_to_gui_rcvr, self.gui_to_fsm_sndr, self.stop_exp_Event, self.stop_fsm_process_Event, self.real_time_data_ring, self.main_parameter)
         fsm_app_gui.setWindowIcon(QtGui.QIcon(os.path.join('.', 'icon', 'experiment_window.png')))
         fsm_app_gui.show()
         sys.exit(fsm_app.exec())
@@ -7,92 +7,344 @@ from PyQt5.QtCore import QRunnable, pyqtSignal, pyqtSlot, QObject
 # VPixx related
 from pypixxlib._libdpx import DPxOpen, TPxEnableFreeRun, DPxSelectDevice, DPxUpdateRegCache, TPxDisableFreeRun, TPxSetupTPxSchedule
 
-import os
+import os, queue, time, threading, multiprocessing
 from datetime import date, datetime
 from pathlib import Path
 import numpy as np
 import h5py
-from scipy.io import savemat
+
+from trial_writer import TrialWriter, DEFAULT_STORAGE
+from session_layout import SessionWriter, is_session_layout
+from mat_export import MatExportProcess
+from trial_journal import Journal, RECORD_ATTRS, RECORD_TRIAL, JOURNAL_SYNC_INTERVAL, replay
+from session_catalog import SessionCatalog, CATALOG_FILE_NAME
+
+SAVE_QUEUE_SIZE = 64 # messages waiting to be saved; receiving pauses when full
 
 class DataManagerSignals(QObject):
     to_main_thread = pyqtSignal(object)
 
 class DataManager(QRunnable):
-    def __init__(self):
+    '''
+    saves data in a background thread ('run', started once from a QThreadPool). File
+    operations are queued with 'submit' and done in the order submitted; the queue is
+    bounded, and 'is_full' tells the receiver to stop taking messages until it has room.
+    Messages received with 'receive_*' are first written to the session's journal (see
+    trial_journal), so they are not lost if the GUI dies before they are saved
+    '''
+    def __init__(self, storage=DEFAULT_STORAGE, layout='trial', max_queue_size=SAVE_QUEUE_SIZE, journal_sync_interval=JOURNAL_SYNC_INTERVAL):
+        '''
+        Arguments:
+        storage - storage profile of trial data; see trial_writer (str or dict)
+        layout - 'trial' for a group per trial (trial_writer) or 'session' for a dataset
+                 per entry for the session (session_layout) (str)
+        max_queue_size - num. of file operations that can wait to be done (int)
+        journal_sync_interval - min. time between syncs of the journal to disk in s (float)
+        '''
         super().__init__()
         self.signals = DataManagerSignals()
 
         self.data_dir = Path(__file__).parent.resolve()
         self.data_file_path = []
-        self.trial_num = 0
-        self.trial_data = {} # dictionary of 2000 Hz data
+        Path(self.data_dir/'data').mkdir(exist_ok=True)
+        self.catalog = SessionCatalog(self.data_dir/'data'/CATALOG_FILE_NAME) # updated in the background thread
+        self.trial_writer = None # keeps the file open for the session; made in 'init_data'
+        self.storage = storage
+        self.writer_class = {'trial': TrialWriter, 'session': SessionWriter}[layout]
+        self.save_queue = queue.Queue(maxsize=max_queue_size)
+        self.convert_process = None # converts to .mat; see 'convert_data'
+        self.convert_rcvr = None
+        self.convert_ready = None # set once the file to convert is closed; see 'finish_session'
+        self.convert_file_path = None
+        self.journal = None # made in 'receive_init_data'; deleted once compacted
+        self.journal_sync_interval = journal_sync_interval
+        self.journal_trial_nums = set() # trials journaled, to check the file has them
+        self.failed_seqs = set() # journal records that failed to save, saved again when compacted
+        self.reset_metrics()
 
         self.setAutoDelete(False)
     @pyqtSlot()
     def run(self):
         '''
-        save data to a specified HDF5 file
+        do queued file operations in order, until 'stop'
         '''
+        while True:
+            task = self.save_queue.get()
+            try:
+                if task is None:
+                    break
+                func, args = task
+                start_t = time.perf_counter()
+                func(*args)
+                save_time = time.perf_counter() - start_t
+                self.metrics['num_saved'] += 1
+                self.metrics['max_save_time'] = max(self.metrics['max_save_time'], save_time)
+            except Exception as error:
+                self.signals.to_main_thread.emit(('log','Error in saving data: ' + str(error) + '.'))
+            finally:
+                self.save_queue.task_done()
 
-        data_file = h5py.File(self.data_file_path +'.hdf5','a',libver='latest')
-        trial_grp = data_file.create_group("trial_"+str(self.trial_num))
-        for key,value in self.trial_data.items():
-            trial_grp.create_dataset(key,data=self.trial_data[key])
-        data_file.close()
+    def submit(self, func, *args):
+        '''
+        queue a file operation for the background thread; waits if the queue is full
+        Arguments:
+        func - e.g., 'save_data' (method)
+        args - arguments of func
+        '''
+        self.save_queue.put((func, args))
+        self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], self.save_queue.qsize())
 
-    def save_data(self):
+    def is_full(self):
         '''
-        save data to a specified HDF5 file
+        Returns:
+        is_full - True if the next 'submit' would wait (bool); counted as backpressure
         '''
+        is_full = self.save_queue.full()
+        self.metrics['num_backpressure'] += is_full
+        return is_full
 
-        data_file = h5py.File(self.data_file_path +'.hdf5','a',libver='latest')
-        group_name = "trial_"+str(self.trial_num)
-        # If trial already exists, append data. Otherwise create new group
-        try:
-            trial_grp = data_file[group_name]
-            appended_data = {}
-            for trial_key,_ in trial_grp.items():
-                self.trial_data[trial_key] = np.append(trial_grp[trial_key][:], self.trial_data[trial_key])
-            del data_file[group_name]
-        except:
-            pass
-        finally:
-            trial_grp = data_file.create_group(group_name)
-            for key,value in self.trial_data.items():
-                trial_grp.create_dataset(key,data=self.trial_data[key])
-            data_file.close()
+    def queue_depth(self):
+        return self.save_queue.qsize()
+
+    def reset_metrics(self):
+        self.metrics = {'num_saved': 0, 'max_queue_depth': 0, 'max_save_time': 0.0, 'num_backpressure': 0}
 
-    def init_data(self, exp_name, exp_parameter):
+    def log_metrics(self):
         '''
-        initialize data file for the session and exp. parameters
+        Returns:
+        text - one line summary of the save queue since the last reset (str)
+        '''
+        return 'Saving; {} operations, max. queue depth {}/{}, max. save time {:.1f} ms, receiving paused for {} timer ticks'.format(
+            self.metrics['num_saved'], self.metrics['max_queue_depth'], self.save_queue.maxsize,
+            self.metrics['max_save_time']*1e3, self.metrics['num_backpressure'])
+
+    def drain(self):
+        '''
+        wait until everything submitted so far is saved; not for the GUI thread, which polls
+        'is_saved' instead
+        '''
+        self.save_queue.join()
+
+    def is_saved(self):
+        '''
+        Returns:
+        is_saved - True if everything submitted so far is saved (bool)
+        '''
+        with self.save_queue.all_tasks_done:
+            return self.save_queue.unfinished_tasks == 0
+
+    def stop(self):
+        '''
+        save what is queued, end the background thread, compact the journal and close the
+        file; waits for the .mat conversion if running
+        '''
+        self.save_queue.put(None)
+        self.save_queue.join()
+        self.compact_journal()
+        if self.trial_writer is not None:
+            self.trial_writer.close()
+        if self.convert_process is not None:
+            self.convert_process.join()
+
+    def receive_trial_data(self, trial_num, trial_data):
+        '''
+        journal trial data in the receiving thread, then queue it to be saved
+        Arguments:
+        trial_num - trial number (int)
+        trial_data - dictionary of trial data
+        '''
+        seq = None
+        if self.journal is not None:
+            seq = self.journal.append(RECORD_TRIAL, (trial_num, trial_data))
+            self.journal_trial_nums.add(trial_num)
+        self.submit(self.save_data, trial_num, trial_data, seq)
+
+    def receive_attrs(self, attrs):
+        '''
+        journal session attributes in the receiving thread, then queue them to be saved
+        Arguments:
+        attrs - dictionary of attributes
+        '''
+        seq = None if self.journal is None else self.journal.append(RECORD_ATTRS, attrs)
+        self.submit(self.set_attrs, attrs, seq)
+
+    def receive_init_data(self, exp_name, exp_parameter):
+        '''
+        start the journal of a new session in the receiving thread, then queue making its
+        data file
         Arguments:
         exp_name - name of the experiment (str)
         exp_parameter - dictionary of parameters
         '''
+        if self.journal is not None: # previous session was not stopped; compacted once its data is saved
+            self.submit(self.compact_journal, self.journal, self.journal_trial_nums)
         data_dir_full_path = Path(self.data_dir/'data'/date.today().strftime("%Y-%m-%d"))
         data_dir_full_path.mkdir(parents=True,exist_ok=True)
+        # Journals are deleted once compacted, so any left are from sessions that crashed
+        for journal_path in sorted(Path(self.data_dir/'data').glob('*/*.journal')):
+            self.signals.to_main_thread.emit(('log','Found journal of an unfinished session "' + journal_path.name +
+                                              '"; recover it with "python trial_journal.py <journal file>"'))
         data_file_name = exp_name + '_' + datetime.now().strftime("%H%M%S")
         self.data_file_path = os.path.join(data_dir_full_path, data_file_name)
-        data_file = h5py.File(self.data_file_path+'.hdf5','a',libver='latest')
-        for key,value in exp_parameter.items():
-            data_file.attrs[key] = value
-        data_file.attrs['computer'] = os.getlogin()
-        data_file.close()
-        self.signals.to_main_thread.emit(('log','Saving data to "' + data_file_name+'.hdf5"'))
+        self.journal = Journal(self.data_file_path+'.journal', self.journal_sync_interval)
+        self.journal_trial_nums = set()
+        attrs = dict(exp_parameter, computer=os.getlogin())
+        seq = self.journal.append(RECORD_ATTRS, attrs)
+        self.submit(self.init_data, self.data_file_path, attrs, seq)
+
+    def save_data(self, trial_num, trial_data, seq=None):
+        '''
+        save data to a specified HDF5 file; appended in place if the trial already has data
+        (mid-trial messages)
+        Arguments:
+        trial_num - trial number (int)
+        trial_data - dictionary of trial data
+        seq - journal record of the data, if journaled (int)
+        '''
+        try:
+            self.trial_writer.write_trial(trial_num, trial_data)
+        except Exception:
+            self.failed_seqs.add(seq)
+            raise
+
+    def init_data(self, data_file_path, attrs, seq=None):
+        '''
+        initialize data file for the session and exp. parameters
+        Arguments:
+        data_file_path - full path of data file without extension (str)
+        attrs - dictionary of exp. parameters and computer name
+        seq - journal record of the attributes, if journaled (int)
+        '''
+        if self.trial_writer is not None:
+            self.trial_writer.close()
+        self.trial_writer = self.writer_class(data_file_path+'.hdf5', storage=self.storage)
+        self.set_attrs(attrs, seq)
+        self.signals.to_main_thread.emit(('log','Saving data to "' + os.path.basename(data_file_path)+'.hdf5"'))
+        self.update_catalog(self.catalog.add_session, data_file_path+'.hdf5', attrs)
+
+    def update_catalog(self, func, *args):
+        '''
+        update the session catalog; errors are logged, since saving does not depend on it
+        Arguments:
+        func - e.g., 'catalog.update' (method)
+        args - arguments of func
+        '''
+        try:
+            func(*args)
+        except Exception as error:
+            self.signals.to_main_thread.emit(('log','Error in updating session catalog: ' + str(error) + '.'))
+
+    def set_attrs(self, attrs, seq=None):
+        '''
+        add session attributes known only after start, e.g., seed of the alignment signal
+        Arguments:
+        attrs - dictionary of attributes
+        seq - journal record of the attributes, if journaled (int)
+        '''
+        try:
+            self.trial_writer.set_attrs(attrs)
+        except Exception:
+            self.failed_seqs.add(seq)
+            raise
+
+    def compact_journal(self, journal=None, journal_trial_nums=None):
+        '''
+        fold the journal into the HDF5 file once everything submitted is saved: records that
+        failed to save are saved again, the file is closed and checked to have every trial
+        journaled, and the journal is deleted. It is kept if any of this fails, to recover
+        the session with 'trial_journal.recover_session'
+        Arguments:
+        journal - journal of a session that was not stopped, compacted in the background
+                  thread; current journal if None (Journal)
+        journal_trial_nums - trials journaled in 'journal' (set)
+        Returns:
+        is_compacted - True if the journal was deleted or there was none (bool)
+        '''
+        if journal is None:
+            if self.journal is None:
+                return True
+            journal, self.journal = self.journal, None
+            journal_trial_nums = self.journal_trial_nums
+        journal.close()
+        try:
+            failed_seqs = self.failed_seqs - {None}
+            if failed_seqs:
+                replay(journal.journal_path, self.trial_writer, failed_seqs)
+            self.trial_writer.close()
+            with h5py.File(self.trial_writer.file_path,'r') as data_file:
+                if is_session_layout(data_file):
+                    saved_trial_nums = set(data_file['trial_index']['trial_num'].tolist())
+                else:
+                    saved_trial_nums = {int(key[6:]) for key in data_file.keys() if key[6:].isdigit()}
+            missing_trial_nums = journal_trial_nums - saved_trial_nums
+            if missing_trial_nums:
+                raise ValueError(str(len(missing_trial_nums)) + ' trials not in the file')
+        except Exception as error:
+            self.signals.to_main_thread.emit(('log','Error in compacting journal: ' + str(error) +
+                                              '. Kept "' + os.path.basename(journal.journal_path) + '" to recover the session.'))
+            return False
+        finally:
+            self.failed_seqs = set()
+        os.remove(journal.journal_path)
+        return True
 
     def convert_data(self):
         '''
-        convert data from HDF5 to .mat format
-        '''
-        data_file = h5py.File(self.data_file_path +'.hdf5','a',libver='latest')
-        # Init. data var. to save
-        data_dict = {}
-        # Read attributes (exp. parameters)
-        for key,value in data_file.attrs.items():
-            data_dict[key] = value
-        # Read data
-        for trial_key,_ in data_file.items():
-            data_dict[trial_key] = {}
-            for data_key, data_value in data_file[trial_key].items():
-                data_dict[trial_key][data_key] = data_value[:]
-        savemat(self.data_file_path + '.mat',{'data':data_dict})
+        start converting data from HDF5 to .mat format in a separate process; check it with
+        'poll_conversion'. The journal is compacted and the HDF5 file closed in the background
+        thread first, so the file is complete when converted and copied; the conversion
+        process is started by 'poll_conversion' once that is done
+        '''
+        journal, self.journal = self.journal, None # a new session may start meanwhile
+        self.convert_file_path = self.data_file_path
+        self.convert_ready = threading.Event()
+        self.submit(self.finish_session, journal, self.journal_trial_nums, self.convert_file_path, self.convert_ready)
+
+    def finish_session(self, journal, journal_trial_nums, data_file_path, ready):
+        '''
+        compact the journal, close the HDF5 file and index it in the catalog; done in the
+        background thread before the file is converted
+        Arguments:
+        journal - journal of the session; None if there is none (Journal)
+        journal_trial_nums - trials journaled (set)
+        data_file_path - full path of data file without extension (str)
+        ready - set when done, even if it failed (threading.Event)
+        '''
+        try:
+            if journal is not None:
+                self.compact_journal(journal, journal_trial_nums)
+            self.trial_writer.close()
+            self.update_catalog(self.catalog.update, data_file_path+'.hdf5')
+        finally:
+            ready.set()
+
+    def poll_conversion(self):
+        '''
+        Returns:
+        msg_list - messages from the conversion process since last call (list); see mat_export.
+                   Ends with ('done', ...) or ('error', ...) when finished
+        '''
+        msg_list = []
+        if self.convert_ready is not None:
+            if not self.convert_ready.is_set():
+                return msg_list
+            self.convert_ready = None
+            self.convert_rcvr, convert_sndr = multiprocessing.Pipe(duplex=False)
+            self.convert_process = MatExportProcess(self.convert_file_path+'.hdf5', self.convert_file_path+'.mat', convert_sndr)
+            self.convert_process.start()
+            convert_sndr.close() # so the receiver sees the end if the process dies
+        if self.convert_rcvr is None:
+            return msg_list
+        try:
+            # Stop at the last message; the pipe is at its end after it
+            while (not msg_list or msg_list[-1][0] == 'progress') and self.convert_rcvr.poll():
+                msg_list.append(self.convert_rcvr.recv())
+        except EOFError:
+            msg_list.append(('error','conversion process ended unexpectedly'))
+        if msg_list and msg_list[-1][0] == 'done':
+            self.submit(self.update_catalog, self.catalog.update_mat, msg_list[-1][1])
+        if msg_list and msg_list[-1][0] in ('done','error'):
+            self.convert_process.join()
+            self.convert_rcvr.close()
+            self.convert_rcvr = None
+        return msg_list
@@ -0,0 +1,79 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+"""
+# VPixx related
+from pypixxlib._libdpx import DPxSetDoutValue, DPxUpdateRegCache
+
+# Digital out channels of the rig; name: (bit, default value)
+DOUT_CHANNELS = {
+                'pd': (0, 1), # ch. 1, nominal PD
+                'random': (2, 0), # ch. 3, random signal for alignment
+                'led': (4, 1) # ch. 5, LED
+                }
+
+class DoutChannels():
+    '''
+    owns the VPixx digital out word. Channels are set by name; the word is only
+    written to the device when it changed since the last write.
+    'write' only sets the register, which is sent with the next 'DPxUpdateRegCache',
+    e.g., the one called by 'TPxBestPolyGetEyePosition' every sample; 'flush' sends it
+    immediately, e.g., for PD/LED changes that have to line up with a screen flip.
+    '''
+    def __init__(self, channels=DOUT_CHANNELS, bit_mask=0xffffff, update_reg_cache=DPxUpdateRegCache):
+        '''
+        Arguments:
+            channels - name: (bit, default value) of each channel (dict)
+            bit_mask - bits of digital out that can be written (int)
+            update_reg_cache - function to send registers to device (function)
+        '''
+        self.bit = {name: 1 << bit for name, (bit, _) in channels.items()}
+        self.default = {name: value for name, (_, value) in channels.items()}
+        self.bit_mask = bit_mask
+        self.update_reg_cache = update_reg_cache
+        self.word = 0
+        self.written_word = None # unknown until first write
+
+    def set(self, name, value):
+        '''
+        Arguments:
+            name - channel name (str)
+            value - 0 or 1 (int or bool)
+        '''
+        if value:
+            self.word |= self.bit[name]
+        else:
+            self.word &= ~self.bit[name]
+
+    def get(self, name):
+        return int(bool(self.word & self.bit[name]))
+
+    def reset(self):
+        '''
+        sets all channels to their default values; call 'flush' to send
+        '''
+        for name, value in self.default.items():
+            self.set(name, value)
+
+    def write(self):
+        '''
+        sets digital out register if the word changed
+        Returns:
+            written - whether the register was set (bool)
+        '''
+        if self.word == self.written_word:
+            return False
+        DPxSetDoutValue(self.word, self.bit_mask)
+        self.written_word = self.word
+        return True
+
+    def flush(self):
+        '''
+        sets digital out register and sends it to device right away if the word changed
+        Returns:
+            written - whether the register was set (bool)
+        '''
+        if self.write():
+            self.update_reg_cache() # calling this delays fsm by ~0.25 ms
+            return True
+        return False
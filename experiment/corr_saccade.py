@@ -11,30 +11,63 @@ from psychopy import monitors, visual, core
 # VPixx related
 from pypixxlib import tracker
 from pypixxlib._libdpx import DPxOpen, TPxSetupTPxSchedule,TPxEnableFreeRun,DPxSelectDevice,DPxUpdateRegCache, DPxSetTPxAwake,\
-                              TPxDisableFreeRun, DPxGetReg16,DPxGetTime,TPxBestPolyGetEyePosition, DPxSetDoutValue, TPxReadTPxData,\
+                              TPxDisableFreeRun, DPxGetReg16,DPxGetTime,TPxBestPolyGetEyePosition, TPxReadTPxData,\
                               DPxSetTPxSleep, DPxClose
 
 from fsm_gui import FsmGui
 from target import TargetWidget
 import app_lib as lib
+from parameter_store import set_parameter, parameter_file_changed
+from eye_velocity import VelocityEstimator
+from cal_transform import CalTransform
+from fsm_engine import StateMachine
+from trial_recorder import TrialRecorder
+from tpx_data import TPX_FIELD_IDX, tpx_columns
+from loop_timer import LoopTiming
+from dout_channel import DoutChannels, DOUT_CHANNELS
+from align_signal import AlignSignal
+from trial_schedule import TrialSchedule
+from target_geometry import corr_target_pos
+from gaze_window import CircleWindow, DirectionWindow
+from sound import ToneBank
+from render_loop import Scene, RenderLoop
 from data_manager import DataManager
 
-import multiprocessing, sys, os, json, random, time, copy, ctypes, traceback, gc, zmq, math
+import multiprocessing, threading, sys, os, time, copy, ctypes, traceback, gc, zmq, math
 sys.path.append('../app')
 from pathlib import Path
 import numpy as np
-from collections import deque
 from datetime import datetime
 
+# 2000 Hz data saved with each trial; (trial data key, field in 'TPxReadTPxData' buffer)
+DEVICE_DATA_FIELDS = (('device_time_data','time'),
+                      ('eye_lx_raw_data','eye_lx_raw'),
+                      ('eye_ly_raw_data','eye_ly_raw'),
+                      ('eye_l_pupil_data','eye_l_pupil'),
+                      ('eye_l_blink_data','eye_l_blink'),
+                      ('eye_rx_raw_data','eye_rx_raw'),
+                      ('eye_ry_raw_data','eye_ry_raw'),
+                      ('eye_r_pupil_data','eye_r_pupil'),
+                      ('eye_r_blink_data','eye_r_blink'),
+                      ('din_data','din'),
+                      ('dout_data','dout'))
+DEVICE_DATA_IDX = [TPX_FIELD_IDX[field] for _,field in DEVICE_DATA_FIELDS]
+
+# FSM states
+STATE_NAMES = ('INIT','STR_TARGET_PURSUIT','STR_TARGET_PRESENT','STR_TARGET_FIXATION','CUE_TARGET_PRESENT','DETECT_SACCADE_START',
+               'SACCADE','DETECT_SACCADE_END','DELIVER_REWARD','END_TARGET_FIXATION','INCORRECT_SACCADE','TRIAL_SUCCESS')
+INIT, STR_TARGET_PURSUIT, STR_TARGET_PRESENT, STR_TARGET_FIXATION, CUE_TARGET_PRESENT, DETECT_SACCADE_START,\
+SACCADE, DETECT_SACCADE_END, DELIVER_REWARD, END_TARGET_FIXATION, INCORRECT_SACCADE, TRIAL_SUCCESS = range(len(STATE_NAMES))
+
 class CorrSacFsmProcess(multiprocessing.Process):
-    def __init__(self,exp_name, fsm_to_gui_sndr, gui_to_fsm_Q, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array,main_parameter,mon_parameter):
+    def __init__(self,exp_name, fsm_to_gui_sndr, gui_to_fsm_Q, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring,main_parameter,mon_parameter):
         super().__init__()
         self.exp_name = exp_name
         self.fsm_to_gui_sndr = fsm_to_gui_sndr
         self.gui_to_fsm_Q = gui_to_fsm_Q
         self.stop_exp_Event = stop_exp_Event
         self.stop_fsm_process_Event = stop_fsm_process_Event
-        self.real_time_data_Array = real_time_data_Array
+        self.real_time_data_ring = real_time_data_ring
         self.main_parameter = main_parameter
         self.mon_parameter = mon_parameter
         # Init var.
@@ -48,6 +81,9 @@ class CorrSacFsmProcess(multiprocessing.Process):
         self.cue_y = 0
         self.t = math.nan
         self.pull_data_t = 0 # keep track of when data was pulled last from VPixx
+        self.recorder = None # trial data; allocated once in 'init_trial_data'
+        self.schedule = None # order of targets; made in 'set_schedule'
+        self.num_schedule = 0 # num. of schedules made after parameters were reloaded
     
     def run(self):
         # Set up exp. screen
@@ -61,6 +97,32 @@ class CorrSacFsmProcess(multiprocessing.Process):
         # Make targets
         self.update_target()
         
+        # Synthesize beeps once; played from a separate thread
+        self.tone_bank = ToneBank([(1000,0.1),(2000,0.1)])
+        
+        # Sample tracker and run FSM in a separate thread so that it never waits for vsync;
+        # this (main) thread only renders, since the window can only be drawn from the thread that created it
+        sys.setswitchinterval(0.0005) # hand over between the two threads quickly
+        self.scene = Scene()
+        self.render_loop = RenderLoop(self.window, self.scene, self.draw_scene)
+        fsm_thread = threading.Thread(target=self.run_fsm)
+        fsm_thread.start()
+        try:
+            self.render_loop.run(fsm_thread.is_alive)
+        finally:
+            # If rendering failed, stop the FSM thread too, so the process can end
+            self.stop_fsm_process_Event.set()
+            fsm_thread.join()
+        
+        self.tone_bank.close()
+        # Close PsychoPy
+        core.quit()
+    
+    def run_fsm(self):
+        '''
+        samples tracker and runs FSM at full rate; target changes are set in 'self.scene'
+        and drawn by the render loop
+        '''
         # Check if VPixx available; if so, open
         DPxOpen()
         tracker.TRACKPixx3().open() # this throws error if not device not open           
@@ -72,10 +134,26 @@ class CorrSacFsmProcess(multiprocessing.Process):
         cal_data, raw_data = lib.VPixx_get_pointers_for_data()
              
         # Init. var.
-        random_signal_flip_duration = 0.015 # in sec., how often to flip random signal
+        align_signal_flip_duration = 0.015 # in sec., how often to flip random signal
+        loop_deadline = 0.001 # in sec., FSM iterations longer than this are counted as misses in loop timing
         bitMask = 0xffffff # for VPixx digital out, in hex bit
-        DPxSetDoutValue(0, bitMask)
-        DPxUpdateRegCache()
+        self.dout = DoutChannels(DOUT_CHANNELS, bitMask) # all channels start at 0
+        self.dout.flush()
+        
+        # Set up FSM; only the handler of the current state is called every sample
+        self.fsm = StateMachine(STATE_NAMES)
+        self.fsm.add_state(INIT, self.init_state)
+        self.fsm.add_state(STR_TARGET_PURSUIT, self.str_tgt_pursuit_state, on_enter=self.enter_str_tgt_pursuit, t_key='state_start_t_str_tgt_pursuit')
+        self.fsm.add_state(STR_TARGET_PRESENT, self.str_tgt_present_state, on_enter=self.enter_str_tgt_present, t_key='state_start_t_str_tgt_present')
+        self.fsm.add_state(STR_TARGET_FIXATION, self.str_tgt_fixation_state, on_enter=self.enter_str_tgt_fixation, t_key='state_start_t_str_tgt_fixation')
+        self.fsm.add_state(CUE_TARGET_PRESENT, None, on_enter=self.enter_cue_tgt_present, t_key='state_start_t_cue_tgt_present')
+        self.fsm.add_state(DETECT_SACCADE_START, self.detect_sac_start_state, t_key='state_start_t_detect_sac_start')
+        self.fsm.add_state(SACCADE, None, on_enter=self.enter_saccade, t_key='state_start_t_saccade')
+        self.fsm.add_state(DETECT_SACCADE_END, self.detect_sac_end_state, on_enter=self.enter_detect_sac_end, t_key='state_start_t_detect_sac_end')
+        self.fsm.add_state(DELIVER_REWARD, self.deliver_rew_state, t_key='state_start_t_deliver_rew')
+        self.fsm.add_state(END_TARGET_FIXATION, self.end_tgt_fixation_state, on_enter=self.enter_end_tgt_fixation, t_key='state_start_t_end_tgt_fixation')
+        self.fsm.add_state(INCORRECT_SACCADE, self.incorrect_sac_state, on_enter=self.enter_incorrect_sac, t_key='state_start_t_incorrect_saccade')
+        self.fsm.add_state(TRIAL_SUCCESS, self.trial_success_state, on_enter=self.enter_trial_success, t_key='state_start_t_trial_success')
         
         run_exp = False
         # Process loop
@@ -84,35 +162,53 @@ class CorrSacFsmProcess(multiprocessing.Process):
                 # Turn on VPixx schedule; this needed to collect data
                 lib.VPixx_turn_on_schedule()
                 # Update targets
-                self.update_target()
+                self.scene.call(self.update_target)
                 # Load exp parameter
-                fsm_parameter, parameter_file_path = lib.load_parameter('experiment','exp_parameter.json',True,True,CorrSacGui.set_default_parameter,self.exp_name,self.main_parameter['current_monkey'])
-                cal_parameter, _ = lib.load_parameter('calibration','cal_parameter.json',True,True,lib.set_default_cal_parameter,'calibration',self.main_parameter['current_monkey'])  
-                # Create target list
-                target_pos_list = lib.make_corr_target(fsm_parameter)
-                num_tgt_pos = len(target_pos_list)
+                self.fsm_parameter, self.parameter_file_path = lib.load_parameter('experiment','exp_parameter.json',True,True,CorrSacGui.set_default_parameter,self.exp_name,self.main_parameter['current_monkey'])
+                self.cal_parameter, _ = lib.load_parameter('calibration','cal_parameter.json',True,True,lib.set_default_cal_parameter,'calibration',self.main_parameter['current_monkey'])  
+                cal_parameter = self.cal_parameter
+                # Build calibration transforms once; rebuilt whenever calibration is reloaded
+                right_cal = CalTransform(cal_parameter['right_cal_matrix'])
+                left_cal = CalTransform(cal_parameter['left_cal_matrix'])
+                # Create target list and schedule
+                self.set_schedule()
+                self.set_windows()
+                # Loop timing (opt-in); device calls are replaced by timed versions if enabled
+                self.loop_timing = LoopTiming(self.fsm_parameter.get('loop_timing',False))
+                loop_tick = self.loop_timing.ticker('loop', loop_deadline)
+                get_eye_position = self.loop_timing.wrap('eye_position', TPxBestPolyGetEyePosition)
+                self.update_reg_cache = self.loop_timing.wrap('reg_cache', DPxUpdateRegCache)
+                flip_timer = self.render_loop.flip_timer # recorded in render thread, so reset there
+                self.loop_timing.attach(flip_timer, lambda: self.scene.call(flip_timer.reset))
+                self.play_tone = self.loop_timing.wrap('tone_request', self.tone_bank.play)
+                dispatch_timer, play_timer = self.tone_bank.dispatch_timer, self.tone_bank.play_timer
+                self.loop_timing.attach(dispatch_timer, lambda: self.tone_bank.call(dispatch_timer.reset))
+                self.loop_timing.attach(play_timer, lambda: self.tone_bank.call(play_timer.reset))
                 # Init. var
                 DPxUpdateRegCache()
                 self.t = DPxGetTime()
                 self.pull_data_t = self.t
-                random_signal_t = self.t
-                trial_num = 1
-                pump_to_use = 1 # which pump to use currently
+                # Random signal for alignment; new seed every experiment, saved with session
+                align_signal = AlignSignal(align_signal_flip_duration)
+                align_signal.start(self.t)
+                self.fsm_to_gui_sndr.send(('session_attrs', align_signal.attrs()))
+                flip_queue = self.scene.flip_queue
+                while not flip_queue.empty(): # flips of the previous experiment
+                    flip_queue.get()
+                self.trial_num = 1
+                self.pump_to_use = 1 # which pump to use currently
                 vel_samp_num = 3
-                vel_t_data = deque(maxlen=vel_samp_num)
-                eye_x_data = deque(maxlen=vel_samp_num)
-                eye_y_data = deque(maxlen=vel_samp_num)
+                eye_vel_estimator = VelocityEstimator(vel_samp_num,'mean_diff')
                 eye_pos = [0,0]
-                eye_vel = [0,0]
-                eye_speed = 0.0
+                self.eye_vel = [0,0]
+                self.eye_speed = 0.0
+                self.eye_blink = True
                 right_eye_blink = True
                 left_eye_blink = True
                 # Reset digital out
-                dout_ch_1 = 1 # nominal PD
-                dout_ch_3 = 0 # random signal
-                dout_ch_5 = 1 # LED
-                DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                DPxUpdateRegCache()
+                self.dout.update_reg_cache = self.update_reg_cache
+                self.dout.reset()
+                self.dout.flush()
                 
                 run_exp = True        
             # Trial loop
@@ -123,13 +219,13 @@ class CorrSacFsmProcess(multiprocessing.Process):
                     # Turn off VPixx schedule
                     lib.VPixx_turn_off_schedule()
                     # Remove all targets
-                    self.window.flip()
+                    self.scene.show()
                     break
                 # Init. trial variables; reset every trial
                 self.init_trial_data()  
                 self.trial_data['right_cal_matrix'] = cal_parameter['right_cal_matrix']
                 self.trial_data['left_cal_matrix'] = cal_parameter['left_cal_matrix']
-                state = 'INIT'   
+                self.fsm.start(INIT, self.t)
                 
                 # FSM loop
                 while not self.stop_fsm_process_Event.is_set() and run_exp:
@@ -139,18 +235,16 @@ class CorrSacFsmProcess(multiprocessing.Process):
                         # Turn off VPixx schedule
                         lib.VPixx_turn_off_schedule()
                         # Remove all targets
-                        self.window.flip()
+                        self.scene.show()
                         break
+                    loop_tick()
                     # Send random signal for alignment
-                    if (self.t - random_signal_t) > random_signal_flip_duration:
-                        random_signal_t = self.t
-                        if random.random() > 0.5:
-                            dout_ch_3 = 1 
-                        else:
-                            dout_ch_3 = 0
-                    DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
+                    if self.t >= align_signal.next_t:
+                        self.dout.set('random', align_signal.bit_at(self.t)) # bits missed in a stall are skipped
+                    self.dout.write() # only if changed; sent to device by the eye position read below
                     # Get time       
-                    self.t = TPxBestPolyGetEyePosition(cal_data, raw_data) # this calls 'DPxUpdateRegCache' as well
+                    self.t = get_eye_position(cal_data, raw_data) # this calls 'DPxUpdateRegCache' as well
+                    clock_offset = self.t - time.perf_counter() # to convert flip times to device time
 
                     # Get eye status (blinking)
                     eye_status = DPxGetReg16(0x59A)
@@ -158,383 +252,47 @@ class CorrSacFsmProcess(multiprocessing.Process):
                     left_eye_blink = bool(eye_status & (1 << 1)) # << 0- (animal's) right blink (pink); << 1-left blink (cyan)
                     if cal_parameter['which_eye_tracked'] == 'Right':
                         if not right_eye_blink:
-                            eye_blink = False
-                            raw_data_right = [raw_data[0], raw_data[1],1] # [(animal's) right x, right y (pink), left x, left y (cyan)]
-                            eye_pos = lib.raw_to_deg(raw_data_right,cal_parameter['right_cal_matrix'])
+                            self.eye_blink = False
+                            eye_pos = right_cal.apply(raw_data[0], raw_data[1]) # [(animal's) right x, right y (pink), left x, left y (cyan)]
                             self.eye_x = eye_pos[0]
                             self.eye_y = eye_pos[1]
                             # Compute eye velocity
-                            vel_t_data.append(self.t)
-                            eye_x_data.append(self.eye_x)
-                            eye_y_data.append(self.eye_y)
-                            if len(vel_t_data)==vel_samp_num:
-                                eye_vel[0] = np.mean(np.diff(eye_x_data)/np.diff(vel_t_data))
-                                eye_vel[1] = np.mean(np.diff(eye_y_data)/np.diff(vel_t_data))
-                                eye_speed = np.sqrt(eye_vel[0]**2 + eye_vel[1]**2)
+                            eye_vel_estimator.update(self.t, self.eye_x, self.eye_y)
+                            self.eye_vel[0] = eye_vel_estimator.vel_x
+                            self.eye_vel[1] = eye_vel_estimator.vel_y
+                            self.eye_speed = eye_vel_estimator.speed
                         else:
-                            eye_blink = True
+                            self.eye_blink = True
                             self.eye_x = 9999 # invalid values; more stable than nan values for plotting purposes in pyqtgraph
                             self.eye_y = 9999 
                     else:
                         if not left_eye_blink:
-                            eye_blink = False
-                            raw_data_left = [raw_data[2], raw_data[3],1] # [(animal's) right x, right y (pink), left x, left y (cyan)]
-                            eye_pos = lib.raw_to_deg(raw_data_left,cal_parameter['left_cal_matrix'])
+                            self.eye_blink = False
+                            eye_pos = left_cal.apply(raw_data[2], raw_data[3]) # [(animal's) right x, right y (pink), left x, left y (cyan)]
                             self.eye_x = eye_pos[0]
                             self.eye_y = eye_pos[1]
                             # Compute eye velocity
-                            vel_t_data.append(self.t)
-                            eye_x_data.append(self.eye_x)
-                            eye_y_data.append(self.eye_y)
-                            if len(vel_t_data)==vel_samp_num:
-                                eye_vel[0] = np.mean(np.diff(eye_x_data)/np.diff(vel_t_data))
-                                eye_vel[1] = np.mean(np.diff(eye_y_data)/np.diff(vel_t_data))
-                                eye_speed = np.sqrt(eye_vel[0]**2 + eye_vel[1]**2)
+                            eye_vel_estimator.update(self.t, self.eye_x, self.eye_y)
+                            self.eye_vel[0] = eye_vel_estimator.vel_x
+                            self.eye_vel[1] = eye_vel_estimator.vel_y
+                            self.eye_speed = eye_vel_estimator.speed
                         else:
-                            eye_blink = True
+                            self.eye_blink = True
                             self.eye_x = 9999 # invalid values; more stable than nan values for plotting purposes in pyqtgraph
                             self.eye_y = 9999 
                     
-                    if state == 'INIT':                     
-                        # print('state = INIT')               
-                        # Set trial parameters
-                        tgt_idx = random.randint(0,num_tgt_pos-1) # Randomly pick target
-                        start_pos = (fsm_parameter['horz_offset'], fsm_parameter['vert_offset'])
-                        self.start_x = start_pos[0]
-                        self.start_y = start_pos[1]
-                        self.trial_data['start_x'].append(self.start_x)
-                        self.trial_data['start_y'].append(self.start_y)
-                        
-                        cue_pos = np.array(target_pos_list[tgt_idx]['prim_tgt_pos']) + np.array(start_pos)
-                        self.cue_x = cue_pos[0]
-                        self.cue_y = cue_pos[1]
-                        self.trial_data['cue_x'].append(self.cue_x)
-                        self.trial_data['cue_y'].append(self.cue_y)
-                        end_pos = np.array(target_pos_list[tgt_idx]['corr_tgt_pos']) + np.array(start_pos)
-                        self.end_x = end_pos[0]
-                        self.end_y = end_pos[1]
-                        self.trial_data['end_x'].append(self.end_x)
-                        self.trial_data['end_y'].append(self.end_y)
-                        # Send target data
-                        self.fsm_to_gui_sndr.send(('tgt_data',(self.cue_x,self.cue_y,self.end_x,self.end_y)))
-                        pursuit_angle = np.random.randint(0,360)
-                        pursuit_start_x = np.cos(pursuit_angle*np.pi/180)*fsm_parameter['pursuit_amp']
-                        pursuit_start_x += self.start_x
-                        pursuit_v_x = (self.start_x - pursuit_start_x)/fsm_parameter['pursuit_dur']
-                        pursuit_start_y = np.sin(pursuit_angle*np.pi/180)*fsm_parameter['pursuit_amp']
-                        pursuit_start_y += self.start_y
-                        pursuit_v_y = (self.start_y - pursuit_start_y)/fsm_parameter['pursuit_dur']
-                        
-                        state_start_time = self.t
-                        state_inter_time = self.t
-                        self.trial_data['state_start_t_str_tgt_pursuit'].append(self.t)
-                        dout_ch_1 = 0
-                        dout_ch_5 = 0
-                        self.pd_tgt.draw()
-                        DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                        DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                        self.window.flip() 
-                        state = 'STR_TARGET_PURSUIT'
-                    
-                    if state == 'STR_TARGET_PURSUIT':
-                        pursuit_x = pursuit_v_x*(self.t-state_start_time) + pursuit_start_x
-                        pursuit_y = pursuit_v_y*(self.t-state_start_time) + pursuit_start_y  
-                        self.tgt_x = pursuit_x
-                        self.tgt_y = pursuit_y
-                        self.tgt.pos = (self.tgt_x,self.tgt_y)
-                        self.tgt.draw()
-                        self.pd_tgt.draw()
-                        self.window.flip()
-                        if (self.t-state_start_time) > fsm_parameter['pursuit_dur']:
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_str_tgt_present'].append(self.t)
-                            state = 'STR_TARGET_PRESENT'  
-                            dout_ch_1 = 1
-                            dout_ch_5 = 1
-                            self.tgt.draw()
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip()                     
-                        if self.t - self.pull_data_t > 5:
-                            self.pull_data_t = self.t
-                            self.pull_data()    
-                            # Send trial data to GUI
-                            self.fsm_to_gui_sndr.send(('trial_data',trial_num, self.trial_data))
-                            self.init_trial_data()
-                    
-                    if state == 'STR_TARGET_PRESENT':
-                        if not eye_blink:
-                            self.tgt_x = self.start_x
-                            self.tgt_y = self.start_y
-                            self.tgt.pos = (self.tgt_x,self.tgt_y)
-                            self.tgt.draw()
-                            self.window.flip()
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_str_tgt_fixation'].append(self.t)
-                            state = 'STR_TARGET_FIXATION'
-                        elif (self.t-state_start_time) >= fsm_parameter['max_wait_for_fixation']:
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_str_tgt_pursuit'].append(self.t)
-                            dout_ch_1 = 0
-                            dout_ch_5 = 0
-                            self.pd_tgt.draw()
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip() 
-                            state = 'STR_TARGET_PURSUIT'
-
-                    if state == 'STR_TARGET_FIXATION':
-                        eye_dist_from_tgt = np.sqrt((self.tgt_x-self.eye_x)**2 + (self.tgt_y-self.eye_y)**2)
-                        # If eye not available or fixating at the start target, reset the timer
-                        if eye_dist_from_tgt > fsm_parameter['rew_area']/2 or eye_blink:
-                            state_inter_time = self.t
-                        if (self.t-state_inter_time) >= fsm_parameter['min_fix_time']:
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_cue_tgt_present'].append(self.t)
-                            self.tgt_x = self.cue_x
-                            self.tgt_y = self.cue_y
-                            self.tgt.pos = (self.tgt_x,self.tgt_y)                   
-                            self.tgt.draw()
-                            self.pd_tgt.draw()
-                            dout_ch_1 = 0
-                            dout_ch_5 = 0
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip() 
-                            lib.playSound(1000,0.1) # neutral beep  
-                            state = 'CUE_TARGET_PRESENT'
-                        if (self.t-state_start_time) >= fsm_parameter['max_wait_for_fixation']:
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_str_tgt_pursuit'].append(self.t)
-                            dout_ch_1 = 0
-                            dout_ch_5 = 0
-                            self.pd_tgt.draw()
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip() 
-                            state = 'STR_TARGET_PURSUIT'  
-                    
-                    if state == 'CUE_TARGET_PRESENT':
-                        state_start_time = self.t
-                        state_inter_time = self.t
-                        self.trial_data['state_start_t_detect_sac_start'].append(self.t)
-                        state = 'DETECT_SACCADE_START'
-                    
-                    if state == 'DETECT_SACCADE_START':
-                        eye_dist_from_start_tgt = np.sqrt((self.start_x-self.eye_x)**2 + (self.start_y-self.eye_y)**2)
-                        if eye_speed >= fsm_parameter['sac_detect_threshold']:         
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_saccade'].append(self.t)
-                            state = 'SACCADE'                 
-                        # If eye moves away from start target, reset trial after punishment period
-                        elif eye_dist_from_start_tgt > fsm_parameter['rew_area']/2:
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_incorrect_saccade'].append(self.t)
-                            dout_ch_1 = 1
-                            dout_ch_5 = 1
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip() 
-                            state = 'INCORRECT_SACCADE'
-                        # If time runs out before saccade detected, play punishment sound and reset the trial
-                        elif (self.t - state_start_time) >= fsm_parameter['max_wait_for_fixation']:
-                            ######
-                            # lib.playSound(200,0.1) # punishment beep
-                            ######
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_str_tgt_pursuit'].append(self.t)
-                            dout_ch_1 = 0
-                            dout_ch_5 = 0
-                            self.pd_tgt.draw()
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip() 
-                            state = 'STR_TARGET_PURSUIT'
-                    
-                    if state == 'SACCADE':
-                        # Check to see if saccade is in the right direction
-                        target_dir_vector = [self.cue_x-self.start_x,self.cue_y-self.start_y]
-                        unit_target_dir_vector = target_dir_vector/np.linalg.norm(target_dir_vector)
-                        saccade_dir_vector = eye_vel
-                        unit_saccade_dir_vector = saccade_dir_vector/np.linalg.norm(saccade_dir_vector)                    
-                        angle_diff = np.arccos(np.dot(unit_target_dir_vector, unit_saccade_dir_vector))
-
-                        if angle_diff >= np.pi/2:
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_incorrect_saccade'].append(self.t)
-                            dout_ch_1 = 1
-                            dout_ch_5 = 1
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip() 
-                            state = 'INCORRECT_SACCADE'
-                        else:
-                            # Move the target to secondary pos.
-                            self.tgt_x = self.end_x
-                            self.tgt_y = self.end_y
-                            self.tgt.pos = (self.tgt_x,self.tgt_y)
-                            self.tgt.draw()
-                            self.pd_tgt.draw()
-                            self.window.flip() 
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_detect_sac_end'].append(self.t)
-                            state = 'DETECT_SACCADE_END'
-                    
-                    if state == 'DETECT_SACCADE_END':
-                        if (eye_speed < fsm_parameter['sac_on_off_threshold']) and (self.t-state_start_time > 0.005):#25):
-                            # Check if saccade made to cue or end tgt.
-                            eye_dist_from_cue_tgt = np.sqrt((self.cue_x-self.eye_x)**2 + (self.cue_y-self.eye_y)**2)
-                            eye_dist_from_end_tgt = np.sqrt((self.end_x-self.eye_x)**2 + (self.end_y-self.eye_y)**2)
-                            if ((eye_dist_from_cue_tgt < fsm_parameter['rew_area']/2) or (eye_dist_from_end_tgt < fsm_parameter['rew_area']/2)):
-                                state_start_time = self.t
-                                state_inter_time = self.t
-                                self.trial_data['state_start_t_deliver_rew'].append(self.t)
-                                state = 'DELIVER_REWARD'
-                            else:
-                                state_start_time = self.t
-                                state_inter_time = self.t
-                                self.trial_data['state_start_t_incorrect_saccade'].append(self.t)
-                                dout_ch_1 = 1
-                                dout_ch_5 = 1
-                                DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                                DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                                self.window.flip() 
-                                state = 'INCORRECT_SACCADE'
-                        # If time runs out before saccade detected, reset the trial
-                        elif (self.t - state_start_time) >= fsm_parameter['max_wait_for_fixation']:
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_str_tgt_pursuit'].append(self.t)
-                            dout_ch_1 = 0
-                            dout_ch_5 = 0
-                            self.pd_tgt.draw()
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip() 
-                            state = 'STR_TARGET_PURSUIT'
-                    
-                    if state == 'DELIVER_REWARD':
-                        eye_dist_from_cue_tgt = np.sqrt((self.cue_x-self.eye_x)**2 + (self.cue_y-self.eye_y)**2)
-                        eye_dist_from_end_tgt = np.sqrt((self.end_x-self.eye_x)**2 + (self.end_y-self.eye_y)**2)
-                        if eye_dist_from_end_tgt < fsm_parameter['rew_area']/2:
-                            if (trial_num % fsm_parameter['pump_switch_interval']) == 0:
-                                if pump_to_use == 1:
-                                    pump_to_use = 2
-                                else:
-                                    pump_to_use = 1
-                                self.fsm_to_gui_sndr.send(('log','Pump switchd to '+str(pump_to_use)))
-                            self.fsm_to_gui_sndr.send(('pump_' + str(pump_to_use),0))
-                                                    
-                            lib.playSound(2000,0.1) # reward beep
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_end_tgt_fixation'].append(self.t)
-                            self.tgt.draw()
-                            dout_ch_1 = 1
-                            dout_ch_5 = 1
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip()
-                            state = 'END_TARGET_FIXATION'  
-                        # If animal makes random saccade instead of corrective one, reset trial
-                        elif (eye_dist_from_cue_tgt > fsm_parameter['rew_area']/2) and (eye_dist_from_end_tgt > fsm_parameter['rew_area']/2):
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_str_tgt_pursuit'].append(self.t)
-                            dout_ch_1 = 0
-                            dout_ch_5 = 0
-                            self.pd_tgt.draw()
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip() 
-                            state = 'STR_TARGET_PURSUIT'
-                        elif (self.t - state_start_time) >= fsm_parameter['max_wait_for_fixation']:
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_str_tgt_pursuit'].append(self.t)
-                            dout_ch_1 = 0
-                            dout_ch_5 = 0
-                            self.pd_tgt.draw()
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip() 
-                            state = 'STR_TARGET_PURSUIT'
-                    
-                    if state == 'END_TARGET_FIXATION':
-                        eye_dist_from_tgt = np.sqrt((self.tgt_x-self.eye_x)**2 + (self.tgt_y-self.eye_y)**2)   
-                        if ((self.t - state_inter_time) >= fsm_parameter['min_fix_time']):
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_trial_success'].append(self.t)
-                            self.window.flip() # remove all targets
-                            state = 'TRIAL_SUCCESS'
-                        # If time runs out before fixation finished, reset the trial
-                        # No explicit fixation required
-                        elif (self.t-state_start_time) >= fsm_parameter['max_wait_for_fixation']:
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_str_tgt_pursuit'].append(self.t)
-                            dout_ch_1 = 0
-                            dout_ch_5 = 0
-                            self.pd_tgt.draw()
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip() 
-                            state = 'STR_TARGET_PURSUIT'                     
-                    
-                    if state == 'INCORRECT_SACCADE':
-                        if ((self.t - state_start_time) > fsm_parameter['pun_time']):
-                            state_start_time = self.t
-                            state_inter_time = self.t
-                            self.trial_data['state_start_t_str_tgt_pursuit'].append(self.t)
-                            dout_ch_1 = 0
-                            dout_ch_5 = 0
-                            self.pd_tgt.draw()
-                            DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-                            DPxUpdateRegCache() # calling this delays fsm by ~0.25 ms
-                            self.window.flip() 
-                            state = 'STR_TARGET_PURSUIT'
-                    
-                    if state == 'TRIAL_SUCCESS':
-                        if (self.t-state_start_time) > fsm_parameter['ITI']:
-                            # Pull data
-                            self.pull_data_t = self.t
-                            self.pull_data()
-                            # Send trial data to GUI
-                            self.fsm_to_gui_sndr.send(('log',datetime.now().strftime("%H:%M:%S") + '; trial num: ' + str(trial_num) + ' -> completed'))
-                            self.fsm_to_gui_sndr.send(('trial_data',trial_num, self.trial_data))
-                            trial_num += 1
-                            self.init_trial_data()  
-                            self.trial_data['right_cal_matrix'] = cal_parameter['right_cal_matrix']
-                            self.trial_data['left_cal_matrix'] = cal_parameter['left_cal_matrix']
-                            state = 'INIT'   
+                    # Log when scene changes were actually shown on screen
+                    while not flip_queue.empty():
+                        _, flip_t = flip_queue.get()
+                        self.trial_data['flip_t_data'].append(flip_t + clock_offset)
+                    # FSM
+                    self.fsm.step()
                     
                     # Append data 
-                    self.trial_data['tgt_time_data'].append(self.t)
-                    self.trial_data['tgt_x_data'].append(self.tgt_x)
-                    self.trial_data['tgt_y_data'].append(self.tgt_y)
-                    self.trial_data['eye_x_data'].append(self.eye_x)
-                    self.trial_data['eye_y_data'].append(self.eye_y)
-                    # Update shared real time data
-                    with self.real_time_data_Array.get_lock():
-                        self.real_time_data_Array[0] = self.t
-                        self.real_time_data_Array[1] = self.eye_x
-                        self.real_time_data_Array[2] = self.eye_y
-                        self.real_time_data_Array[3] = self.tgt_x
-                        self.real_time_data_Array[4] = self.tgt_y
+                    self.sample_data.append(self.t, self.tgt_x, self.tgt_y, self.eye_x, self.eye_y)
+                    # Publish every sample to GUI process
+                    self.real_time_data_ring.write((self.t, self.eye_x, self.eye_y, self.tgt_x, self.tgt_y))
                         
-        # Close PsychoPy
-        core.quit()
         # Turn off VPixx schedule
         lib.VPixx_turn_off_schedule()
         # Close VPixx devices
@@ -544,14 +302,284 @@ class CorrSacFsmProcess(multiprocessing.Process):
         DPxClose()        
         tracker.TRACKPixx3().close()  
         # Reset digital out
-        dout_ch_1 = 1 # nominal PD
-        dout_ch_3 = 0 # random signal
-        dout_ch_5 = 1 # LED
-        DPxSetDoutValue(dout_ch_1 + (2**2)*dout_ch_3 + (2**4)*dout_ch_5, bitMask)
-        DPxUpdateRegCache()
+        self.dout.update_reg_cache = DPxUpdateRegCache
+        self.dout.reset()
+        self.dout.flush()
         # Reset time
         self.t = math.nan
         
+    #%% FSM STATES
+    def init_state(self):
+        # Set trial parameters
+        self.start_x = self.fsm_parameter['horz_offset']
+        self.start_y = self.fsm_parameter['vert_offset']
+        self.trial_data['start_x'].append(self.start_x)
+        self.trial_data['start_y'].append(self.start_y)
+        self.start_window.arm(self.start_x, self.start_y)
+        self.set_trial_target(self.schedule.next())
+        self.attempt_failed = False
+        pursuit_angle = np.random.randint(0,360)
+        self.pursuit_start_x = np.cos(pursuit_angle*np.pi/180)*self.fsm_parameter['pursuit_amp']
+        self.pursuit_start_x += self.start_x
+        self.pursuit_v_x = (self.start_x - self.pursuit_start_x)/self.fsm_parameter['pursuit_dur']
+        self.pursuit_start_y = np.sin(pursuit_angle*np.pi/180)*self.fsm_parameter['pursuit_amp']
+        self.pursuit_start_y += self.start_y
+        self.pursuit_v_y = (self.start_y - self.pursuit_start_y)/self.fsm_parameter['pursuit_dur']
+        
+        self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    
+    def enter_str_tgt_pursuit(self):
+        # Entered again after an attempt that reached the cue; error policy decides the next
+        # target. Attempts that failed before the cue keep the target
+        if self.attempt_failed:
+            tgt_idx = self.schedule.tgt_idx
+            if self.schedule.error() != tgt_idx:
+                self.set_trial_target(self.schedule.tgt_idx)
+        self.attempt_failed = False
+        self.scene.show(None, pd=True)
+        self.set_dout(0)
+    
+    def str_tgt_pursuit_state(self):
+        self.tgt_x = self.pursuit_v_x*(self.t-self.fsm.state_start_time) + self.pursuit_start_x
+        self.tgt_y = self.pursuit_v_y*(self.t-self.fsm.state_start_time) + self.pursuit_start_y  
+        self.scene.show((self.tgt_x,self.tgt_y), pd=True)
+        if (self.t-self.fsm.state_start_time) > self.fsm_parameter['pursuit_dur']:
+            self.fsm.transition(STR_TARGET_PRESENT, self.t)
+        if self.t - self.pull_data_t > 5:
+            self.pull_data_t = self.t
+            self.pull_data()    
+            # Send trial data to GUI
+            self.send_trial_data()
+            self.init_trial_data()
+    
+    def enter_str_tgt_present(self):
+        self.scene.show((self.tgt_x,self.tgt_y))
+        self.set_dout(1)
+    
+    def str_tgt_present_state(self):
+        if not self.eye_blink:
+            self.fsm.transition(STR_TARGET_FIXATION, self.t)
+        elif (self.t-self.fsm.state_start_time) >= self.fsm_parameter['max_wait_for_fixation']:
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    
+    def enter_str_tgt_fixation(self):
+        self.tgt_x = self.start_x
+        self.tgt_y = self.start_y
+        self.scene.show((self.tgt_x,self.tgt_y))
+    
+    def str_tgt_fixation_state(self):
+        # If eye not available or fixating at the start target, reset the timer
+        if self.eye_blink or not self.start_window.contains(self.eye_x, self.eye_y):
+            self.fsm.state_inter_time = self.t
+        if (self.t-self.fsm.state_inter_time) >= self.fsm_parameter['min_fix_time']:
+            self.fsm.transition(CUE_TARGET_PRESENT, self.t)
+        elif (self.t-self.fsm.state_start_time) >= self.fsm_parameter['max_wait_for_fixation']:
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    
+    def enter_cue_tgt_present(self):
+        self.attempt_failed = True # until the trial succeeds
+        self.tgt_x = self.cue_x
+        self.tgt_y = self.cue_y
+        self.scene.show((self.tgt_x,self.tgt_y), pd=True)
+        self.set_dout(0)
+        self.play_tone(1000,0.1) # neutral beep  
+        # Start looking for saccade within the same sample
+        self.fsm.transition(DETECT_SACCADE_START, self.t)
+    
+    def detect_sac_start_state(self):
+        if self.eye_speed >= self.fsm_parameter['sac_detect_threshold']:         
+            self.fsm.transition(SACCADE, self.t)
+        # If eye moves away from start target, reset trial after punishment period
+        elif not self.start_window.contains(self.eye_x, self.eye_y):
+            self.fsm.transition(INCORRECT_SACCADE, self.t)
+        # If time runs out before saccade detected, play punishment sound and reset the trial
+        elif (self.t - self.fsm.state_start_time) >= self.fsm_parameter['max_wait_for_fixation']:
+            ######
+            # self.play_tone(200,0.1) # punishment beep
+            ######
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    
+    def enter_saccade(self):
+        # Check to see if saccade is in the right direction, i.e., within 90 deg. of cue
+        if self.sac_dir_window.contains(self.eye_vel[0], self.eye_vel[1]):
+            self.fsm.transition(DETECT_SACCADE_END, self.t)
+        else:
+            self.fsm.transition(INCORRECT_SACCADE, self.t)
+    
+    def enter_detect_sac_end(self):
+        # Move the target to secondary pos.
+        self.tgt_x = self.end_x
+        self.tgt_y = self.end_y
+        self.scene.show((self.tgt_x,self.tgt_y), pd=True)
+    
+    def detect_sac_end_state(self):
+        if (self.eye_speed < self.fsm_parameter['sac_on_off_threshold']) and (self.t-self.fsm.state_start_time > 0.005):#25):
+            # Check if saccade made to cue or end tgt.
+            if self.cue_window.contains(self.eye_x, self.eye_y) or self.end_window.contains(self.eye_x, self.eye_y):
+                self.fsm.transition(DELIVER_REWARD, self.t)
+            else:
+                self.fsm.transition(INCORRECT_SACCADE, self.t)
+        # If time runs out before saccade detected, reset the trial
+        elif (self.t - self.fsm.state_start_time) >= self.fsm_parameter['max_wait_for_fixation']:
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    
+    def deliver_rew_state(self):
+        if self.end_window.contains(self.eye_x, self.eye_y):
+            if (self.trial_num % self.fsm_parameter['pump_switch_interval']) == 0:
+                if self.pump_to_use == 1:
+                    self.pump_to_use = 2
+                else:
+                    self.pump_to_use = 1
+                self.fsm_to_gui_sndr.send(('log','Pump switchd to '+str(self.pump_to_use)))
+            self.fsm_to_gui_sndr.send(('pump_' + str(self.pump_to_use),0))
+                                    
+            self.play_tone(2000,0.1) # reward beep
+            self.fsm.transition(END_TARGET_FIXATION, self.t)
+        # If animal makes random saccade instead of corrective one, reset trial
+        elif not self.cue_window.contains(self.eye_x, self.eye_y):
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+        elif (self.t - self.fsm.state_start_time) >= self.fsm_parameter['max_wait_for_fixation']:
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    
+    def enter_end_tgt_fixation(self):
+        self.scene.show((self.tgt_x,self.tgt_y))
+        self.set_dout(1)
+    
+    def end_tgt_fixation_state(self):
+        if ((self.t - self.fsm.state_inter_time) >= self.fsm_parameter['min_fix_time']):
+            self.fsm.transition(TRIAL_SUCCESS, self.t)
+        # If time runs out before fixation finished, reset the trial
+        # No explicit fixation required
+        elif (self.t-self.fsm.state_start_time) >= self.fsm_parameter['max_wait_for_fixation']:
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    
+    def enter_incorrect_sac(self):
+        self.scene.show() # remove all targets
+        self.set_dout(1)
+    
+    def incorrect_sac_state(self):
+        if ((self.t - self.fsm.state_start_time) > self.fsm_parameter['pun_time']):
+            self.fsm.transition(STR_TARGET_PURSUIT, self.t)
+    
+    def enter_trial_success(self):
+        self.scene.show() # remove all targets
+    
+    def trial_success_state(self):
+        if (self.t-self.fsm.state_start_time) > self.fsm_parameter['ITI']:
+            # Pull data
+            self.pull_data_t = self.t
+            self.pull_data()
+            # Send trial data to GUI
+            self.fsm_to_gui_sndr.send(('log',datetime.now().strftime("%H:%M:%S") + '; trial num: ' + str(self.trial_num) + ' -> completed'))
+            self.send_trial_data()
+            self.trial_num += 1
+            self.init_trial_data()  
+            self.trial_data['right_cal_matrix'] = self.cal_parameter['right_cal_matrix']
+            self.trial_data['left_cal_matrix'] = self.cal_parameter['left_cal_matrix']
+            # Take parameters saved during the experiment from the next trial
+            self.reload_parameter()
+            self.fsm.transition(INIT, self.t)
+    
+    #%% FUNCTIONS
+    def set_schedule(self, keep_schedule=False):
+        '''
+        computes target positions (with offset) and makes the schedule of targets; done when
+        experiment starts, not every trial. Schedule is saved with the session
+        Arguments:
+            keep_schedule - keep current schedule if number of targets, weights and error
+                            policy did not change, e.g., when parameters are reloaded (bool)
+        '''
+        prim_pos, corr_pos = corr_target_pos(self.fsm_parameter) # cached
+        start_pos = np.array([self.fsm_parameter['horz_offset'], self.fsm_parameter['vert_offset']])
+        self.cue_pos = prim_pos + start_pos
+        self.end_pos = corr_pos + start_pos
+        weights = self.fsm_parameter.get('tgt_weights')
+        error_policy = self.fsm_parameter.get('error_policy','repeat')
+        if keep_schedule and len(self.cue_pos) == len(self.schedule.weights) and error_policy == self.schedule.error_policy\
+            and (not weights or list(weights) == self.schedule.weights.tolist()):
+            return
+        # Schedule made at start is 'schedule'; ones made after a reload are saved next to it
+        self.num_schedule = self.num_schedule + 1 if keep_schedule else 0
+        prefix = 'reload{}_'.format(self.num_schedule) if keep_schedule else ''
+        self.schedule = TrialSchedule(len(self.cue_pos), weights or None, error_policy)
+        self.attempt_failed = False # error policy is not applied across schedules
+        self.fsm_to_gui_sndr.send(('session_attrs', self.schedule.attrs(prefix)))
+    
+    def set_windows(self):
+        '''
+        gaze windows of the task; sizes are set here, positions when targets are set
+        '''
+        radius = self.fsm_parameter['rew_area']/2
+        self.start_window = CircleWindow(radius)
+        self.cue_window = CircleWindow(radius)
+        self.end_window = CircleWindow(radius)
+        self.sac_dir_window = DirectionWindow(90)
+    
+    def set_trial_target(self, tgt_idx):
+        '''
+        sets target positions of the trial and logs them in trial data
+        '''
+        self.cue_x, self.cue_y = self.cue_pos[tgt_idx].tolist()
+        self.end_x, self.end_y = self.end_pos[tgt_idx].tolist()
+        self.cue_window.arm(self.cue_x, self.cue_y)
+        self.end_window.arm(self.end_x, self.end_y)
+        self.sac_dir_window.arm(self.cue_x - self.start_x, self.cue_y - self.start_y)
+        self.trial_data['tgt_idx'].append(tgt_idx)
+        self.trial_data['cue_x'].append(self.cue_x)
+        self.trial_data['cue_y'].append(self.cue_y)
+        self.trial_data['end_x'].append(self.end_x)
+        self.trial_data['end_y'].append(self.end_y)
+        # Send target data
+        self.fsm_to_gui_sndr.send(('tgt_data',(self.cue_x,self.cue_y,self.end_x,self.end_y)))
+    
+    def reload_parameter(self):
+        '''
+        reloads exp. parameters if the file was saved (e.g., by GUI) since they were loaded;
+        only checks file status otherwise. Loop timing is kept as set at start of the experiment
+        '''
+        if not parameter_file_changed(self.parameter_file_path):
+            return
+        loop_timing = self.fsm_parameter.get('loop_timing',False)
+        self.fsm_parameter, _ = lib.load_parameter('experiment','exp_parameter.json',True,True,CorrSacGui.set_default_parameter,self.exp_name,self.main_parameter['current_monkey'])
+        self.fsm_parameter['loop_timing'] = loop_timing
+        self.set_schedule(keep_schedule=True)
+        self.set_windows()
+        self.fsm_to_gui_sndr.send(('log',datetime.now().strftime("%H:%M:%S") + '; trial num: ' + str(self.trial_num) + ' -> parameters reloaded'))
+    
+    def send_trial_data(self):
+        '''
+        sends trial data collected so far to GUI, with loop timing summaries if enabled
+        '''
+        trial_data = self.recorder.to_dict()
+        if self.loop_timing.enabled:
+            trial_data.update(self.loop_timing.summaries())
+            self.fsm_to_gui_sndr.send(('log','Loop timing; ' + self.loop_timing.log_summary()))
+            self.loop_timing.reset()
+        self.fsm_to_gui_sndr.send(('trial_data',self.trial_num, trial_data))
+    
+    def set_dout(self, pd_led):
+        '''
+        sets nominal PD and LED digital out channels and sends them to VPixx if changed
+        Arguments:
+            pd_led - value of both channels (0 or 1)
+        '''
+        self.dout.set('pd', pd_led)
+        self.dout.set('led', pd_led)
+        self.dout.flush() # sent right away, i.e., when the scene change is commanded
+    
+    def draw_scene(self, tgt_pos, pd):
+        '''
+        draws scene for the render loop; called in render thread
+        Arguments:
+            tgt_pos - (x, y) of target in deg., None if not shown (tuple)
+            pd - whether to show photodiode target (bool)
+        '''
+        if tgt_pos is not None:
+            self.tgt.pos = tgt_pos
+            self.tgt.draw()
+        if pd:
+            self.pd_tgt.draw()
+    
     def pull_data(self):
         '''
         to be called every 10 s or when a trial finishes, whichever is earlier
@@ -559,17 +587,7 @@ class CorrSacFsmProcess(multiprocessing.Process):
         from accumulating, which will incur a delay when getting data 
         '''
         tpxData = TPxReadTPxData(0)
-        self.trial_data['device_time_data'].extend(tpxData[0][0::22])
-        self.trial_data['eye_lx_raw_data'].extend(tpxData[0][16::22])
-        self.trial_data['eye_ly_raw_data'].extend(tpxData[0][17::22])
-        self.trial_data['eye_l_pupil_data'].extend(tpxData[0][3::22])
-        self.trial_data['eye_l_blink_data'].extend(tpxData[0][8::22])
-        self.trial_data['eye_rx_raw_data'].extend(tpxData[0][18::22])
-        self.trial_data['eye_ry_raw_data'].extend(tpxData[0][19::22])
-        self.trial_data['eye_r_pupil_data'].extend(tpxData[0][6::22])
-        self.trial_data['eye_r_blink_data'].extend(tpxData[0][9::22])
-        self.trial_data['din_data'].extend(tpxData[0][7::22])
-        self.trial_data['dout_data'].extend(tpxData[0][10::22])
+        self.device_data.extend(tpx_columns(tpxData[0], DEVICE_DATA_IDX))
 
         TPxSetupTPxSchedule() # flushes data in DATAPixx buffer
     
@@ -589,46 +607,26 @@ class CorrSacFsmProcess(multiprocessing.Process):
         
     def init_trial_data(self):
         '''
-        initializes a dict. of trial data;
-        needs to be called at the start of every trial
+        resets trial data in place; needs to be called at the start of every trial.
+        Buffers are allocated on the first call and reused for the rest of the session
         '''
-        self.trial_data = {}
-        self.trial_data['right_cal_matrix'] = [] # may be updated during exp.
-        self.trial_data['left_cal_matrix'] = []
-        self.trial_data['state_start_t_str_tgt_pursuit'] = []
-        self.trial_data['state_start_t_str_tgt_present'] = []
-        self.trial_data['state_start_t_str_tgt_fixation'] = []
-        self.trial_data['state_start_t_cue_tgt_present'] = []
-        self.trial_data['state_start_t_detect_sac_start'] = []
-        self.trial_data['state_start_t_saccade'] = []
-        self.trial_data['state_start_t_detect_sac_end'] = []
-        self.trial_data['state_start_t_deliver_rew'] = []
-        self.trial_data['state_start_t_end_tgt_fixation'] = []
-        self.trial_data['state_start_t_trial_success'] = []
-        self.trial_data['state_start_t_incorrect_saccade'] = []
-        self.trial_data['cue_x'] = []
-        self.trial_data['cue_y'] = []     
-        self.trial_data['end_x'] = []
-        self.trial_data['end_y'] = []  
-        self.trial_data['start_x'] = []
-        self.trial_data['start_y'] = []     
-        self.trial_data['tgt_time_data'] = []
-        self.trial_data['tgt_x_data'] = []
-        self.trial_data['tgt_y_data'] = []
-        self.trial_data['eye_x_data'] = []
-        self.trial_data['eye_y_data'] = []
-         # 2000 Hz data
-        self.trial_data['eye_lx_raw_data'] = []
-        self.trial_data['eye_ly_raw_data'] = []
-        self.trial_data['eye_l_pupil_data'] = []
-        self.trial_data['eye_l_blink_data'] = []
-        self.trial_data['eye_rx_raw_data'] = []
-        self.trial_data['eye_ry_raw_data'] = []
-        self.trial_data['eye_r_pupil_data'] = []
-        self.trial_data['eye_r_blink_data'] = []
-        self.trial_data['device_time_data'] = []
-        self.trial_data['din_data'] = []
-        self.trial_data['dout_data'] = []
+        if self.recorder is None:
+            self.recorder = TrialRecorder()
+            self.recorder.add_field(['right_cal_matrix','left_cal_matrix', # may be updated during exp.
+                                     'state_start_t_str_tgt_pursuit','state_start_t_str_tgt_present','state_start_t_str_tgt_fixation',
+                                     'state_start_t_cue_tgt_present','state_start_t_detect_sac_start','state_start_t_saccade',
+                                     'state_start_t_detect_sac_end','state_start_t_deliver_rew','state_start_t_end_tgt_fixation',
+                                     'state_start_t_trial_success','state_start_t_incorrect_saccade',
+                                     'flip_t_data','tgt_idx','cue_x','cue_y','end_x','end_y','start_x','start_y'])
+            # Appended every FSM iteration
+            self.sample_data = self.recorder.add_group(['tgt_time_data','tgt_x_data','tgt_y_data','eye_x_data','eye_y_data'], 2000*10)
+            # 2000 Hz data
+            self.device_data = self.recorder.add_group([key for key,_ in DEVICE_DATA_FIELDS], 2000*10)
+            self.trial_data = self.recorder.field
+            # State start times are logged in trial data
+            self.fsm.state_t_data = self.trial_data
+        else:
+            self.recorder.reset()
         
     def set_default_parameter(self):
         parameter = {
@@ -651,17 +649,20 @@ class CorrSacFsmProcess(multiprocessing.Process):
                     'num_corr_sac_dir':8,
                     'first_corr_sac_dir': 0,
                     'ITI':0.1,
-                    'pump_switch_interval':50}
+                    'pump_switch_interval':50,
+                    'error_policy':'repeat', # target after an error trial; see TrialSchedule
+                    'tgt_weights':[], # num. of times each target is in a block; 1 each if empty
+                    'loop_timing':False}
         return parameter  
     
 class CorrSacGui(FsmGui):
-    def __init__(self,exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array,main_parameter):        
+    def __init__(self,exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring,main_parameter):        
         self.exp_name = exp_name
         self.fsm_to_gui_rcvr = fsm_to_gui_rcvr
         self.gui_to_fsm_sndr = gui_to_fsm_sndr
         self.stop_exp_Event = stop_exp_Event
         self.stop_fsm_process_Event = stop_fsm_process_Event
-        self.real_time_data_Array = real_time_data_Array 
+        self.real_time_data_ring = real_time_data_ring 
         self.main_parameter = main_parameter
         super(CorrSacGui,self).__init__(self.stop_fsm_process_Event)      
         self.init_gui()
@@ -673,6 +674,7 @@ class CorrSacGui(FsmGui):
             self.fsm_to_plot_socket.bind("tcp://192.168.0.2:5556")
             
             self.fsm_to_plot_priority_socket = context.socket(zmq.PUB)
+            self.fsm_to_plot_priority_socket.setsockopt(zmq.SNDHWM, 0) # no limit, so trial data is never dropped
             self.fsm_to_plot_priority_socket.bind("tcp://192.168.0.2:5557")
             
             self.plot_to_fsm_socket = context.socket(zmq.SUB)
@@ -727,6 +729,7 @@ class CorrSacGui(FsmGui):
         self.first_corr_sac_dir_QDoubleSpinBox.valueChanged.connect(self.first_corr_sac_dir_QDoubleSpinBox_valueChanged)
         self.iti_QDoubleSpinBox.valueChanged.connect(self.iti_QDoubleSpinBox_valueChanged)
         self.pump_switch_QDoubleSpinBox.valueChanged.connect(self.pump_switch_QDoubleSpinBox_valueChanged)
+        self.loop_timing_QCheckBox.stateChanged.connect(self.loop_timing_QCheckBox_stateChanged)
         self.save_QPushButton.clicked.connect(self.save_QPushButton_clicked)
     
     #%% SLOTS
@@ -743,7 +746,7 @@ class CorrSacGui(FsmGui):
                 # Start FSM
                 self.stop_exp_Event.clear()            
                 # Disable some user functions
-                self.sidepanel_parameter_QWidget.setDisabled(True)
+                self.loop_timing_QCheckBox.setDisabled(True) # only applied at start
                 self.tgt.setDisabled(True)
                 self.pd_tgt.setDisabled(True)
                 # Save parameters
@@ -756,7 +759,8 @@ class CorrSacGui(FsmGui):
                     self.exp_parameter['right_eye_tracked'] = 1
                     self.exp_parameter['left_eye_tracked'] = 0
                 self.exp_parameter['version'] = 1.0
-                self.fsm_to_plot_priority_socket.send_pyobj(('init_data',self.exp_name, self.exp_parameter))
+                # Monkey is saved for the session catalog; added to a copy, since 'exp_parameter' is saved to the parameter file
+                self.fsm_to_plot_priority_socket.send_pyobj(('init_data',self.exp_name, dict(self.exp_parameter, monkey=self.main_parameter['current_monkey'])))
                 # Start timer to get data from FSM
                 self.data_QTimer.start(self.data_rate)
                 # Tell plot GUI we are starting
@@ -769,7 +773,7 @@ class CorrSacGui(FsmGui):
         self.toolbar_run_QAction.setEnabled(True)
         self.toolbar_stop_QAction.setDisabled(True)
         # Enable some user functions
-        self.sidepanel_parameter_QWidget.setEnabled(True)
+        self.loop_timing_QCheckBox.setEnabled(True)
         self.tgt.setEnabled(True)
         self.pd_tgt.setEnabled(True)
         # Stop timer to stop getting data from fsm thread
@@ -798,13 +802,10 @@ class CorrSacGui(FsmGui):
             if msg_title == 'log':
                 self.log_QPlainTextEdit.appendPlainText(msg[1])
 
-        with self.real_time_data_Array.get_lock():
-            t = self.real_time_data_Array[0]
-            eye_x = self.real_time_data_Array[1]
-            eye_y = self.real_time_data_Array[2]
-            tgt_x = self.real_time_data_Array[3]
-            tgt_y = self.real_time_data_Array[4]        
-        self.fsm_to_plot_socket.send_pyobj((t,eye_x,eye_y,tgt_x,tgt_y))
+        # All samples since last tick; Nx5 of t, eye_x, eye_y, tgt_x, tgt_y
+        real_time_data = self.real_time_data_ring.read()
+        if len(real_time_data):
+            self.fsm_to_plot_socket.send_pyobj(real_time_data)
         
     @pyqtSlot()
     def receiver_QTimer_timeout(self):
@@ -903,12 +904,13 @@ class CorrSacGui(FsmGui):
         self.exp_parameter['pump_switch_interval'] = self.pump_switch_QDoubleSpinBox.value()
         self.save_QPushButton.setStyleSheet('background-color: #FFCC00')  
     @pyqtSlot()
+    def loop_timing_QCheckBox_stateChanged(self):
+        self.exp_parameter['loop_timing'] = self.loop_timing_QCheckBox.isChecked()
+        self.save_QPushButton.setStyleSheet('background-color: #FFCC00')  
+    @pyqtSlot()
     def save_QPushButton_clicked(self):
-        with open(self.parameter_file_path,'r') as file:
-            all_parameter = json.load(file)
-        all_parameter[self.main_parameter['current_monkey']][self.exp_name] = self.exp_parameter    
-        with open(self.parameter_file_path,'w') as file:
-            json.dump(all_parameter, file, indent=4)
+        # If running, FSM picks them up at the end of current trial
+        set_parameter(self.parameter_file_path, self.exp_parameter, self.main_parameter['current_monkey'], self.exp_name)
         self.save_QPushButton.setStyleSheet('background-color: #39E547')  
     #%% GUI
     def init_gui(self):
@@ -1016,6 +1018,16 @@ class CorrSacGui(FsmGui):
         self.pump_switch_QHBoxLayout.addWidget(self.pump_switch_QDoubleSpinBox)
         self.sidepanel_custom_QVBoxLayout.addLayout(self.pump_switch_QHBoxLayout)
         
+        self.loop_timing_QHBoxLayout = QHBoxLayout()
+        self.loop_timing_QLabel = QLabel("Record loop timing:")
+        self.loop_timing_QLabel.setAlignment(Qt.AlignRight)
+        self.loop_timing_QHBoxLayout.addWidget(self.loop_timing_QLabel)
+        self.loop_timing_QCheckBox = QCheckBox()
+        self.loop_timing_QCheckBox.setToolTip('Saves FSM iteration and device call durations (count, p50, p99, max, misses) with trial data')
+        self.loop_timing_QCheckBox.setChecked(False)
+        self.loop_timing_QHBoxLayout.addWidget(self.loop_timing_QCheckBox)
+        self.sidepanel_custom_QVBoxLayout.addLayout(self.loop_timing_QHBoxLayout)
+        
         self.sidepanel_custom_QVBoxLayout.addWidget(self.sidepanel_params_TabWidget)
         
         self.max_allow_time_QHBoxLayout = QHBoxLayout()
@@ -1202,7 +1214,10 @@ class CorrSacGui(FsmGui):
                     'num_corr_sac_dir':8,
                     'first_corr_sac_dir': 0,
                     'ITI':0.1,
-                    'pump_switch_interval':50
+                    'pump_switch_interval':50,
+                    'error_policy':'repeat', # target after an error trial; see TrialSchedule
+                    'tgt_weights':[], # num. of times each target is in a block; 1 each if empty
+                    'loop_timing':False
                     }
         return parameter
     
@@ -1230,21 +1245,22 @@ class CorrSacGui(FsmGui):
         self.first_corr_sac_dir_QDoubleSpinBox.setValue(self.exp_parameter['first_corr_sac_dir'])
         self.iti_QDoubleSpinBox.setValue(self.exp_parameter['ITI'])
         self.pump_switch_QDoubleSpinBox.setValue(self.exp_parameter['pump_switch_interval'])
+        self.loop_timing_QCheckBox.setChecked(self.exp_parameter.get('loop_timing',False))
 
         
 class CorrSacGuiProcess(multiprocessing.Process):
-    def __init__(self, exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array, main_parameter, parent=None):
+    def __init__(self, exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring, main_parameter, parent=None):
         super(CorrSacGuiProcess,self).__init__(parent)
         self.exp_name = exp_name
         self.fsm_to_gui_rcvr = fsm_to_gui_rcvr
         self.gui_to_fsm_sndr = gui_to_fsm_sndr
         self.stop_exp_Event = stop_exp_Event
-        self.real_time_data_Array = real_time_data_Array
+        self.real_time_data_ring = real_time_data_ring
         self.stop_fsm_process_Event = stop_fsm_process_Event
         self.main_parameter = main_parameter
     def run(self):  
         app = QApplication(sys.argv)
-        app_gui = CorrSacGui(self.exp_name, self.fsm_to_gui_rcvr, self.gui_to_fsm_sndr, self.stop_exp_Event, self.stop_fsm_process_Event, self.real_time_data_Array, self.main_parameter)
+        app_gui = CorrSacGui(self.exp_name, self.fsm_to_gui_rcvr, self.gui_to_fsm_sndr, self.stop_exp_Event, self.stop_fsm_process_Event, self.real_time_data_ring, self.main_parameter)
         app_gui.setWindowIcon(QtGui.QIcon(os.path.join('.', 'icon', 'experiment_window.png')))
         app_gui.show()
         sys.exit(app.exec())
@@ -0,0 +1,162 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+"""
+import math
+
+class VelocityEstimator():
+    '''
+    estimates eye velocity from the most recent samples using a fixed-size ring buffer.
+    Every update is constant time and uses plain floats only, so it is safe to call
+    on every FSM iteration.
+    Available (causal) filters:
+        'mean_diff' - mean of the sample-to-sample velocities in the window;
+                      same as np.mean(np.diff(x)/np.diff(t)) used previously in the FSMs
+        'central_diff' - difference between the newest and the oldest samples of the window
+                         divided by their time difference; i.e., central difference evaluated
+                         at the middle of the window
+        'savgol' - least-squares slope over the window; Savitzky-Golay first derivative
+                   (poly. order 1) evaluated for the window, valid for non-uniform sampling
+    '''
+    methods = ('mean_diff', 'central_diff', 'savgol')
+
+    def __init__(self, window=3, method='mean_diff'):
+        '''
+        Arguments:
+            window - number of samples used to estimate velocity (int, >= 2)
+            method - one of VelocityEstimator.methods (str)
+        '''
+        if int(window) < 2:
+            raise ValueError('window must contain at least 2 samples')
+        if method not in self.methods:
+            raise ValueError('unknown method: ' + str(method))
+        self.window = int(window)
+        self.method = method
+        self.reset()
+
+    def reset(self):
+        '''
+        clears the buffer; velocity is reported as 0 until the window is full again
+        '''
+        n = self.window
+        self.t_buf = [0.0]*n
+        self.x_buf = [0.0]*n
+        self.y_buf = [0.0]*n
+        self.idx = 0 # where next sample is written
+        self.count = 0 # num. of valid samples in buffer
+        # Sample-to-sample velocities ('mean_diff'); n-1 pairs in a full window
+        self.vx_buf = [0.0]*(n-1)
+        self.vy_buf = [0.0]*(n-1)
+        self.pair_idx = 0
+        self.sum_vx = 0.0
+        self.sum_vy = 0.0
+        # Running sums for least-squares slope ('savgol'); time relative to 't_ref' for precision
+        self.t_ref = 0.0
+        self.sum_t = 0.0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_tt = 0.0
+        self.sum_tx = 0.0
+        self.sum_ty = 0.0
+
+        self.vel_x = 0.0
+        self.vel_y = 0.0
+        self.speed = 0.0
+        self.ready = False
+
+    def update(self, t, x, y):
+        '''
+        adds a sample and updates the velocity estimate
+        Arguments:
+            t - time of sample in s (float)
+            x, y - eye position in deg (float)
+        Returns:
+            accepted - False if sample was dropped because its time is not after
+                       the previous sample (bool)
+        '''
+        n = self.window
+        i = self.idx
+        count = self.count
+        if count > 0:
+            prev = i - 1 if i > 0 else n - 1
+            dt = t - self.t_buf[prev]
+            if not dt > 0:
+                return False
+            if self.method == 'mean_diff':
+                vx = (x - self.x_buf[prev])/dt
+                vy = (y - self.y_buf[prev])/dt
+                j = self.pair_idx
+                self.sum_vx += vx - self.vx_buf[j]
+                self.sum_vy += vy - self.vy_buf[j]
+                self.vx_buf[j] = vx
+                self.vy_buf[j] = vy
+                self.pair_idx = j + 1 if j < n - 2 else 0
+        if self.method == 'savgol':
+            if count == n: # remove oldest sample, which is overwritten below
+                t_old = self.t_buf[i] - self.t_ref
+                x_old = self.x_buf[i]
+                y_old = self.y_buf[i]
+                self.sum_t -= t_old
+                self.sum_x -= x_old
+                self.sum_y -= y_old
+                self.sum_tt -= t_old*t_old
+                self.sum_tx -= t_old*x_old
+                self.sum_ty -= t_old*y_old
+            elif count == 0:
+                self.t_ref = t
+            t_rel = t - self.t_ref
+            self.sum_t += t_rel
+            self.sum_x += x
+            self.sum_y += y
+            self.sum_tt += t_rel*t_rel
+            self.sum_tx += t_rel*x
+            self.sum_ty += t_rel*y
+        self.t_buf[i] = t
+        self.x_buf[i] = x
+        self.y_buf[i] = y
+        if count < n:
+            count += 1
+            self.count = count
+        i = i + 1 if i < n - 1 else 0
+        self.idx = i
+        if count < n:
+            return True
+        # Window full; compute velocity
+        self.ready = True
+        if self.method == 'mean_diff':
+            self.vel_x = self.sum_vx/(n-1)
+            self.vel_y = self.sum_vy/(n-1)
+        elif self.method == 'central_diff':
+            # 'i' now points at the oldest sample
+            newest = i - 1 if i > 0 else n - 1
+            dt = self.t_buf[newest] - self.t_buf[i]
+            self.vel_x = (self.x_buf[newest] - self.x_buf[i])/dt
+            self.vel_y = (self.y_buf[newest] - self.y_buf[i])/dt
+        else:
+            denom = n*self.sum_tt - self.sum_t*self.sum_t
+            if denom > 0:
+                self.vel_x = (n*self.sum_tx - self.sum_t*self.sum_x)/denom
+                self.vel_y = (n*self.sum_ty - self.sum_t*self.sum_y)/denom
+        self.speed = math.sqrt(self.vel_x*self.vel_x + self.vel_y*self.vel_y)
+        # Once per buffer cycle, recompute sums from the buffer so that rounding errors
+        # from subtracting old samples do not accumulate over a session; amortized O(1)
+        if i == 0:
+            self.resync()
+        return True
+
+    def resync(self):
+        '''
+        recomputes running sums from the buffer contents
+        '''
+        if self.method == 'mean_diff':
+            self.sum_vx = math.fsum(self.vx_buf)
+            self.sum_vy = math.fsum(self.vy_buf)
+        elif self.method == 'savgol':
+            self.t_ref = self.t_buf[self.idx] # oldest sample
+            t_rel = [t - self.t_ref for t in self.t_buf]
+            self.sum_t = math.fsum(t_rel)
+            self.sum_x = math.fsum(self.x_buf)
+            self.sum_y = math.fsum(self.y_buf)
+            self.sum_tt = math.fsum([t*t for t in t_rel])
+            self.sum_tx = math.fsum([t*x for t,x in zip(t_rel,self.x_buf)])
+            self.sum_ty = math.fsum([t*y for t,y in zip(t_rel,self.y_buf)])
@@ -0,0 +1,86 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+"""
+import math
+
+class StateMachine():
+    '''
+    table-driven finite state machine shared by the tasks.
+    States are integer IDs (indices into 'state_names'); each state has a handler
+    that is called once per sample while the state is active, and optional entry/exit
+    actions that run once on transition. Start time of each state is appended to
+    'state_t_data[t_key]' (usually trial data) if the state has a 't_key'.
+    '''
+    def __init__(self, state_names):
+        '''
+        Arguments:
+            state_names - name of each state; position in the list is the state ID (list of str)
+        '''
+        num_state = len(state_names)
+        self.state_names = list(state_names)
+        self.handler = [None]*num_state
+        self.on_enter = [None]*num_state
+        self.on_exit = [None]*num_state
+        self.t_key = [None]*num_state
+        self.state = None
+        self.state_start_time = math.nan # when current state started
+        self.state_inter_time = math.nan # intermediate time within a state, e.g., for resettable timers
+        self.state_t_data = {} # where state start times are logged
+
+    def add_state(self, state, handler, on_enter=None, on_exit=None, t_key=None):
+        '''
+        registers a state
+        Arguments:
+            state - state ID (int)
+            handler - called once per sample while state is active (function)
+            on_enter - called after entering state (function)
+            on_exit - called before leaving state (function)
+            t_key - key in 'state_t_data' to log state start time (str)
+        '''
+        self.handler[state] = handler
+        self.on_enter[state] = on_enter
+        self.on_exit[state] = on_exit
+        self.t_key[state] = t_key
+
+    def start(self, state, t):
+        '''
+        enters a state without running the exit action of the current state,
+        e.g., at the start of an experiment
+        Arguments:
+            state - state ID (int)
+            t - current time (float)
+        '''
+        self.state = None
+        self.transition(state, t)
+
+    def transition(self, state, t):
+        '''
+        leaves current state and enters a new one; the new state's handler
+        is called from the next sample on
+        Arguments:
+            state - state ID (int)
+            t - current time (float)
+        '''
+        if self.state is not None:
+            on_exit = self.on_exit[self.state]
+            if on_exit is not None:
+                on_exit()
+        self.state = state
+        self.state_start_time = t
+        self.state_inter_time = t
+        t_key = self.t_key[state]
+        if t_key is not None:
+            self.state_t_data[t_key].append(t)
+        on_enter = self.on_enter[state]
+        if on_enter is not None:
+            on_enter()
+
+    def step(self):
+        '''
+        runs the handler of the active state; to be called once per sample
+        '''
+        self.handler[self.state]()
+
+    def state_name(self):
+        return self.state_names[self.state]
@@ -110,7 +110,10 @@ class FsmGui(QMainWindow):
         self.data_rate = int(1/60*1000) # how often to get eye and time data from fsm (ms)
         # self.data_rate = 1
         data_duration = 5 # how long to store eye and time data (s)
-        data_length = int(data_duration*1000/int(1/60*1000))
+        data_length = int(data_duration*2000) # every sample is received, at up to 2 kHz
+        # Draw at most about one point per pixel and only what is in view
+        self.plot_2_PlotWidget.setDownsampling(auto=True, mode='peak')
+        self.plot_2_PlotWidget.setClipToView(True)
         self.eye_x_data = deque(maxlen=data_length)
         self.eye_y_data = deque(maxlen=data_length)
         self.tgt_x_data = deque(maxlen=data_length)
@@ -0,0 +1,210 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Gaze windows for fixation and reward checks. Sizes, squared thresholds and unit vectors are
+computed when a window is made or armed, so 'contains', called every sample, only compares
+squared distances of plain floats; nothing is allocated. 'contains_batch' tests arrays of
+samples, e.g., to re-score trials offline with other window sizes.
+    tgt_window = CircleWindow(rew_area/2)
+    tgt_window.arm(tgt_x, tgt_y) # e.g., when target is shown
+    if tgt_window.contains(eye_x, eye_y): ...
+"""
+import math
+from abc import ABC, abstractmethod
+import numpy as np
+
+class GazeWindow(ABC):
+    '''
+    window around a center that is set by 'arm'; subclasses define the shape
+    '''
+    def __init__(self):
+        self.x = 0.0
+        self.y = 0.0
+
+    def arm(self, x, y):
+        '''
+        Arguments:
+            x, y - center of window, e.g., target position, in deg. (float)
+        '''
+        self.x = float(x)
+        self.y = float(y)
+
+    @abstractmethod
+    def contains(self, x, y):
+        '''
+        Returns:
+            inside - whether gaze (x, y) is in the window; boundary counts as inside (bool)
+        '''
+
+    @abstractmethod
+    def contains_batch(self, x, y):
+        '''
+        Arguments:
+            x, y - gaze positions (np.array)
+        Returns:
+            inside - for each position (np.bool array)
+        '''
+
+class CircleWindow(GazeWindow):
+    def __init__(self, radius):
+        '''
+        Arguments:
+            radius - in deg., e.g., half of 'rew_area' (float)
+        '''
+        super().__init__()
+        self.radius = radius
+        self.radius_sq = radius*radius
+
+    def contains(self, x, y):
+        dx = x - self.x
+        dy = y - self.y
+        return dx*dx + dy*dy <= self.radius_sq
+
+    def contains_batch(self, x, y):
+        dx = np.asarray(x) - self.x
+        dy = np.asarray(y) - self.y
+        return dx*dx + dy*dy <= self.radius_sq
+
+class EllipseWindow(GazeWindow):
+    def __init__(self, half_width, half_height, angle=0.0):
+        '''
+        Arguments:
+            half_width, half_height - radii along the (rotated) x and y axes, in deg. (float)
+            angle - counterclockwise rotation, in deg. (float)
+        '''
+        super().__init__()
+        self.half_width = half_width
+        self.half_height = half_height
+        self.angle = angle
+        self.cos = math.cos(math.radians(angle))
+        self.sin = math.sin(math.radians(angle))
+        self.inv_width_sq = 1/(half_width*half_width)
+        self.inv_height_sq = 1/(half_height*half_height)
+
+    def contains(self, x, y):
+        dx = x - self.x
+        dy = y - self.y
+        u = dx*self.cos + dy*self.sin
+        v = dy*self.cos - dx*self.sin
+        return u*u*self.inv_width_sq + v*v*self.inv_height_sq <= 1.0
+
+    def contains_batch(self, x, y):
+        dx = np.asarray(x) - self.x
+        dy = np.asarray(y) - self.y
+        u = dx*self.cos + dy*self.sin
+        v = dy*self.cos - dx*self.sin
+        return u*u*self.inv_width_sq + v*v*self.inv_height_sq <= 1.0
+
+class RectWindow(GazeWindow):
+    def __init__(self, half_width, half_height):
+        '''
+        Arguments:
+            half_width, half_height - in deg. (float)
+        '''
+        super().__init__()
+        self.half_width = half_width
+        self.half_height = half_height
+
+    def contains(self, x, y):
+        return abs(x - self.x) <= self.half_width and abs(y - self.y) <= self.half_height
+
+    def contains_batch(self, x, y):
+        return (np.abs(np.asarray(x) - self.x) <= self.half_width) & (np.abs(np.asarray(y) - self.y) <= self.half_height)
+
+class PolygonWindow(GazeWindow):
+    '''
+    any simple polygon; tested by ray casting. Points exactly on an edge may count as
+    either side
+    '''
+    def __init__(self, vertices):
+        '''
+        Arguments:
+            vertices - [x, y] of each vertex relative to the center, in deg. (list)
+        '''
+        super().__init__()
+        self.vertices = [(float(vx), float(vy)) for vx, vy in vertices]
+        if len(self.vertices) < 3:
+            raise ValueError('polygon needs at least 3 vertices')
+        self.arm(0.0, 0.0)
+
+    def arm(self, x, y):
+        super().arm(x, y)
+        # Per non-horizontal edge: (y1, y2, x1, dx/dy), in absolute position
+        self.edges = []
+        num_vertex = len(self.vertices)
+        for idx in range(num_vertex):
+            x1, y1 = self.vertices[idx]
+            x2, y2 = self.vertices[(idx+1) % num_vertex]
+            if y1 != y2:
+                self.edges.append((y1 + self.y, y2 + self.y, x1 + self.x, (x2 - x1)/(y2 - y1)))
+
+    def contains(self, x, y):
+        inside = False
+        for y1, y2, x1, inv_slope in self.edges:
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1)*inv_slope:
+                inside = not inside
+        return inside
+
+    def contains_batch(self, x, y):
+        x = np.asarray(x)
+        y = np.asarray(y)
+        inside = np.zeros(np.broadcast(x, y).shape, dtype=bool)
+        for y1, y2, x1, inv_slope in self.edges:
+            inside ^= ((y1 > y) != (y2 > y)) & (x < x1 + (y - y1)*inv_slope)
+        return inside
+
+class DirectionWindow():
+    '''
+    cone of directions around an armed direction, e.g., to test whether a saccade
+    (eye velocity) goes toward the target
+    '''
+    def __init__(self, half_angle=90.0):
+        '''
+        Arguments:
+            half_angle - max. angle from the armed direction, in deg.; exclusive (float)
+        '''
+        self.half_angle = half_angle
+        cos_half = math.cos(math.radians(half_angle))
+        self.cos_half = 0.0 if abs(cos_half) < 1e-12 else cos_half
+        self.cos_half_sq = self.cos_half*self.cos_half
+        self.ux = 1.0
+        self.uy = 0.0
+        self.any_direction = False
+
+    def arm(self, dx, dy):
+        '''
+        Arguments:
+            dx, dy - direction, e.g., from start to target; need not be unit length. If 0,
+                     e.g., target at the start position, any direction is accepted (float)
+        '''
+        norm = math.hypot(dx, dy)
+        self.any_direction = norm == 0
+        if not self.any_direction:
+            self.ux = dx/norm
+            self.uy = dy/norm
+
+    def contains(self, vx, vy):
+        '''
+        Returns:
+            inside - whether direction (vx, vy) is less than 'half_angle' from the armed
+                     direction (bool)
+        '''
+        if self.any_direction:
+            return True
+        dot = vx*self.ux + vy*self.uy
+        if self.cos_half >= 0:
+            return dot > 0 and dot*dot > self.cos_half_sq*(vx*vx + vy*vy)
+        return dot >= 0 or dot*dot < self.cos_half_sq*(vx*vx + vy*vy)
+
+    def contains_batch(self, vx, vy):
+        vx = np.asarray(vx)
+        vy = np.asarray(vy)
+        if self.any_direction:
+            return np.ones(np.broadcast(vx, vy).shape, dtype=bool)
+        dot = vx*self.ux + vy*self.uy
+        dot_sq = dot*dot
+        norm_sq = vx*vx + vy*vy
+        if self.cos_half >= 0:
+            return (dot > 0) & (dot_sq > self.cos_half_sq*norm_sq)
+        return (dot >= 0) | (dot_sq < self.cos_half_sq*norm_sq)
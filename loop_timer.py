@@ -0,0 +1,186 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+"""
+from array import array
+import time, math
+import numpy as np
+
+SUMMARY_FIELDS = ('count','p50','p99','max','misses') # order of values in 'LoopTimer.summary'
+
+class LoopTimer():
+    '''
+    fixed-size histogram of durations, e.g., of FSM iterations or device calls.
+    Recording only increments preallocated counters, so it can be called every sample;
+    percentiles are computed from the histogram when a summary is requested.
+    '''
+    def __init__(self, name, deadline=math.inf, bin_width=1e-5, max_time=0.05):
+        '''
+        Arguments:
+            name - name of what is timed (str)
+            deadline - durations longer than this are counted as misses, in sec. (float)
+            bin_width - resolution of the histogram, in sec. (float)
+            max_time - durations longer than this go to the last bin, in sec. (float)
+        '''
+        self.name = name
+        self.deadline = deadline
+        self.bin_width = bin_width
+        self.inv_bin_width = 1/bin_width
+        self.num_bin = int(math.ceil(max_time/bin_width))
+        self.counts = array('q', bytes(8*(self.num_bin+1))) # last bin for overflow
+        self.last_t = math.nan
+        self.reset()
+
+    def record(self, duration):
+        '''
+        adds one duration, in sec., to the histogram
+        '''
+        idx = int(duration*self.inv_bin_width)
+        if idx > self.num_bin:
+            idx = self.num_bin
+        self.counts[idx] += 1
+        self.count += 1
+        if duration > self.max:
+            self.max = duration
+        if duration > self.deadline:
+            self.misses += 1
+
+    def tick(self):
+        '''
+        records time since the previous tick; to be called once per loop iteration.
+        First tick after reset only starts the clock
+        '''
+        t = time.perf_counter()
+        if self.last_t == self.last_t: # not nan
+            self.record(t - self.last_t)
+        self.last_t = t
+
+    def wrap(self, func):
+        '''
+        Arguments:
+            func - function to time (function)
+        Returns:
+            timed_func - calls 'func' with the same arguments and records how long it took (function)
+        '''
+        perf_counter = time.perf_counter
+        record = self.record
+        def timed_func(*args):
+            start = perf_counter()
+            result = func(*args)
+            record(perf_counter() - start)
+            return result
+        return timed_func
+
+    def percentile(self, q):
+        '''
+        Arguments:
+            q - percentile between 0 and 100 (float)
+        Returns:
+            duration - upper edge of the bin containing the percentile, in sec.; capped at max (float)
+        '''
+        if self.count == 0:
+            return math.nan
+        cum_counts = np.cumsum(np.frombuffer(self.counts, dtype=np.int64))
+        idx = int(np.searchsorted(cum_counts, q/100*self.count))
+        return min((idx+1)*self.bin_width, self.max)
+
+    def summary(self):
+        '''
+        Returns:
+            summary - [count, p50, p99, max, misses] since last reset; durations in sec. (list)
+        '''
+        return [self.count, self.percentile(50), self.percentile(99), self.max if self.count else math.nan, self.misses]
+
+    def reset(self):
+        '''
+        clears the histogram in place; tick clock keeps running so no iteration is lost
+        '''
+        np.frombuffer(self.counts, dtype=np.int64)[:] = 0
+        self.count = 0
+        self.max = 0.0
+        self.misses = 0
+
+class LoopTiming():
+    '''
+    set of LoopTimers for one FSM process. When disabled, 'wrap' returns functions unchanged
+    and 'ticker' returns a function that does nothing, so timing costs nothing unless turned on.
+    '''
+    def __init__(self, enabled):
+        '''
+        Arguments:
+            enabled - whether to time (bool)
+        '''
+        self.enabled = enabled
+        self.timers = {}
+        self.resets = {} # name -> function that resets the timer; for timers of other threads
+
+    def add(self, name, deadline=math.inf):
+        '''
+        Returns:
+            timer - new LoopTimer under 'name'
+        '''
+        timer = LoopTimer(name, deadline)
+        self.timers[name] = timer
+        return timer
+
+    def attach(self, timer, reset=None):
+        '''
+        adds an existing timer, e.g., one recorded in another thread, if enabled
+        Arguments:
+            timer - LoopTimer to include in summaries
+            reset - resets the timer in the thread that records it, e.g., by 'Scene.call', so
+                    it is not cleared while recording; 'timer.reset' if None (function)
+        '''
+        if self.enabled:
+            self.resets[timer.name] = timer.reset if reset is None else reset
+            self.resets[timer.name]()
+            self.timers[timer.name] = timer
+
+    def ticker(self, name, deadline=math.inf):
+        '''
+        Arguments:
+            name - name of timer to create (str)
+            deadline - periods longer than this are counted as misses, in sec. (float)
+        Returns:
+            tick - 'tick' of the new timer, or a function that does nothing if disabled (function)
+        '''
+        if not self.enabled:
+            return lambda: None
+        return self.add(name, deadline).tick
+
+    def wrap(self, name, func, deadline=math.inf):
+        '''
+        Arguments:
+            name - name of timer to create (str)
+            func - function to time (function)
+            deadline - durations longer than this are counted as misses, in sec. (float)
+        Returns:
+            func - timed version of 'func', or 'func' itself if disabled (function)
+        '''
+        if not self.enabled:
+            return func
+        return self.add(name, deadline).wrap(func)
+
+    def summaries(self):
+        '''
+        Returns:
+            summaries - 'timing_<name>' to [count, p50, p99, max, misses], to be saved
+                        with trial data; empty if disabled (dict)
+        '''
+        return {'timing_'+name: timer.summary() for name, timer in self.timers.items()}
+
+    def log_summary(self):
+        '''
+        Returns:
+            text - one line summary in ms for the GUI log (str)
+        '''
+        text = []
+        for name, timer in self.timers.items():
+            count, p50, p99, max_time, misses = timer.summary()
+            if count:
+                text.append('{}: p50 {:.2f}, p99 {:.2f}, max {:.2f} ms, {} miss.'.format(name, p50*1e3, p99*1e3, max_time*1e3, misses))
+        return '; '.join(text)
+
+    def reset(self):
+        for name, timer in self.timers.items():
+            self.resets.get(name, timer.reset)()
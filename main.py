@@ -15,8 +15,10 @@ from experiment.simple_saccade import SimpleSacGuiProcess, SimpleSacFsmProcess
 from experiment.corr_saccade import CorrSacGuiProcess, CorrSacFsmProcess
 from target import TargetWidget
 import app_lib as lib
+from shared_ring import SharedRing
+from parameter_store import write_parameter_file, update_parameter_file
 
-import sys, multiprocessing, os, json, time, traceback
+import sys, multiprocessing, os, time, traceback
 from pathlib import Path
 import pyqtgraph as pg
 
@@ -24,6 +26,7 @@ class MainGui(QMainWindow):
     def __init__(self, parent = None):
         super(MainGui,self).__init__(parent)
         multiprocessing.set_start_method('spawn') # start child process that isn't a copy of the main one
+        self.real_time_data_ring = None # shared memory btwn. FSM and GUI processes of current task
         
         # Build menu
         self.menubar = self.menuBar()
@@ -250,10 +253,10 @@ class MainGui(QMainWindow):
         fsm_to_gui_rcvr, fsm_to_gui_sndr = multiprocessing.Pipe(duplex=False) 
         gui_to_fsm_rcvr, gui_to_fsm_sndr = multiprocessing.Pipe(duplex=False)
         
-        real_time_data_Array = multiprocessing.Array('d', range(5))
+        real_time_data_ring = self.new_real_time_data_ring(5) # t, eye_x, eye_y, tgt_x, tgt_y
         exp_name = 'simple_saccade'
-        fsm_process = SimpleSacFsmProcess(exp_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array, self.main_parameter, self.mon_parameter)
-        gui_process = SimpleSacGuiProcess(exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array, self.main_parameter)
+        fsm_process = SimpleSacFsmProcess(exp_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring, self.main_parameter, self.mon_parameter)
+        gui_process = SimpleSacGuiProcess(exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring, self.main_parameter)
         
         fsm_process.start()
         time.sleep(0.25) # without this artificial delay, sometimes causes error
@@ -280,10 +283,10 @@ class MainGui(QMainWindow):
         fsm_to_gui_rcvr, fsm_to_gui_sndr = multiprocessing.Pipe(duplex=False)
         gui_to_fsm_rcvr, gui_to_fsm_sndr = multiprocessing.Pipe(duplex=False)
         
-        real_time_data_Array = multiprocessing.Array('d', range(5))
+        real_time_data_ring = self.new_real_time_data_ring(5) # t, eye_x, eye_y, tgt_x, tgt_y
         exp_name = 'random_corrective_saccades'
-        fsm_process = CorrSacFsmProcess(exp_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array, self.main_parameter, self.mon_parameter)
-        gui_process = CorrSacGuiProcess(exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array, self.main_parameter)
+        fsm_process = CorrSacFsmProcess(exp_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring, self.main_parameter, self.mon_parameter)
+        gui_process = CorrSacGuiProcess(exp_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring, self.main_parameter)
                             
         fsm_process.start()
         time.sleep(0.25) # without this artificial delay, sometimes causes error
@@ -310,10 +313,10 @@ class MainGui(QMainWindow):
         fsm_to_gui_rcvr, fsm_to_gui_sndr = multiprocessing.Pipe(duplex=False)
         gui_to_fsm_rcvr, gui_to_fsm_sndr = multiprocessing.Pipe(duplex=False)
         
-        real_time_data_Array = multiprocessing.Array('d', range(4))
+        real_time_data_ring = self.new_real_time_data_ring(4) # tgt_num, t, eye_raw_x, eye_raw_y
         cal_name = 'calibration'
-        fsm_process = CalFsmProcess(cal_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array, self.main_parameter, self.mon_parameter)
-        gui_process = CalGuiProcess(cal_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array, self.main_parameter)
+        fsm_process = CalFsmProcess(cal_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring, self.main_parameter, self.mon_parameter)
+        gui_process = CalGuiProcess(cal_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring, self.main_parameter)
         
         fsm_process.start()
         time.sleep(0.25) # without this artificial delay, sometimes causes error
@@ -340,10 +343,10 @@ class MainGui(QMainWindow):
         fsm_to_gui_rcvr, fsm_to_gui_sndr = multiprocessing.Pipe(duplex=False)
         gui_to_fsm_rcvr, gui_to_fsm_sndr = multiprocessing.Pipe(duplex=False)
         
-        real_time_data_Array = multiprocessing.Array('d', range(5))
+        real_time_data_ring = self.new_real_time_data_ring(5) # t, eye_x, eye_y, tgt_x, tgt_y
         cal_name = 'refinement'
-        fsm_process = CalRefineFsmProcess(cal_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array, self.main_parameter, self.mon_parameter)
-        gui_process = CalRefineGuiProcess(cal_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_Array, self.main_parameter)
+        fsm_process = CalRefineFsmProcess(cal_name, fsm_to_gui_sndr, gui_to_fsm_rcvr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring, self.main_parameter, self.mon_parameter)
+        gui_process = CalRefineGuiProcess(cal_name, fsm_to_gui_rcvr, gui_to_fsm_sndr, stop_exp_Event, stop_fsm_process_Event, real_time_data_ring, self.main_parameter)
         
         fsm_process.start()
         time.sleep(0.25) # without this artificial delay, sometimes causes error
@@ -383,19 +386,13 @@ class MainGui(QMainWindow):
             self.log_QPlainTextEdit.appendPlainText("ID already present")
     def monkey_delete_QPushButton_clicked(self):
         if self.monkey_QComboBox.count() > 1:
-            with open(self.cal_parameter_file_path,'r') as file:
-                all_parameter = json.load(file)
-            all_parameter.pop(self.monkey_QComboBox.currentText(),'')
-            with open(self.cal_parameter_file_path,'w') as file:
-                json.dump(all_parameter, file, indent=4)
+            monkey_id = self.monkey_QComboBox.currentText()
+            update_parameter_file(self.cal_parameter_file_path, lambda all_parameter: all_parameter.pop(monkey_id,''))
                 
             try:
                 parameter_path = os.path.join(str(Path().absolute()),'experiment','exp_parameter.json')
-                with open(parameter_path, 'r') as file:
-                    all_parameter = json.load(file)
-                all_parameter.pop(self.monkey_QComboBox.currentText(),'')    
-                with open(parameter_path, 'w') as file:
-                    json.dump(all_parameter, file, indent=4)
+                if os.path.exists(parameter_path):
+                    update_parameter_file(parameter_path, lambda all_parameter: all_parameter.pop(monkey_id,''))
             except:
                 pass
             
@@ -415,22 +412,19 @@ class MainGui(QMainWindow):
         self.mon_parameter['monitor_size'][1] = self.monitor_size_vert_QDoubleSpinBox.value()
         self.mon_parameter['monitor_distance'] = self.monitor_dist_QDoubleSpinBox.value()
         self.mon_parameter['monitor_width'] = self.monitor_width_QDoubleSpinBox.value()
-        with open(self.mon_parameter_file_path,'w') as file:
-            json.dump(self.mon_parameter, file, indent=4)
+        write_parameter_file(self.mon_parameter_file_path, self.mon_parameter)
         which_eye_tracked = self.which_eye_QComboBox.currentText()
         self.main_parameter['current_monkey'] = self.monkey_QComboBox.currentText()
         self.main_parameter['sys_password'] = self.sys_password_QLineEdit.text()
-        with open(self.cal_parameter_file_path,'r') as file:
-            all_parameter = json.load(file)
-        all_parameter[self.main_parameter['current_monkey']]['calibration']['which_eye_tracked'] = which_eye_tracked
-        with open(self.cal_parameter_file_path,'w') as file:
-            json.dump(all_parameter, file, indent=4)
+        current_monkey = self.main_parameter['current_monkey']
+        def set_which_eye_tracked(all_parameter):
+            all_parameter[current_monkey]['calibration']['which_eye_tracked'] = which_eye_tracked
+        update_parameter_file(self.cal_parameter_file_path, set_which_eye_tracked)
         self.main_parameter['monkey'] = []
         for counter_id in range(self.monkey_QComboBox.count()):
             self.main_parameter['monkey'].append(self.monkey_QComboBox.itemText(counter_id))
         
-        with open(self.main_parameter_file_path,'w') as file:
-            json.dump(self.main_parameter, file, indent=4)
+        write_parameter_file(self.main_parameter_file_path, self.main_parameter)
     
     def lock_parameter(self):
         self.lock_QPushButton.setDisabled(True)
@@ -482,7 +476,19 @@ class MainGui(QMainWindow):
                      }
         return parameter
     
+    def new_real_time_data_ring(self, num_field):
+        '''
+        removes the name of previous task's ring, which its processes attached to long ago,
+        and creates a new one to be passed to FSM and GUI processes
+        '''
+        if self.real_time_data_ring is not None:
+            self.real_time_data_ring.unlink()
+        self.real_time_data_ring = SharedRing(num_field)
+        return self.real_time_data_ring
+    
     def closeEvent(self,event):
+        if self.real_time_data_ring is not None:
+            self.real_time_data_ring.unlink()
         try:
             pg.exit() # this should come at the end 
         except:
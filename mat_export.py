@@ -0,0 +1,226 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Converts a session HDF5 file to .mat, one trial at a time, so memory use does not grow with
+the session. The .mat has the same content as 'scipy.io.savemat' gave before: a struct
+'data' with the file attributes (exp. parameters) and a struct per trial, for either layout
+(trial groups or session_layout). It is written
+as a MATLAB v7.3 file, which is HDF5 itself, so each dataset is copied block by block into
+the layout MATLAB expects. If the session has something v7.3 cannot hold without MATLAB
+cell arrays (e.g., a list of strings as parameter), it is written with 'savemat' (v5)
+instead, which reads the whole session into memory.
+MatExportProcess does this in a separate process and sends its progress through a pipe:
+    ('progress', num_done, num_trial), then ('done', mat_file_path, version) or ('error', text)
+"""
+import multiprocessing, time, platform
+import numpy as np
+import h5py
+from scipy.io import savemat
+
+from session_layout import is_session_layout, SessionReader
+
+MAT_HEADER_SIZE = 512 # HDF5 user block, where the MAT-file header goes
+COPY_BLOCK_LEN = 1 << 20 # num. of elements copied at once
+
+MATLAB_CLASS = {'f8':'double','f4':'single','i1':'int8','u1':'uint8','i2':'int16','u2':'uint16',
+                'i4':'int32','u4':'uint32','i8':'int64','u8':'uint64','b1':'logical'}
+
+class NotMat73Error(TypeError):
+    '''
+    value that needs MATLAB cell arrays or objects; not written by this module in v7.3
+    '''
+
+def _matlab_class(dtype):
+    try:
+        return MATLAB_CLASS[dtype.kind + str(dtype.itemsize)]
+    except KeyError:
+        raise NotMat73Error('no MATLAB class for ' + str(dtype))
+
+def _set_class(obj, matlab_class):
+    obj.attrs['MATLAB_class'] = np.bytes_(matlab_class)
+
+def _set_fields(grp, names):
+    # MATLAB reads struct fields in this order
+    field_dtype = h5py.vlen_dtype(np.dtype('S1'))
+    fields = np.empty(len(names), dtype=object)
+    for idx, name in enumerate(names):
+        fields[idx] = np.frombuffer(name.encode(), dtype='S1')
+    grp.attrs.create('MATLAB_fields', fields, dtype=field_dtype)
+
+def _matlab_shape(shape):
+    '''
+    Returns:
+        h5_shape - HDF5 shape of an array that 'savemat' would save with this shape;
+                   1-D arrays are 1xN rows, and MATLAB dims are stored reversed (tuple)
+    '''
+    if len(shape) == 0:
+        return (1,1)
+    if len(shape) == 1:
+        return (shape[0],1)
+    return tuple(reversed(shape))
+
+def _write_empty(grp, name, shape, matlab_class):
+    # MATLAB stores the dims of an empty array instead of its data; 'savemat' saves empty
+    # 1-D arrays and strings as 0x0
+    shape = (0,0) if len(shape) < 2 else shape
+    dims = np.array(shape, dtype=np.uint64)
+    dataset = grp.create_dataset(name, data=dims)
+    _set_class(dataset, matlab_class)
+    dataset.attrs['MATLAB_empty'] = np.uint8(1)
+
+def _write_value(grp, name, value):
+    '''
+    writes a value held in memory, e.g., a file attribute
+    '''
+    if isinstance(value, bytes):
+        value = value.decode()
+    if isinstance(value, str):
+        if not value:
+            _write_empty(grp, name, (0,), 'char')
+            return
+        data = np.frombuffer(value.encode('utf-16-le'), dtype=np.uint16)
+        dataset = grp.create_dataset(name, data=data.reshape(-1,1))
+        _set_class(dataset, 'char')
+        dataset.attrs['MATLAB_int_decode'] = np.int32(2)
+        return
+    value = np.asarray(value)
+    matlab_class = _matlab_class(value.dtype)
+    if value.size == 0:
+        _write_empty(grp, name, value.shape, matlab_class)
+        return
+    data = value.astype(np.uint8) if matlab_class == 'logical' else value
+    dataset = grp.create_dataset(name, data=data.T.reshape(_matlab_shape(value.shape)))
+    _set_class(dataset, matlab_class)
+
+def _copy_dataset(grp, name, source):
+    '''
+    copies a dataset; long 1-D datasets block by block, so memory use is limited
+    '''
+    matlab_class = _matlab_class(source.dtype)
+    if source.size == 0:
+        _write_empty(grp, name, source.shape, matlab_class)
+        return
+    if source.ndim != 1:
+        _write_value(grp, name, source[()]) # e.g., calibration matrix; small
+        return
+    dtype = np.uint8 if matlab_class == 'logical' else source.dtype
+    if source.shape[0] <= COPY_BLOCK_LEN:
+        dataset = grp.create_dataset(name, data=source[()].astype(dtype, copy=False).reshape(-1,1))
+        _set_class(dataset, matlab_class)
+        return
+    dataset = grp.create_dataset(name, shape=_matlab_shape(source.shape), dtype=dtype)
+    _set_class(dataset, matlab_class)
+    for start in range(0, source.shape[0], COPY_BLOCK_LEN):
+        end = min(start + COPY_BLOCK_LEN, source.shape[0])
+        dataset[start:end,0] = source[start:end]
+
+def _mat_header():
+    text = 'MATLAB 7.3 MAT-file, Platform: {}, Created on: {} HDF5 schema 1.00 .'.format(
+        platform.system(), time.strftime('%a %b %d %H:%M:%S %Y'))
+    header = text.encode()[:116].ljust(116, b' ') + bytes(8) + b'\x00\x02IM'
+    return header.ljust(MAT_HEADER_SIZE, b'\x00')
+
+def _trial_keys(data_file):
+    '''
+    Returns:
+        trial_keys - 'trial_<num>' groups in trial order (list of str)
+    '''
+    return sorted(data_file.keys(), key=lambda key: (int(key[6:]) if key[6:].isdigit() else float('inf'), key))
+
+def _trials(data_file):
+    '''
+    Returns:
+        trial_keys - name of the struct of each trial (list of str)
+        trials - yields entry name to data (h5py.Dataset or np.array) of each trial, from
+                 'trial_<num>' groups or from the columns of the session layout (generator)
+    '''
+    if is_session_layout(data_file):
+        reader = SessionReader(data_file)
+        trial_nums = reader.trial_nums()
+        return ['trial_'+str(trial_num) for trial_num in trial_nums], (reader.read_trial(trial_num) for trial_num in trial_nums)
+    trial_keys = _trial_keys(data_file)
+    return trial_keys, (dict(data_file[trial_key].items()) for trial_key in trial_keys)
+
+def write_mat73(data_file, mat_file_path, progress=None):
+    '''
+    Arguments:
+        data_file - session file (h5py.File)
+        mat_file_path - full path of .mat file to write (str)
+        progress - called with (num_done, num_trial) after each trial (function)
+    '''
+    trial_keys, trials = _trials(data_file)
+    with h5py.File(mat_file_path, 'w', userblock_size=MAT_HEADER_SIZE) as mat_file:
+        data_grp = mat_file.create_group('data')
+        _set_class(data_grp, 'struct')
+        for key, value in data_file.attrs.items():
+            _write_value(data_grp, key, value)
+        for num_done, (trial_key, trial_data) in enumerate(zip(trial_keys, trials)):
+            trial_grp = data_grp.create_group(trial_key)
+            _set_class(trial_grp, 'struct')
+            for data_key, value in trial_data.items():
+                if isinstance(value, h5py.Dataset):
+                    _copy_dataset(trial_grp, data_key, value)
+                else:
+                    _write_value(trial_grp, data_key, value)
+            _set_fields(trial_grp, list(trial_data.keys()))
+            if progress is not None:
+                progress(num_done + 1, len(trial_keys))
+        _set_fields(data_grp, list(data_file.attrs.keys()) + trial_keys)
+    with open(mat_file_path, 'r+b') as mat_file:
+        mat_file.write(_mat_header())
+
+def write_mat5(data_file, mat_file_path, progress=None):
+    '''
+    same as before; reads the whole session, then 'savemat'
+    '''
+    data_dict = {}
+    for key,value in data_file.attrs.items():
+        data_dict[key] = value
+    trial_keys, trials = _trials(data_file)
+    for num_done, (trial_key, trial_data) in enumerate(zip(trial_keys, trials)):
+        data_dict[trial_key] = {}
+        for data_key, data_value in trial_data.items():
+            data_dict[trial_key][data_key] = data_value[:]
+        if progress is not None:
+            progress(num_done + 1, len(trial_keys))
+    savemat(mat_file_path,{'data':data_dict})
+
+def convert_to_mat(data_file_path, mat_file_path, progress=None):
+    '''
+    Arguments:
+        data_file_path - session HDF5 file (str)
+        mat_file_path - .mat file to write (str)
+        progress - called with (num_done, num_trial) after each trial (function)
+    Returns:
+        version - MAT-file version written, '7.3' or '5' (str)
+    '''
+    with h5py.File(data_file_path, 'r') as data_file:
+        try:
+            write_mat73(data_file, mat_file_path, progress)
+            return '7.3'
+        except NotMat73Error:
+            write_mat5(data_file, mat_file_path, progress)
+            return '5'
+
+class MatExportProcess(multiprocessing.Process):
+    def __init__(self, data_file_path, mat_file_path, progress_sndr):
+        '''
+        Arguments:
+            data_file_path - session HDF5 file (str)
+            mat_file_path - .mat file to write (str)
+            progress_sndr - sending end of a Pipe (Connection)
+        '''
+        super().__init__(daemon=True)
+        self.data_file_path = data_file_path
+        self.mat_file_path = mat_file_path
+        self.progress_sndr = progress_sndr
+
+    def run(self):
+        try:
+            version = convert_to_mat(self.data_file_path, self.mat_file_path,
+                                     lambda num_done, num_trial: self.progress_sndr.send(('progress', num_done, num_trial)))
+            self.progress_sndr.send(('done', self.mat_file_path, version))
+        except Exception as error:
+            self.progress_sndr.send(('error', str(error)))
+        self.progress_sndr.close()
@@ -0,0 +1,148 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Parameter (.json) files shared by the main, GUI and FSM processes. Each process caches what
+it read and parses a file again only if it was replaced since then. Files are written to a
+temporary file that is then renamed over the old one, so a reader never sees a half-written
+file, and read-modify-write is done under a lock so writers don't undo each other's changes.
+"""
+import os, json, pickle, time, errno
+from contextlib import contextmanager
+try:
+    import fcntl
+    msvcrt = None
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+REPLACE_RETRY = 50 # times os.replace is tried when the file is open in another process (Windows)
+REPLACE_RETRY_INTERVAL = 0.01 # s
+LOCK_TIMEOUT = 10.0 # s; a writer holds the lock for a few ms
+LOCK_RETRY_INTERVAL = 0.005 # s
+# Errors of a non-blocking lock that is held by another process; anything else is raised
+LOCK_HELD_ERRNO = (errno.EACCES, errno.EAGAIN, errno.EWOULDBLOCK, errno.EDEADLK)
+
+_cache = {} # file path -> (stamp, pickled content), per process; unpickling is the fastest copy
+
+def _stamp(file_path):
+    # Renaming gives the file a new inode, so this changes on every write
+    stat = os.stat(file_path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def read_parameter_file(file_path):
+    '''
+    Arguments:
+        file_path - full path of parameter file (str)
+    Returns:
+        all_parameter - content of the file (dict); a copy, so can be modified by the caller
+    '''
+    stamp = _stamp(file_path)
+    cached = _cache.get(file_path)
+    if cached is None or cached[0] != stamp:
+        with open(file_path,'r') as file:
+            cached = (stamp, pickle.dumps(json.load(file), pickle.HIGHEST_PROTOCOL))
+        _cache[file_path] = cached
+    return pickle.loads(cached[1])
+
+def _replace(src_path, dst_path):
+    # On Windows, replacing fails while another process has the file open, e.g., to read it
+    for retry in range(REPLACE_RETRY):
+        try:
+            os.replace(src_path, dst_path)
+            return
+        except PermissionError:
+            if retry == REPLACE_RETRY - 1:
+                raise
+            time.sleep(REPLACE_RETRY_INTERVAL)
+
+def write_parameter_file(file_path, all_parameter):
+    '''
+    replaces the file in one step
+    Arguments:
+        file_path - full path of parameter file (str)
+        all_parameter - content of the file (dict)
+    '''
+    text = json.dumps(all_parameter, indent=4)
+    temp_file_path = file_path + '.' + str(os.getpid()) + '.tmp'
+    with open(temp_file_path,'w') as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    _replace(temp_file_path, file_path)
+    _cache[file_path] = (_stamp(file_path), pickle.dumps(json.loads(text), pickle.HIGHEST_PROTOCOL)) # as read back
+
+def parameter_file_changed(file_path):
+    '''
+    Returns:
+        changed - whether the file was replaced (by any process) since this process last
+                  read or wrote it (bool)
+    '''
+    cached = _cache.get(file_path)
+    return cached is None or not os.path.exists(file_path) or cached[0] != _stamp(file_path)
+
+@contextmanager
+def parameter_file_lock(file_path):
+    '''
+    lock on a separate file, since the parameter file itself is replaced on every write.
+    Raises TimeoutError if another process holds it for longer than LOCK_TIMEOUT
+    '''
+    with open(file_path + '.lock','w') as lock_file:
+        end_t = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1) # first byte of the file
+                break
+            except OSError as error:
+                if error.errno not in LOCK_HELD_ERRNO:
+                    raise
+                if time.monotonic() > end_t:
+                    raise TimeoutError('parameter file locked for more than {} s: {}'.format(LOCK_TIMEOUT, file_path + '.lock'))
+                time.sleep(LOCK_RETRY_INTERVAL)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def update_parameter_file(file_path, update):
+    '''
+    Arguments:
+        file_path - full path of parameter file (str)
+        update - modifies content of the file in place; given {} if no file (function)
+    Returns:
+        all_parameter - new content of the file (dict)
+    '''
+    with parameter_file_lock(file_path):
+        if os.path.exists(file_path):
+            all_parameter = read_parameter_file(file_path)
+        else:
+            all_parameter = {}
+        update(all_parameter)
+        write_parameter_file(file_path, all_parameter)
+    return all_parameter
+
+def set_parameter(file_path, parameter, *keys):
+    '''
+    Arguments:
+        file_path - full path of parameter file (str)
+        parameter - parameters to save (dict)
+        keys - where to save them, e.g., monkey and instance name; missing levels are
+               created. No keys to replace the whole file (str)
+    '''
+    def update(all_parameter):
+        if not keys:
+            all_parameter.clear()
+            all_parameter.update(parameter)
+            return
+        level = all_parameter
+        for key in keys[:-1]:
+            level = level.setdefault(key, {})
+        level[keys[-1]] = parameter
+    update_parameter_file(file_path, update)
@@ -8,11 +8,16 @@ from PyQt5.QtCore import pyqtSlot
 
 from fsm_gui import FsmGui
 from data_manager import DataManager
+from trial_writer import DEFAULT_STORAGE
+from trial_journal import JOURNAL_SYNC_INTERVAL
 import app_lib as lib
+from parameter_store import update_parameter_file
 
 
-import sys, zmq, math, os, json, pathlib, shutil, ctypes
+import sys, zmq, os, pathlib, shutil, ctypes, collections
 import numpy as np
+
+SAVE_MSG_TITLES = ('init_data', 'session_attrs', 'trial_data') # held while the save queue is full
 class PlotGui(FsmGui):
     def __init__(self,x):
         super(PlotGui,self).__init__(x)
@@ -50,18 +55,25 @@ class PlotGui(FsmGui):
         self.data_path_QLineEdit.setText(sys_parameter['data_path'])
         self.data_path_QFileDialog.setDirectory(self.data_path_QLineEdit.text())
 
-        self.data_manager = DataManager()
+        self.data_manager = DataManager(sys_parameter.get('storage_profile', DEFAULT_STORAGE), # e.g., 'none' to not compress
+                                        sys_parameter.get('data_layout', 'trial'), # or 'session'
+                                        journal_sync_interval=sys_parameter.get('journal_sync_interval', JOURNAL_SYNC_INTERVAL))
+        self.convert_QTimer = QtCore.QTimer() # checks progress of .mat conversion
+        self.convert_waiting = False # True until the session is saved and conversion starts
+        self.pending_save_msgs = collections.deque() # messages to save, received while the save queue was full
+        self.recent_rec_dir = '' # Open Ephys recording folder, found when stopped
+        self.thread_pool.start(self.data_manager) # saves data in background until closed
         # Create socket for ZMQ
         try:
             context = zmq.Context()
             self.fsm_to_plot_socket = context.socket(zmq.SUB)
-            self.fsm_to_plot_socket.setsockopt(zmq.CONFLATE,1)
             self.fsm_to_plot_socket.connect("tcp://192.168.0.2:5556")
             self.fsm_to_plot_socket.subscribe("")
             self.fsm_to_plot_poller = zmq.Poller()
             self.fsm_to_plot_poller.register(self.fsm_to_plot_socket, zmq.POLLIN)
 
             self.fsm_to_plot_priority_socket = context.socket(zmq.SUB)
+            self.fsm_to_plot_priority_socket.setsockopt(zmq.RCVHWM, 0) # no limit; see receiver_QTimer_timeout
             self.fsm_to_plot_priority_socket.connect("tcp://192.168.0.2:5557")
             self.fsm_to_plot_priority_socket.subscribe("")
             self.fsm_to_plot_priority_poller = zmq.Poller()
@@ -78,6 +90,7 @@ class PlotGui(FsmGui):
         # Signals
         self.data_manager.signals.to_main_thread.connect(self.data_manager_signalled)
         self.receiver_QTimer.timeout.connect(self.receiver_QTimer_timeout)
+        self.convert_QTimer.timeout.connect(self.convert_QTimer_timeout)
         self.toolbar_connect_QAction.triggered.connect(self.toolbar_connect_QAction_triggered)
         self.toolbar_run_QAction.triggered.connect(self.toolbar_run_QAction_triggered)
         self.toolbar_stop_QAction.triggered.connect(self.toolbar_stop_QAction_triggered)
@@ -142,25 +155,16 @@ class PlotGui(FsmGui):
                 self.open_ephys_socket.recv()
                 # Find the latest recording folder and rename subfolder to 'raw_data'
                 rec_dir = self.data_path_QLineEdit.text()
-                recent_rec_dir = max([os.path.join(rec_dir,d) for d in os.listdir(rec_dir)], key=os.path.getmtime)
-                os.rename(os.path.join(recent_rec_dir,os.listdir(recent_rec_dir)[0]), os.path.join(recent_rec_dir,'raw_data'))
+                self.recent_rec_dir = max([os.path.join(rec_dir,d) for d in os.listdir(rec_dir)], key=os.path.getmtime)
+                os.rename(os.path.join(self.recent_rec_dir,os.listdir(self.recent_rec_dir)[0]), os.path.join(self.recent_rec_dir,'raw_data'))
             except:
                 self.log_QPlainTextEdit.appendPlainText('Error in controlling Open Ephys')
         self.toolbar_run_QAction.setEnabled(True)
         self.toolbar_stop_QAction.setDisabled(True)
         # Stop FSM
         self.plot_to_fsm_socket.send_pyobj(('stop',0))
-        # Convert the data of the current recording
-        self.data_manager.convert_data()
-        # If controlling Open Ephys, copy the behavior files to Open Ephys folder
-        if self.open_ephys_QCheckBox.isChecked():
-            try:
-                self.open_ephys_socket.send_string('IsAcquiring') # dummy check to see Open Ephys comm. works
-                self.open_ephys_socket.recv()
-                shutil.copy(os.path.join(self.data_manager.data_file_path +'.hdf5'),os.path.join(recent_rec_dir,'raw_data')) # rec. path from above
-                shutil.copy(os.path.join(self.data_manager.data_file_path +'.mat'),os.path.join(recent_rec_dir,'raw_data'))
-            except Exception as error:
-                self.log_QPlainTextEdit.appendPlainText(str(error) + '.')
+        # Convert the data of the current recording, once everything received is saved
+        self.start_conversion()
         # Enable file path search
         self.data_path_QPushButton.setEnabled(True)
     @pyqtSlot()
@@ -187,98 +191,154 @@ class PlotGui(FsmGui):
 
     @pyqtSlot()
     def receiver_QTimer_timeout(self):
-        # Non-priority channel - only data for real-time plotting
-        if self.fsm_to_plot_poller.poll(0):
-            msg = self.fsm_to_plot_socket.recv_pyobj(flags=zmq.NOBLOCK)
-            t,eye_x,eye_y,tgt_x,tgt_y = msg
-            if not math.isnan(t):
-                self.eye_x_data.append(eye_x)
-                self.eye_y_data.append(eye_y)
-                self.tgt_x_data.append(tgt_x)
-                self.tgt_y_data.append(tgt_y)
-                self.t_data.append(t)
-                # Plot
-                self.plot_1_eye.setData([eye_x],[eye_y])
-                self.plot_1_tgt.setData([tgt_x],[tgt_y])
-                self.plot_2_eye_x.setData(self.t_data,self.eye_x_data)
-                self.plot_2_eye_y.setData(self.t_data,self.eye_y_data)
-                self.plot_2_tgt_x.setData(self.t_data,self.tgt_x_data)
-                self.plot_2_tgt_y.setData(self.t_data,self.tgt_y_data)
-        if self.fsm_to_plot_priority_poller.poll(0):
+        # Non-priority channel - only data for real-time plotting; each message has all
+        # samples since last one (Nx5 of t, eye_x, eye_y, tgt_x, tgt_y)
+        num_msg = 0
+        while self.fsm_to_plot_poller.poll(0):
+            real_time_data = self.fsm_to_plot_socket.recv_pyobj(flags=zmq.NOBLOCK)
+            real_time_data = real_time_data[~np.isnan(real_time_data[:,0])]
+            if len(real_time_data):
+                t, eye_x, eye_y, tgt_x, tgt_y = real_time_data.T
+                self.eye_x_data.extend(eye_x)
+                self.eye_y_data.extend(eye_y)
+                self.tgt_x_data.extend(tgt_x)
+                self.tgt_y_data.extend(tgt_y)
+                self.t_data.extend(t)
+                num_msg += 1
+        if num_msg:
+            # Plot
+            self.plot_1_eye.setData([self.eye_x_data[-1]],[self.eye_y_data[-1]])
+            self.plot_1_tgt.setData([self.tgt_x_data[-1]],[self.tgt_y_data[-1]])
+            self.plot_2_eye_x.setData(self.t_data,self.eye_x_data)
+            self.plot_2_eye_y.setData(self.t_data,self.eye_y_data)
+            self.plot_2_tgt_x.setData(self.t_data,self.tgt_x_data)
+            self.plot_2_tgt_y.setData(self.t_data,self.tgt_y_data)
+        # Every message is read each tick, so commands (pumps, run/stop, ...) never wait for
+        # saving. While saving is behind, messages to be saved are held here in order instead;
+        # the high-water mark of this socket is 0 (no limit) on both ends, since zmq would
+        # drop messages past it
+        while self.fsm_to_plot_priority_poller.poll(0):
             msg = self.fsm_to_plot_priority_socket.recv_pyobj()
-            msg_title = msg[0]
-            if msg_title == 'tgt_data':
-                cue_x, cue_y, end_x, end_y = msg[1]
-                self.plot_1_cue.setData([cue_x],[cue_y])
-                self.plot_1_end.setData([end_x],[end_y])
-            if msg_title == 'trial_data':
-                self.data_manager.trial_num = msg[1]
-                self.data_manager.trial_data = msg[2]
-                self.data_manager.save_data()
-            if msg_title == 'pump_1':
-                self.pump_1.pump_once_QPushButton_clicked()
-            if msg_title == 'pump_2':
-                self.pump_2.pump_once_QPushButton_clicked()
-            if msg_title == 'log':
-                self.log_QPlainTextEdit.appendPlainText(msg[1])
-            if msg_title == 'confirm_connection':
-                self.plot_to_fsm_socket.send_pyobj((0,0))
-            if msg_title == 'init_data':
-                _, exp_name, exp_parameter = msg
-                self.data_manager.init_data(exp_name,exp_parameter)
-            if msg_title == 'run':
-                self.toolbar_run_QAction.setDisabled(True)
-                self.toolbar_stop_QAction.setEnabled(True)
-                # Control Open Ephys
-                if self.open_ephys_QCheckBox.isChecked():
-                    try:
-                        open_ephys_msg = f'StartRecord RecordNode=1 CreateNewDir=1 RecDir={self.data_path_QLineEdit.text()}'
-                        self.open_ephys_socket.send_string(open_ephys_msg)
-                        self.open_ephys_socket.recv()
-                    except:
-                        self.log_QPlainTextEdit.appendPlainText('Error in controlling Open Ephys')
-                # Disable file path search
-                self.data_path_QPushButton.setDisabled(True)
-            if msg_title == 'stop':
-                self.toolbar_run_QAction.setEnabled(True)
-                self.toolbar_stop_QAction.setDisabled(True)
-                # Control Open Ephys
-                if self.open_ephys_QCheckBox.isChecked():
-                    try:
-                        open_ephys_msg = 'StopRecord'
-                        self.open_ephys_socket.send_string(open_ephys_msg)
-                        self.open_ephys_socket.recv()
-                        # Find the latest recording folder and rename subfolder to 'raw_data'
-                        rec_dir = self.data_path_QLineEdit.text()
-                        recent_rec_dir = max([os.path.join(rec_dir,d) for d in os.listdir(rec_dir)], key=os.path.getmtime)
-                        os.rename(os.path.join(recent_rec_dir,os.listdir(recent_rec_dir)[0]), os.path.join(recent_rec_dir,'raw_data'))
-                    except:
-                        self.log_QPlainTextEdit.appendPlainText('Error in controlling Open Ephys')
-                        self.toolbar_run_QAction.setEnabled(True)
-                        self.toolbar_stop_QAction.setDisabled(True)
-                # Convert the data of the current recording
-                self.data_manager.convert_data()
+            if msg[0] in SAVE_MSG_TITLES:
+                self.pending_save_msgs.append(msg)
+            else:
+                self.handle_priority_msg(msg)
+        while self.pending_save_msgs and not self.data_manager.is_full():
+            self.handle_priority_msg(self.pending_save_msgs.popleft())
+
+    def handle_priority_msg(self, msg):
+        '''
+        Arguments:
+            msg - message from the priority socket, (title, ...) (tuple)
+        '''
+        msg_title = msg[0]
+        if msg_title == 'tgt_data':
+            cue_x, cue_y, end_x, end_y = msg[1]
+            self.plot_1_cue.setData([cue_x],[cue_y])
+            self.plot_1_end.setData([end_x],[end_y])
+        if msg_title == 'trial_data':
+            self.data_manager.receive_trial_data(msg[1], msg[2]) # journaled, then saved in background
+        if msg_title == 'pump_1':
+            self.pump_1.pump_once_QPushButton_clicked()
+        if msg_title == 'pump_2':
+            self.pump_2.pump_once_QPushButton_clicked()
+        if msg_title == 'log':
+            self.log_QPlainTextEdit.appendPlainText(msg[1])
+        if msg_title == 'confirm_connection':
+            self.plot_to_fsm_socket.send_pyobj((0,0))
+        if msg_title == 'init_data':
+            _, exp_name, exp_parameter = msg
+            self.data_manager.reset_metrics()
+            self.data_manager.receive_init_data(exp_name, exp_parameter)
+        if msg_title == 'session_attrs':
+            self.data_manager.receive_attrs(msg[1])
+        if msg_title == 'run':
+            self.toolbar_run_QAction.setDisabled(True)
+            self.toolbar_stop_QAction.setEnabled(True)
+            # Control Open Ephys
+            if self.open_ephys_QCheckBox.isChecked():
+                try:
+                    open_ephys_msg = f'StartRecord RecordNode=1 CreateNewDir=1 RecDir={self.data_path_QLineEdit.text()}'
+                    self.open_ephys_socket.send_string(open_ephys_msg)
+                    self.open_ephys_socket.recv()
+                except:
+                    self.log_QPlainTextEdit.appendPlainText('Error in controlling Open Ephys')
+            # Disable file path search
+            self.data_path_QPushButton.setDisabled(True)
+        if msg_title == 'stop':
+            self.toolbar_run_QAction.setEnabled(True)
+            self.toolbar_stop_QAction.setDisabled(True)
+            # Control Open Ephys
+            if self.open_ephys_QCheckBox.isChecked():
+                try:
+                    open_ephys_msg = 'StopRecord'
+                    self.open_ephys_socket.send_string(open_ephys_msg)
+                    self.open_ephys_socket.recv()
+                    # Find the latest recording folder and rename subfolder to 'raw_data'
+                    rec_dir = self.data_path_QLineEdit.text()
+                    self.recent_rec_dir = max([os.path.join(rec_dir,d) for d in os.listdir(rec_dir)], key=os.path.getmtime)
+                    os.rename(os.path.join(self.recent_rec_dir,os.listdir(self.recent_rec_dir)[0]), os.path.join(self.recent_rec_dir,'raw_data'))
+                except:
+                    self.log_QPlainTextEdit.appendPlainText('Error in controlling Open Ephys')
+                    self.toolbar_run_QAction.setEnabled(True)
+                    self.toolbar_stop_QAction.setDisabled(True)
+            # Convert the data of the current recording, once everything received is saved
+            self.start_conversion()
+            # Enable file path search
+            self.data_path_QPushButton.setEnabled(True)
+    def start_conversion(self):
+        '''
+        converts the session to .mat in a separate process, once the data manager has saved
+        everything queued; 'convert_QTimer' checks, so the GUI keeps receiving meanwhile. Files
+        are copied to the Open Ephys folder, if controlling it, once it is done. Stopping from
+        this GUI calls it twice, also when the FSM GUI sends 'stop' back; the second call is
+        ignored while the conversion is waiting or running, so one process writes the .mat
+        '''
+        if self.convert_QTimer.isActive():
+            return
+        self.copy_to_rec_dir = self.open_ephys_QCheckBox.isChecked()
+        self.convert_progress = 0
+        self.convert_waiting = True
+        self.convert_QTimer.start(100)
+
+    @pyqtSlot()
+    def convert_QTimer_timeout(self):
+        if self.convert_waiting:
+            if self.pending_save_msgs or not self.data_manager.is_saved():
+                return
+            self.convert_waiting = False
+            self.log_QPlainTextEdit.appendPlainText(self.data_manager.log_metrics())
+            self.data_manager.convert_data()
+        for msg in self.data_manager.poll_conversion():
+            if msg[0] == 'progress':
+                _, num_done, num_trial = msg
+                # Log every 10 %
+                if num_done*10//num_trial > self.convert_progress:
+                    self.convert_progress = num_done*10//num_trial
+                    self.log_QPlainTextEdit.appendPlainText(f'Converting to .mat: {num_done}/{num_trial} trials')
+            elif msg[0] == 'error':
+                self.convert_QTimer.stop()
+                self.log_QPlainTextEdit.appendPlainText('Error in converting to .mat: ' + msg[1] + '.')
+            elif msg[0] == 'done':
+                self.convert_QTimer.stop()
+                self.log_QPlainTextEdit.appendPlainText(f'Saved "{os.path.basename(msg[1])}" (v{msg[2]})')
                 # If controlling Open Ephys, copy the behavior files to Open Ephys folder
-                if self.open_ephys_QCheckBox.isChecked():
+                if self.copy_to_rec_dir:
                     try:
                         self.open_ephys_socket.send_string('IsAcquiring') # dummy check to see Open Ephys comm. works
                         self.open_ephys_socket.recv()
-                        shutil.copy(os.path.join(self.data_manager.data_file_path +'.hdf5'),os.path.join(recent_rec_dir,'raw_data')) # rec. path from above
-                        shutil.copy(os.path.join(self.data_manager.data_file_path +'.mat'),os.path.join(recent_rec_dir,'raw_data'))
+                        data_file_path = os.path.splitext(msg[1])[0] # may be running the next session already
+                        shutil.copy(data_file_path +'.hdf5',os.path.join(self.recent_rec_dir,'raw_data')) # rec. path from stop
+                        shutil.copy(data_file_path +'.mat',os.path.join(self.recent_rec_dir,'raw_data'))
                     except Exception as error:
                         self.log_QPlainTextEdit.appendPlainText(str(error) + '.')
-                # Enable file path search
-                self.data_path_QPushButton.setEnabled(True)
+
     @pyqtSlot()
     def data_path_QPushButton_clicked(self):
         if self.data_path_QFileDialog.exec_():
             data_path = self.data_path_QFileDialog.selectedFiles()
             # Save data path and display
-            with open('sys_parameter.json','r') as file:
-                sys_parameter = json.load(file)
-            sys_parameter['data_path'] = data_path[0]
-            with open('sys_parameter.json','w') as file:
-                json.dump(sys_parameter, file, indent=4)
+            update_parameter_file(os.path.abspath('sys_parameter.json'), lambda sys_parameter: sys_parameter.update(data_path=data_path[0]))
             self.data_path_QLineEdit.setText(data_path[0])
 
     @pyqtSlot(object)
@@ -287,6 +347,13 @@ class PlotGui(FsmGui):
         if message == 'log':
             self.log_QPlainTextEdit.appendPlainText(signal[1])
 
+    def closeEvent(self,event):
+        # Messages held while saving was behind are saved before the file is closed
+        while self.pending_save_msgs:
+            self.handle_priority_msg(self.pending_save_msgs.popleft())
+        self.data_manager.stop()
+        super().closeEvent(event)
+
     def init_open_ephys_connection(self, port_num):
         open_ephys_context = zmq.Context()
         open_ephys_socket = open_ephys_context.socket(zmq.REQ)
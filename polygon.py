@@ -0,0 +1,57 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Point-in-polygon test for selecting calibration data with an ROI. Vectorized ray casting over
+the polygon edges; only points in the polygon's bounding box are tested, in chunks, so
+selections of millions of samples need neither a Python loop over points nor a full-size
+temporary per edge.
+"""
+import numpy as np
+
+CHUNK_SIZE = 1 << 18 # num. of points tested at once; bounds temporary memory for large selections
+
+def inpolygon(xq, yq, xv, yv, chunk_size=CHUNK_SIZE):
+    """
+    checks which points are inside of the specified polygon, by ray casting with the same
+    crossing test as matplotlib's 'Path.contains_points', so points on the boundary are
+    classified the same way. Only points in the bounding box of the polygon are tested
+    Arguments:
+        xv - np.array([xv1, xv2, xv3, ..., xvN, xv1]); closing vertex is optional
+        yv - np.array([yv1, yv2, yv3, ..., yvN, yv1])
+        xq - np.array([xq1, xq2, xq3, ..., xqN])
+        yq - np.array([yq1, yq2, yq3, ..., yqN])
+        chunk_size - num. of points tested at once (int)
+    Returns:
+        contained_p - np.bool array indicating if the query points specified by xq and yq
+                      are inside of the polygon area defined by xv and yv
+    """
+    xq = np.asarray(xq, dtype=float)
+    shape = xq.shape
+    xq = xq.reshape(-1)
+    yq = np.asarray(yq, dtype=float).reshape(-1)
+    xv = np.asarray(xv, dtype=float).reshape(-1)
+    yv = np.asarray(yv, dtype=float).reshape(-1)
+    contained_p = np.zeros(xq.shape[0], dtype=bool)
+    if xv.shape[0] < 2 or xq.shape[0] == 0:
+        return contained_p.reshape(shape)
+    # Points outside bounding box cross an even number of edges
+    candidate = np.flatnonzero((xq >= xv.min()) & (xq <= xv.max()) & (yq >= yv.min()) & (yq <= yv.max()))
+    # Edges, including the one closing the polygon; (x0, y0) -> (x1, y1)
+    x0 = xv.tolist()
+    y0 = yv.tolist()
+    x1 = x0[1:] + x0[:1]
+    y1 = y0[1:] + y0[:1]
+    edges = [edge for edge in zip(x0, y0, x1, y1) if edge[1] != edge[3]] # horizontal edges never cross
+    for start in range(0, candidate.shape[0], chunk_size):
+        idx = candidate[start:start+chunk_size]
+        tx = xq[idx]
+        ty = yq[idx]
+        inside = np.zeros(idx.shape[0], dtype=bool)
+        for vx0, vy0, vx1, vy1 in edges:
+            yflag0 = vy0 >= ty
+            yflag1 = vy1 >= ty
+            crossing = ((vy1 - ty)*(vx0 - vx1) >= (vx1 - tx)*(vy0 - vy1)) == yflag1
+            inside ^= (yflag0 != yflag1) & crossing
+        contained_p[idx] = inside
+    return contained_p.reshape(shape)
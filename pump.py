@@ -8,8 +8,9 @@ from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QDoubleSp
 from PyQt5.QtCore import Qt, QThreadPool, QRunnable, pyqtSlot, QTimer, QObject, pyqtSignal
 
 import app_lib as lib
+from parameter_store import set_parameter
 
-import serial, os, json, time,traceback
+import serial, os, time,traceback
 from pathlib import Path
 
 
@@ -138,11 +139,7 @@ class PumpWidget(QWidget):
             state = self.init_serial_comm()
             if state == 1:
                 return
-            with open(self.parameter_file_path,'r+') as file:
-                parameter = json.load(file)
-                parameter[self.pump_name] = self.parameter
-                file.seek(0)
-                json.dump(parameter, file, indent=4)
+            set_parameter(self.parameter_file_path, self.parameter, self.pump_name)
             self.set_program()
             self.log_QPlainTextEdit.appendPlainText('Port change success!')
             self.port_apply_QPushButton.setStyleSheet('background-color: #39E547')
@@ -273,11 +270,7 @@ class PumpWidget(QWidget):
         
     def save_parameter(self):
         try:
-            with open(self.parameter_file_path,'r') as file:
-                all_parameter = json.load(file)
-            all_parameter[self.pump_name] = self.parameter    
-            with open(self.parameter_file_path,'w') as file:
-                json.dump(all_parameter, file, indent=4)
+            set_parameter(self.parameter_file_path, self.parameter, self.pump_name)
         except Exception as error:
             self.log_QPlainTextEdit.appendPlainText('Error in saving .json file:')
             self.log_QPlainTextEdit.appendPlainText(error)
@@ -0,0 +1,85 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+"""
+from loop_timer import LoopTimer
+
+import threading, queue, time
+
+class Scene():
+    '''
+    latest state of the exp. screen, set by the FSM (sampling) thread and drawn by
+    RenderLoop once per frame. Every change gets a new version; RenderLoop reports
+    (version, flip time) for the first flip that shows each version in 'flip_queue'.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tgt_pos = None # None if target not shown
+        self.pd = False
+        self.version = 0
+        self.flip_queue = queue.SimpleQueue()
+        self.call_queue = queue.SimpleQueue() # functions to run in render thread, e.g., remaking targets
+
+    def show(self, tgt_pos=None, pd=False):
+        '''
+        Arguments:
+            tgt_pos - (x, y) of target in deg., None to hide (tuple)
+            pd - whether to show photodiode target (bool)
+        '''
+        with self.lock:
+            self.tgt_pos = tgt_pos
+            self.pd = pd
+            self.version += 1
+
+    def get(self):
+        '''
+        Returns:
+            version, tgt_pos, pd - see 'show'
+        '''
+        with self.lock:
+            return self.version, self.tgt_pos, self.pd
+
+    def call(self, func):
+        '''
+        runs 'func' in render thread before the next frame is drawn; needed for anything
+        that touches the window, which only works from the thread that created it
+        '''
+        self.call_queue.put(func)
+
+class RenderLoop():
+    '''
+    draws the latest Scene once per frame; with 'waitBlanking=True', flip blocks until
+    vsync here instead of in the FSM loop. Must run in the thread that created the window.
+    '''
+    def __init__(self, window, scene, draw):
+        '''
+        Arguments:
+            window - PsychoPy window
+            scene - Scene to draw
+            draw - draws target and photodiode target given (tgt_pos, pd) (function)
+        '''
+        self.window = window
+        self.scene = scene
+        self.draw = draw
+        self.flip_timer = LoopTimer('flip') # time spent in flip, incl. waiting for vsync
+
+    def run(self, is_running):
+        '''
+        Arguments:
+            is_running - returns False when loop should stop (function)
+        '''
+        scene = self.scene
+        flip_timer = self.flip_timer
+        shown_version = -1
+        while is_running():
+            while not scene.call_queue.empty():
+                scene.call_queue.get()()
+            version, tgt_pos, pd = scene.get()
+            self.draw(tgt_pos, pd)
+            start = time.perf_counter()
+            self.window.flip()
+            flip_t = time.perf_counter()
+            flip_timer.record(flip_t - start)
+            if version != shown_version:
+                shown_version = version
+                scene.flip_queue.put((version, flip_t))
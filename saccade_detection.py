@@ -0,0 +1,275 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Offline saccade detection on the 2000 Hz raw eye data of a session. The FSM detects
+saccades online from a 3 sample velocity and only saves the times of its states; this finds
+every saccade of the session afterwards, all at once:
+    1. raw data of the session are converted to degrees with the calibration matrix saved
+       with each trial ('*_cal_matrix'), as CalTransform does, sample by sample
+    2. position and velocity are Savitzky-Golay filtered; samples near gaps, changes of
+       calibration and blinks are not used
+    3. a saccade is a run of speed above 'onset_threshold' that reaches 'detect_threshold',
+       with runs less than 'min_interval' apart merged (e.g., dynamic overshoot)
+    4. amplitude, peak velocity, duration and endpoint error (to the target shown at saccade
+       offset; 'tgt_x_data'/'tgt_y_data') are computed for every saccade
+    saccades = detect_session_saccades(data_file_path) # structured array, SACCADE_DTYPE
+"""
+import numpy as np
+import h5py
+from scipy.signal import savgol_filter
+
+from session_layout import is_session_layout, SessionReader, TIME_KEYS
+
+SAMPLE_RATE = 2000.0
+EYE_KEYS = {'right': ('eye_rx_raw_data', 'eye_ry_raw_data', 'eye_r_blink_data', 'right_cal_matrix'),
+            'left': ('eye_lx_raw_data', 'eye_ly_raw_data', 'eye_l_blink_data', 'left_cal_matrix')}
+TARGET_KEYS = ('tgt_time_data', 'tgt_x_data', 'tgt_y_data')
+FILTER_WINDOW = 11 # samples (5.5 ms) of the Savitzky-Golay filter
+FILTER_ORDER = 2
+ONSET_THRESHOLD = 30.0 # deg/s; lower than the FSM's 'sac_on_off_threshold', since filtered
+DETECT_THRESHOLD = 150.0 # deg/s; same as the FSM's 'sac_detect_threshold'
+MIN_INTERVAL = 0.01 # s
+MIN_DURATION = 0.005 # s
+MAX_DURATION = 0.2 # s
+BLINK_MARGIN = 0.05 # s around blinks not used
+
+SACCADE_DTYPE = np.dtype([('trial_num','i8'), ('onset_idx','i8'), ('offset_idx','i8'), ('onset_t','f8'), ('offset_t','f8'), ('duration','f8'), ('amplitude','f8'),
+                          ('peak_velocity','f8'), ('start_x','f8'), ('start_y','f8'), ('end_x','f8'), ('end_y','f8'),
+                          ('tgt_x','f8'), ('tgt_y','f8'), ('endpoint_error','f8')])
+
+def _first_cal(cal_data):
+    '''
+    Returns:
+        cal_matrix - first matrix of a trial's '*_cal_matrix', which is flattened if the
+                     trial was sent in pieces; nan if the trial has none (3x3 np.array)
+    '''
+    cal_data = np.ravel(cal_data).astype(float)
+    return cal_data[:9].reshape(3,3) if cal_data.size >= 9 else np.full((3,3), np.nan)
+
+def _eye_name(attrs, eye):
+    if eye is not None:
+        return eye
+    return 'left' if attrs.get('left_eye_tracked', 0) and not attrs.get('right_eye_tracked', 0) else 'right'
+
+def load_eye_data(data_file_path, eye=None):
+    '''
+    reads the raw eye data of a session, in either layout, in time order
+    Arguments:
+        data_file_path - session file saved by DataManager, with or without '.hdf5' (str)
+        eye - 'right' or 'left'; the eye tracked in the session if None (str)
+    Returns:
+        eye_data - dict of
+            't', 'x_raw', 'y_raw', 'blink' - every 2000 Hz sample (np.array)
+            'cal_idx' - index of each sample's trial in 'trial_nums'/'cal_matrix' (np.array)
+            'trial_nums', 'cal_matrix' - trial num. and calibration matrix of each trial
+                                         (np.array, Tx3x3 np.array)
+            'tgt_t', 'tgt_x', 'tgt_y' - target position at each FSM iteration (np.array)
+    '''
+    if not data_file_path.endswith('.hdf5'):
+        data_file_path += '.hdf5'
+    with h5py.File(data_file_path,'r') as data_file:
+        x_key, y_key, blink_key, cal_key = EYE_KEYS[_eye_name(dict(data_file.attrs), eye)]
+        if is_session_layout(data_file):
+            reader = SessionReader(data_file)
+            time_key = next(key for key in TIME_KEYS if key in reader.keys)
+            data = {key: reader.column(key) for key in (time_key, x_key, y_key, blink_key) + TARGET_KEYS if key in reader.keys}
+            # One row of the index per trial, or per piece of a trial; columns are in row order
+            trial_nums = reader.index['trial_num']
+            offset = reader.index['offset_'+x_key]
+            cal_column = reader.column(cal_key)
+            cal_flat = cal_column.reshape(-1) # offsets are in rows of the column
+            cal_offset = reader.index['offset_'+cal_key]*(cal_flat.size//max(cal_column.shape[0],1))
+            cal_matrix = np.array([_first_cal(cal_flat[start:stop]) for start, stop in cal_offset]).reshape(-1,3,3)
+            for row_idx in range(1, len(trial_nums)):
+                # Pieces sent later in a trial have no matrix
+                if trial_nums[row_idx] == trial_nums[row_idx-1] and np.isnan(cal_matrix[row_idx,0,0]):
+                    cal_matrix[row_idx] = cal_matrix[row_idx-1]
+            cal_idx = np.repeat(np.arange(len(trial_nums)), offset[:,1] - offset[:,0])
+        else:
+            trial_keys = sorted((key for key in data_file if key.startswith('trial_')), key=lambda key: int(key.split('_')[1]))
+            time_key = next((key for key in TIME_KEYS if trial_keys and key in data_file[trial_keys[0]]), TIME_KEYS[0])
+            data = {key: [] for key in (time_key, x_key, y_key, blink_key) + TARGET_KEYS}
+            trial_nums, cal_matrix, num_samp = [], [], []
+            for trial_key in trial_keys:
+                # Each lookup of a dataset costs as much as reading a short one; look up once
+                trial_grp = data_file[trial_key]
+                trial_nums.append(int(trial_key.split('_')[1]))
+                cal_dataset = trial_grp.get(cal_key)
+                cal_matrix.append(_first_cal([] if cal_dataset is None else cal_dataset[()]))
+                for key in data:
+                    dataset = trial_grp.get(key)
+                    if dataset is not None:
+                        data[key].append(np.ravel(dataset[()]))
+                        if key == x_key:
+                            num_samp.append(len(data[key][-1]))
+                if len(num_samp) < len(trial_nums):
+                    num_samp.append(0)
+            data = {key: np.concatenate(value) if value else np.zeros(0) for key, value in data.items()}
+            trial_nums = np.array(trial_nums, dtype=np.int64)
+            cal_matrix = np.array(cal_matrix).reshape(-1,3,3)
+            cal_idx = np.repeat(np.arange(len(trial_nums)), num_samp)
+    t = data[time_key].astype(float)
+    order = np.argsort(t, kind='stable') if np.any(np.diff(t) < 0) else slice(None)
+    tgt_t = data.get('tgt_time_data', np.zeros(0)).astype(float)
+    tgt_order = np.argsort(tgt_t, kind='stable')
+    return {'t': t[order],
+            'x_raw': data[x_key].astype(float)[order],
+            'y_raw': data[y_key].astype(float)[order],
+            'blink': data[blink_key][order] if len(data.get(blink_key, [])) == len(t) else np.zeros(len(t), dtype=np.uint8),
+            'cal_idx': cal_idx[order],
+            'trial_nums': np.asarray(trial_nums, dtype=np.int64),
+            'cal_matrix': cal_matrix,
+            'tgt_t': tgt_t[tgt_order],
+            'tgt_x': data.get('tgt_x_data', np.zeros(0)).astype(float)[tgt_order],
+            'tgt_y': data.get('tgt_y_data', np.zeros(0)).astype(float)[tgt_order]}
+
+def raw_to_deg(x_raw, y_raw, cal_matrix, cal_idx):
+    '''
+    converts raw samples of many trials at once; same as CalTransform(cal_matrix[cal_idx[i]])
+    .apply(x_raw[i], y_raw[i]) for every sample i
+    Arguments:
+        x_raw, y_raw - raw samples (np.array)
+        cal_matrix - calibration matrix of each trial (Tx3x3 np.array)
+        cal_idx - trial of each sample (np.array)
+    Returns:
+        x, y - position in degrees (np.array)
+    '''
+    # Coefficients gathered one at a time; gathering whole matrices per sample is 3x slower
+    c1, c2, c3, c4, c5, c6 = (cal_matrix[:,row,col][cal_idx] for row, col in ((0,0),(0,1),(1,0),(1,1),(2,0),(2,1)))
+    x = c1*x_raw + c3*y_raw + c5
+    y = c2*x_raw + c4*y_raw + c6
+    return x, y
+
+def _any_in_window(mask, lo, hi):
+    '''
+    Returns:
+        any - True at sample i if 'mask' is True anywhere in samples [i+lo, i+hi] (np.array)
+    '''
+    num_samp = len(mask)
+    pad_lo, pad_hi = max(-lo, 0), max(hi, 0)
+    padded = np.concatenate((np.zeros(pad_lo, dtype=bool), mask, np.zeros(pad_hi, dtype=bool)))
+    count = np.concatenate(([0], np.cumsum(padded, dtype=np.int64)))
+    return count[pad_lo+hi+1:pad_lo+hi+1+num_samp] - count[pad_lo+lo:pad_lo+lo+num_samp] > 0
+
+def _runs(mask):
+    '''
+    Returns:
+        starts, stops - [start, stop) of each run of True (np.array)
+    '''
+    edge = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    return np.flatnonzero(edge == 1), np.flatnonzero(edge == -1)
+
+def filter_eye(x, y, boundary, window=FILTER_WINDOW, order=FILTER_ORDER):
+    '''
+    Arguments:
+        x, y - 2000 Hz samples in degrees (np.array)
+        boundary - True at the first sample after a gap, a change of calibration, etc. (np.array)
+    Returns:
+        x, y - filtered position (np.array)
+        vx, vy - filtered velocity in deg/s (np.array)
+        valid - False for samples whose filter window crosses a boundary or a nan (np.array)
+    '''
+    if len(x) < window:
+        return x.copy(), y.copy(), np.zeros(len(x)), np.zeros(len(x)), np.zeros(len(x), dtype=bool)
+    is_nan = np.isnan(x) | np.isnan(y)
+    # Filter the whole session at once, then drop samples whose window mixed data across
+    # a boundary or had a nan
+    delta = 1/SAMPLE_RATE
+    x_fill = np.where(is_nan, 0.0, x)
+    y_fill = np.where(is_nan, 0.0, y)
+    x_filt, vx = (savgol_filter(x_fill, window, order, deriv=deriv, delta=delta) for deriv in (0,1))
+    y_filt, vy = (savgol_filter(y_fill, window, order, deriv=deriv, delta=delta) for deriv in (0,1))
+    half = window//2
+    valid = ~(_any_in_window(boundary, -half+1, half) | _any_in_window(is_nan, -half, half))
+    valid[:half] = False
+    valid[-half:] = False
+    return x_filt, y_filt, vx, vy, valid
+
+def detect_saccades(t, x, y, boundary=None, blink=None, onset_threshold=ONSET_THRESHOLD, detect_threshold=DETECT_THRESHOLD,
+                    min_interval=MIN_INTERVAL, min_duration=MIN_DURATION, max_duration=MAX_DURATION, blink_margin=BLINK_MARGIN):
+    '''
+    Arguments:
+        t, x, y - 2000 Hz samples; time in s, position in degrees (np.array)
+        boundary - True at samples where data is not continuous with the previous sample,
+                   besides gaps in 't', e.g., a new calibration (np.array)
+        blink - nonzero during blinks (np.array)
+        onset_threshold - speed that starts and ends a saccade, in deg/s (float)
+        detect_threshold - min. peak speed of a saccade, in deg/s (float)
+        min_interval - runs above 'onset_threshold' closer than this are one saccade, in s (float)
+        min_duration, max_duration - limits of saccade duration, in s (float)
+        blink_margin - time before and after blinks not used, in s (float)
+    Returns:
+        saccades - one row per saccade (SACCADE_DTYPE np.array); onset/offset are the first
+                   and last sample above 'onset_threshold'; 'trial_num' -1, target nan
+    '''
+    num_samp = len(t)
+    boundary = np.zeros(num_samp, dtype=bool) if boundary is None else np.asarray(boundary, dtype=bool).copy()
+    dt = np.diff(t)
+    boundary[1:] |= (dt > 1.5/SAMPLE_RATE) | (dt <= 0)
+    x_filt, y_filt, vx, vy, valid = filter_eye(x, y, boundary)
+    if blink is not None:
+        margin = int(round(blink_margin*SAMPLE_RATE))
+        valid &= ~_any_in_window(np.asarray(blink) != 0, -margin, margin)
+    speed = np.hypot(vx, vy)
+    starts, stops = _runs((speed >= onset_threshold) & valid)
+    if len(starts) > 1:
+        # Merge runs close together, unless samples between them are not used
+        num_invalid = np.concatenate(([0], np.cumsum(~valid)))
+        merge = (starts[1:] - stops[:-1] < min_interval*SAMPLE_RATE) & (num_invalid[starts[1:]] == num_invalid[stops[:-1]])
+        starts = starts[np.concatenate(([True], ~merge))]
+        stops = stops[np.concatenate((~merge, [True]))]
+    saccades = np.zeros(len(starts), dtype=SACCADE_DTYPE)
+    if len(starts) == 0:
+        return saccades
+    # Runs are apart and end before the last sample ('valid' is False there), so reduceat
+    # over [start, stop, start, stop, ...] gives the max. of each run at even positions
+    peak_velocity = np.maximum.reduceat(speed, np.column_stack((starts, stops)).ravel())[::2]
+    onset_idx, offset_idx = starts, stops - 1
+    duration = t[offset_idx] - t[onset_idx]
+    keep = (peak_velocity >= detect_threshold) & (duration >= min_duration) & (duration <= max_duration)
+    saccades = saccades[keep]
+    onset_idx, offset_idx = onset_idx[keep], offset_idx[keep]
+    saccades['trial_num'] = -1
+    saccades['onset_idx'] = onset_idx
+    saccades['offset_idx'] = offset_idx
+    saccades['onset_t'] = t[onset_idx]
+    saccades['offset_t'] = t[offset_idx]
+    saccades['duration'] = duration[keep]
+    saccades['peak_velocity'] = peak_velocity[keep]
+    saccades['start_x'] = x_filt[onset_idx]
+    saccades['start_y'] = y_filt[onset_idx]
+    saccades['end_x'] = x_filt[offset_idx]
+    saccades['end_y'] = y_filt[offset_idx]
+    saccades['amplitude'] = np.hypot(saccades['end_x'] - saccades['start_x'], saccades['end_y'] - saccades['start_y'])
+    saccades['tgt_x'] = np.nan
+    saccades['tgt_y'] = np.nan
+    saccades['endpoint_error'] = np.nan
+    return saccades
+
+def detect_session_saccades(data_file_path, eye=None, **kwargs):
+    '''
+    Arguments:
+        data_file_path - session file saved by DataManager, with or without '.hdf5' (str)
+        eye - 'right' or 'left'; the eye tracked in the session if None (str)
+        kwargs - thresholds and limits of 'detect_saccades'
+    Returns:
+        saccades - every saccade of the session, with the trial it started in and the target
+                   shown at its offset (SACCADE_DTYPE np.array)
+    '''
+    eye_data = load_eye_data(data_file_path, eye)
+    cal_idx = eye_data['cal_idx']
+    cal_matrix = eye_data['cal_matrix']
+    x, y = raw_to_deg(eye_data['x_raw'], eye_data['y_raw'], cal_matrix, cal_idx)
+    # New calibration between trials
+    boundary = np.zeros(len(cal_idx), dtype=bool)
+    change = np.flatnonzero(cal_idx[1:] != cal_idx[:-1]) + 1
+    boundary[change] = np.any(cal_matrix[cal_idx[change]] != cal_matrix[cal_idx[change-1]], axis=(1,2))
+    saccades = detect_saccades(eye_data['t'], x, y, boundary, eye_data['blink'], **kwargs)
+    saccades['trial_num'] = eye_data['trial_nums'][cal_idx[saccades['onset_idx']]]
+    tgt_idx = np.searchsorted(eye_data['tgt_t'], saccades['offset_t'], side='right') - 1
+    has_tgt = tgt_idx >= 0
+    saccades['tgt_x'][has_tgt] = eye_data['tgt_x'][tgt_idx[has_tgt]]
+    saccades['tgt_y'][has_tgt] = eye_data['tgt_y'][tgt_idx[has_tgt]]
+    saccades['endpoint_error'] = np.hypot(saccades['end_x'] - saccades['tgt_x'], saccades['end_y'] - saccades['tgt_y'])
+    return saccades
@@ -0,0 +1,299 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Catalog of recorded sessions in an SQLite file ('data/session_catalog.sqlite'), so sessions
+can be found without opening every HDF5 file. One row per session file: experiment name,
+date/time, monkey, trial and outcome counts (outcomes as in session_layout.OUTCOME),
+size, modification time, SHA-256 of the file and of its .mat; and every file attribute in
+'attr', indexed by (key, value). Copies of a session (e.g., in Open Ephys 'raw_data'
+folders) are rows of their own with the same checksum.
+DataManager adds a session when its file is made and indexes it when it is converted.
+Existing folders are indexed with 'rescan', in parallel, and only files that changed since
+they were indexed are read again; from the command line:
+    python session_catalog.py <folder> [<folder> ...]
+Find sessions with
+    SessionCatalog(catalog_path).find_sessions(exp_name='corr_saccade', monkey='X', min_success=500)
+"""
+import os, sys, re, json, sqlite3, hashlib, time, multiprocessing, contextlib
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import h5py
+
+from session_layout import is_session_layout, OUTCOME
+
+CATALOG_FILE_NAME = 'session_catalog.sqlite'
+CHECKSUM_BLOCK_SIZE = 1 << 20
+DATE_DIR = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+SESSION_STEM = re.compile(r'^(.+)_(\d{6})$') # <exp_name>_<HHMMSS>
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS session (
+    path TEXT PRIMARY KEY, exp_name TEXT, date TEXT, time TEXT, monkey TEXT, computer TEXT,
+    layout TEXT, num_trial INTEGER, num_success INTEGER, num_incorrect INTEGER,
+    file_size INTEGER, mtime REAL, checksum TEXT, mat_path TEXT, mat_checksum TEXT, indexed_t REAL);
+CREATE TABLE IF NOT EXISTS attr (
+    path TEXT, key TEXT, value, PRIMARY KEY (path, key)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS session_exp ON session (exp_name, monkey, num_success);
+CREATE INDEX IF NOT EXISTS session_date ON session (date);
+CREATE INDEX IF NOT EXISTS session_checksum ON session (checksum);
+CREATE INDEX IF NOT EXISTS attr_key_value ON attr (key, value);
+'''
+SESSION_COLUMNS = ('path','exp_name','date','time','monkey','computer','layout','num_trial','num_success',
+                   'num_incorrect','file_size','mtime','checksum','mat_path','mat_checksum','indexed_t')
+
+def file_checksum(file_path):
+    '''
+    Returns:
+        checksum - SHA-256 of the file, read in blocks (str)
+    '''
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(CHECKSUM_BLOCK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def _attr_value(value):
+    '''
+    Returns:
+        value - HDF5 attribute as an SQLite value; arrays as JSON (int, float, str)
+    '''
+    if isinstance(value, bytes):
+        return value.decode(errors='replace')
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return json.dumps(value.tolist(), default=str)
+    return value
+
+def _trial_outcomes(data_file):
+    '''
+    Returns:
+        outcomes - outcome of each trial, as in session_layout.OUTCOME (list of int)
+    '''
+    if is_session_layout(data_file):
+        index = data_file['trial_index'][()]
+        outcomes = {}
+        for trial_num, outcome in zip(index['trial_num'].tolist(), index['outcome'].tolist()):
+            # Trial in more than one row if its data was not sent in a row
+            outcomes[trial_num] = outcome if outcomes.get(trial_num, -1) == -1 else outcomes[trial_num]
+        return list(outcomes.values())
+    outcomes = []
+    for key, trial_grp in data_file.items():
+        if not key.startswith('trial_'):
+            continue
+        outcome = -1
+        for state_key, state_outcome in OUTCOME:
+            if state_key in trial_grp and trial_grp[state_key].size:
+                outcome = state_outcome
+                break
+        outcomes.append(outcome)
+    return outcomes
+
+def _name_fields(data_file_path, mtime):
+    '''
+    Returns:
+        fields - 'exp_name', 'date' and 'time' from 'data/<YYYY-MM-DD>/<exp_name>_<HHMMSS>.hdf5';
+                 the date of 'mtime' if the file is not in a date folder, e.g., a copy (dict)
+    '''
+    path = Path(data_file_path)
+    stem_match = SESSION_STEM.match(path.stem)
+    return {'exp_name': stem_match.group(1) if stem_match else path.stem,
+            'date': path.parent.name if DATE_DIR.match(path.parent.name) else datetime.fromtimestamp(mtime).strftime('%Y-%m-%d'),
+            'time': datetime.strptime(stem_match.group(2), '%H%M%S').strftime('%H:%M:%S') if stem_match else None}
+
+def session_summary(data_file_path, checksum=True):
+    '''
+    reads what the catalog keeps of a session file
+    Arguments:
+        data_file_path - session HDF5 file (str)
+        checksum - compute checksums of the file and its .mat (bool)
+    Returns:
+        session - column name to value of the 'session' row (dict)
+        attrs - file attribute name to SQLite value (dict)
+    '''
+    data_file_path = os.path.abspath(data_file_path)
+    stat = os.stat(data_file_path)
+    with h5py.File(data_file_path, 'r') as data_file:
+        attrs = {key: _attr_value(value) for key, value in data_file.attrs.items()}
+        layout = 'session' if is_session_layout(data_file) else 'trial'
+        outcomes = _trial_outcomes(data_file)
+    mat_path = os.path.splitext(data_file_path)[0] + '.mat'
+    has_mat = os.path.exists(mat_path)
+    session = {'path': data_file_path,
+               **_name_fields(data_file_path, stat.st_mtime),
+               'monkey': attrs.get('monkey'),
+               'computer': attrs.get('computer'),
+               'layout': layout,
+               'num_trial': len(outcomes),
+               'num_success': outcomes.count(1),
+               'num_incorrect': outcomes.count(0),
+               'file_size': stat.st_size,
+               'mtime': stat.st_mtime,
+               'checksum': file_checksum(data_file_path) if checksum else None,
+               'mat_path': mat_path if has_mat else None,
+               'mat_checksum': file_checksum(mat_path) if checksum and has_mat else None,
+               'indexed_t': time.time()}
+    return session, attrs
+
+def _summary_or_error(data_file_path):
+    try:
+        return session_summary(data_file_path), None
+    except Exception as error: # e.g., file of a session that crashed
+        return None, '{}: {}'.format(data_file_path, error)
+
+class SessionCatalog():
+    def __init__(self, catalog_path):
+        '''
+        Arguments:
+            catalog_path - SQLite file; made if it does not exist (str)
+        '''
+        self.catalog_path = str(catalog_path)
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def connect(self):
+        '''
+        new connection for each use, so the catalog can be used from any thread or process;
+        commits if no error and closes it
+        Yields:
+            connection - (sqlite3.Connection)
+        '''
+        connection = sqlite3.connect(self.catalog_path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def add_session(self, data_file_path, attrs):
+        '''
+        adds a session when its file is made, before it has trials
+        Arguments:
+            data_file_path - session HDF5 file (str)
+            attrs - file attributes (dict)
+        '''
+        data_file_path = os.path.abspath(data_file_path)
+        attrs = {key: _attr_value(value) for key, value in attrs.items()}
+        session = dict.fromkeys(SESSION_COLUMNS)
+        session.update(_name_fields(data_file_path, time.time()))
+        session.update({'path': data_file_path, 'monkey': attrs.get('monkey'), 'computer': attrs.get('computer'), 'num_trial': 0,
+                        'num_success': 0, 'num_incorrect': 0, 'indexed_t': time.time()})
+        with self.connect() as connection:
+            self._write(connection, session, attrs)
+
+    def update(self, data_file_path):
+        '''
+        indexes a session file, e.g., once it is complete
+        Arguments:
+            data_file_path - session HDF5 file (str)
+        '''
+        session, attrs = session_summary(data_file_path)
+        with self.connect() as connection:
+            self._write(connection, session, attrs)
+
+    def update_mat(self, mat_file_path):
+        '''
+        records the .mat of a session in its row
+        Arguments:
+            mat_file_path - .mat file next to the session HDF5 file (str)
+        '''
+        mat_file_path = os.path.abspath(mat_file_path)
+        with self.connect() as connection:
+            connection.execute('UPDATE session SET mat_path = ?, mat_checksum = ? WHERE path = ?',
+                               (mat_file_path, file_checksum(mat_file_path), os.path.splitext(mat_file_path)[0] + '.hdf5'))
+
+    def _write(self, connection, session, attrs):
+        connection.execute('INSERT OR REPLACE INTO session ({}) VALUES ({})'.format(
+            ','.join(SESSION_COLUMNS), ','.join('?'*len(SESSION_COLUMNS))), [session[key] for key in SESSION_COLUMNS])
+        connection.execute('DELETE FROM attr WHERE path = ?', (session['path'],))
+        connection.executemany('INSERT INTO attr (path, key, value) VALUES (?,?,?)',
+                               [(session['path'], key, value) for key, value in attrs.items()])
+
+    def rescan(self, root_dirs, num_process=None):
+        '''
+        indexes the session files under folders; files indexed before are read again only
+        if their size or modification time changed, and rows of files that are gone are removed
+        Arguments:
+            root_dirs - folders to search, with subfolders (list of str)
+            num_process - num. of processes reading files; num. of CPUs if None (int)
+        Returns:
+            num_indexed - num. of files (re)indexed (int)
+            errors - files that could not be read, with the reason (list of str)
+        '''
+        file_paths = sorted({str(path.resolve()) for root_dir in root_dirs for path in Path(root_dir).rglob('*.hdf5')})
+        with self.connect() as connection:
+            indexed = {row['path']: (row['file_size'], row['mtime'], row['mat_path']) for row in
+                       connection.execute('SELECT path, file_size, mtime, mat_path FROM session')}
+        changed = []
+        for file_path in file_paths:
+            stat = os.stat(file_path)
+            mat_path = os.path.splitext(file_path)[0] + '.mat'
+            if indexed.get(file_path) != (stat.st_size, stat.st_mtime, mat_path if os.path.exists(mat_path) else None):
+                changed.append(file_path)
+        results = []
+        if len(changed) > 1 and num_process != 1:
+            with multiprocessing.Pool(num_process) as pool:
+                results = pool.map(_summary_or_error, changed, chunksize=1)
+        else:
+            results = [_summary_or_error(file_path) for file_path in changed]
+        roots = tuple(str(Path(root_dir).resolve()) + os.sep for root_dir in root_dirs)
+        gone = [path for path in indexed if path.startswith(roots) and not os.path.exists(path)]
+        with self.connect() as connection:
+            for summary, _ in results:
+                if summary is not None:
+                    self._write(connection, *summary)
+            connection.executemany('DELETE FROM session WHERE path = ?', [(path,) for path in gone])
+            connection.executemany('DELETE FROM attr WHERE path = ?', [(path,) for path in gone])
+        errors = [error for _, error in results if error is not None]
+        return len(results) - len(errors), errors
+
+    def find_sessions(self, exp_name=None, monkey=None, min_success=None, date_from=None, date_to=None,
+                      distinct=False, **attrs):
+        '''
+        Arguments:
+            exp_name, monkey - exact match, if given (str)
+            min_success - min. num. of successful trials (int)
+            date_from, date_to - 'YYYY-MM-DD', inclusive (str)
+            distinct - one row per checksum, e.g., to leave out copies (bool)
+            attrs - file attributes to match exactly, e.g., rew_area=3.0
+        Returns:
+            sessions - matching 'session' rows, by date and time (list of dict)
+        '''
+        conditions, params = [], []
+        for column, operator, value in (('exp_name','=',exp_name), ('monkey','=',monkey), ('num_success','>=',min_success),
+                                        ('date','>=',date_from), ('date','<=',date_to)):
+            if value is not None:
+                conditions.append('{} {} ?'.format(column, operator))
+                params.append(value)
+        for key, value in attrs.items():
+            conditions.append('path IN (SELECT path FROM attr WHERE key = ? AND value = ?)')
+            params += [key, _attr_value(value)]
+        query = 'SELECT * FROM session' + (' WHERE ' + ' AND '.join(conditions) if conditions else '')
+        if distinct:
+            query += ' GROUP BY coalesce(checksum, path)'
+        with self.connect() as connection:
+            return [dict(row) for row in connection.execute(query + ' ORDER BY date, time, path', params)]
+
+    def attrs(self, data_file_path):
+        '''
+        Returns:
+            attrs - file attributes of a session, as indexed (dict)
+        '''
+        with self.connect() as connection:
+            return {row['key']: row['value'] for row in
+                    connection.execute('SELECT key, value FROM attr WHERE path = ?', (os.path.abspath(data_file_path),))}
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    catalog = SessionCatalog(Path(__file__).parent.resolve()/'data'/CATALOG_FILE_NAME)
+    start_t = time.perf_counter()
+    num_indexed, errors = catalog.rescan(sys.argv[1:])
+    for error in errors:
+        print('Not indexed: ' + error)
+    print('Indexed {} files in {:.1f} s'.format(num_indexed, time.perf_counter() - start_t))
@@ -0,0 +1,280 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Session layout of the HDF5 file; an alternative to the 'trial_<num>' groups of trial_writer.
+Every entry of the trial data is one extendible dataset for the whole session, trial after
+trial, and a small table says where each trial is, so a session of 1000 trials has ~40
+objects instead of ~35k and a column of the whole session is read at once.
+    /columns/<key> - data of an entry for the session, in the order it was sent
+    /trial_index - one row per trial: 'trial_num', 'outcome' (OUTCOME), first time of each
+                   'state_start_t_*' entry (nan if not entered), and [start, stop) of the
+                   trial in each column ('offset_<key>')
+Written by SessionWriter, which has the same methods as TrialWriter. Read with
+    with SessionReader(data_file_path) as reader:
+        trial_data = reader.trial(trial_num) # slices of columns read once, no copy
+"""
+import time
+import numpy as np
+import h5py
+
+from trial_writer import STORAGE_PROFILE
+
+SESSION_CHUNK_BYTES = 1 << 16
+STATE_PREFIX = 'state_start_t_'
+OFFSET_PREFIX = 'offset_'
+TIME_KEYS = ('vpixx_time_data', 'device_time_data') # device time of samples; simple_saccade, corr_saccade
+# Outcome of a trial is that of the first of these states, in this (priority) order, that it
+# entered at all, whatever the order it entered them in; -1 if none
+OUTCOME = (('state_start_t_trial_success', 1), ('state_start_t_incorrect_saccade', 0))
+
+def is_session_layout(data_file):
+    '''
+    Arguments:
+        data_file - session file (h5py.File)
+    '''
+    return 'trial_index' in data_file
+
+def _index_dtype(column_keys, state_keys):
+    return np.dtype([('trial_num','i8'), ('outcome','i1')] + [(key,'f8') for key in state_keys] +
+                    [(OFFSET_PREFIX+key,'i8',(2,)) for key in column_keys])
+
+class SessionWriter():
+    def __init__(self, file_path, flush_interval=5.0, storage='none'):
+        '''
+        Arguments:
+            file_path - full path of the HDF5 file (str)
+            flush_interval - min. time between flushes in s; 0 flushes every message (float)
+            storage - storage profile (key of trial_writer.STORAGE_PROFILE) for all columns,
+                      or column name to profile with 'default' for the rest (str or dict)
+        '''
+        self.file_path = file_path
+        self.flush_interval = flush_interval
+        self.storage = storage
+        self.data_file = None
+        self.columns = {} # column name -> dataset
+        self.index = np.zeros(0, dtype=_index_dtype([],[])) # all rows, kept to rewrite the table
+        self.num_row = 0  # if a column is added
+        self.last_flush_t = time.monotonic()
+
+    def open(self):
+        '''
+        Returns:
+            data_file - session file, opened if not open yet; continues the session if it
+                        already has data (h5py.File)
+        '''
+        if self.data_file is None:
+            self.data_file = h5py.File(self.file_path,'a',libver='latest')
+            column_grp = self.data_file.require_group('columns')
+            self.columns = dict(column_grp.items())
+            if 'trial_index' in self.data_file:
+                self.index = self.data_file['trial_index'][()]
+                self.num_row = len(self.index)
+        return self.data_file
+
+    def write_trial(self, trial_num, trial_data):
+        '''
+        appends data to the columns; data of the trial sent last is extended, otherwise a
+        new row is added to the index
+        Arguments:
+            trial_num - trial number (int)
+            trial_data - entry name to data sent for the trial (dict)
+        '''
+        self.open()
+        trial_data = {key: np.asarray(value).reshape(1) if np.ndim(value) == 0 else np.asarray(value)
+                      for key,value in trial_data.items()}
+        new_column = [key for key in trial_data if key not in self.columns]
+        new_state = [key for key in trial_data if key.startswith(STATE_PREFIX) and key not in self.index.dtype.names]
+        for key in new_column:
+            self.create_column(key, trial_data[key])
+        if new_column or new_state or 'trial_index' not in self.data_file:
+            self.extend_index(new_column, new_state)
+        if self.num_row == 0 or self.index['trial_num'][self.num_row-1] != trial_num:
+            self.add_row(trial_num)
+        row = self.index[self.num_row-1:self.num_row]
+        for key,value in trial_data.items():
+            if value.size:
+                row[OFFSET_PREFIX+key][0,1] = self.append(key, value)
+            if key.startswith(STATE_PREFIX) and value.size and np.isnan(row[key][0]):
+                row[key] = value.reshape(-1)[0]
+        row['outcome'] = -1
+        for key, outcome in OUTCOME:
+            if key in row.dtype.names and not np.isnan(row[key][0]):
+                row['outcome'] = outcome
+                break
+        self.data_file['trial_index'][self.num_row-1] = row[0]
+        self.flush(force=False)
+
+    def create_column(self, key, value):
+        storage = self.storage.get(key, self.storage.get('default','none')) if isinstance(self.storage, dict) else self.storage
+        row_bytes = value.dtype.itemsize*int(np.prod(value.shape[1:]))
+        chunk_len = max(SESSION_CHUNK_BYTES//max(row_bytes,1), 1)
+        self.columns[key] = self.data_file['columns'].create_dataset(key, shape=(0,)+value.shape[1:], dtype=value.dtype,
+                                                                     maxshape=(None,)+value.shape[1:], chunks=(chunk_len,)+value.shape[1:],
+                                                                     **STORAGE_PROFILE[storage])
+
+    def append(self, key, value):
+        '''
+        appends to a column in place, unless the data does not fit its shape or type; then
+        the column is rewritten once, flattened and/or with a wider type, as np.append would
+        Returns:
+            stop - new length of the column (int)
+        '''
+        column = self.columns[key]
+        dtype = np.result_type(column.dtype, value.dtype)
+        if column.shape[1:] != value.shape[1:] or dtype != column.dtype:
+            num_elem = int(np.prod(column.shape[1:])) if column.shape[1:] != value.shape[1:] else 1
+            old_value = column[()].astype(dtype)
+            if column.shape[1:] != value.shape[1:]:
+                old_value = old_value.reshape(-1)
+                value = value.reshape(-1)
+                # Offsets were in rows of the old shape
+                self.index[OFFSET_PREFIX+key][:self.num_row] *= num_elem
+            del self.data_file['columns'][key]
+            self.create_column(key, old_value[:0])
+            column = self.columns[key]
+            column.resize(old_value.shape[0], axis=0)
+            column[:] = old_value
+            self.data_file['trial_index'][:self.num_row] = self.index[:self.num_row]
+        num_old = column.shape[0]
+        column.resize(num_old + value.shape[0], axis=0)
+        column[num_old:] = value.astype(column.dtype, copy=False)
+        return num_old + value.shape[0]
+
+    def add_row(self, trial_num):
+        if self.num_row == len(self.index):
+            index = np.zeros(max(2*len(self.index), 64), dtype=self.index.dtype)
+            index[:self.num_row] = self.index[:self.num_row]
+            self.index = index
+        row = self.index[self.num_row:self.num_row+1]
+        row[0] = np.zeros(1, dtype=self.index.dtype)[0]
+        row['trial_num'] = trial_num
+        row['outcome'] = -1
+        for key in self.index.dtype.names:
+            if key.startswith(STATE_PREFIX):
+                row[key] = np.nan
+            elif key.startswith(OFFSET_PREFIX):
+                row[key] = self.columns[key[len(OFFSET_PREFIX):]].shape[0]
+        self.num_row += 1
+        self.data_file['trial_index'].resize(self.num_row, axis=0)
+
+    def extend_index(self, new_column, new_state):
+        '''
+        rewrites the index table with fields for new columns and states; earlier trials
+        have no data in them
+        '''
+        column_keys = [key[len(OFFSET_PREFIX):] for key in self.index.dtype.names if key.startswith(OFFSET_PREFIX)] + new_column
+        state_keys = [key for key in self.index.dtype.names if key.startswith(STATE_PREFIX)] + new_state
+        index = np.zeros(len(self.index), dtype=_index_dtype(column_keys, state_keys))
+        for key in state_keys:
+            index[key] = np.nan
+        for key in self.index.dtype.names:
+            index[key] = self.index[key]
+        for key in new_column:
+            # Current trial, if any, starts at the beginning of a new column
+            index[OFFSET_PREFIX+key] = 0
+        self.index = index
+        if 'trial_index' in self.data_file:
+            del self.data_file['trial_index']
+        self.data_file.create_dataset('trial_index', data=self.index[:self.num_row], maxshape=(None,), chunks=(256,))
+
+    def set_attrs(self, attrs):
+        '''
+        Arguments:
+            attrs - file attribute name to value; None values are not saved (dict)
+        '''
+        data_file = self.open()
+        for key,value in attrs.items():
+            if value is not None: # HDF5 has no None
+                data_file.attrs[key] = value
+        self.flush()
+
+    def flush(self, force=True):
+        '''
+        Arguments:
+            force - flush even if 'flush_interval' has not passed since the last flush (bool)
+        '''
+        if self.data_file is None:
+            return
+        t = time.monotonic()
+        if force or t - self.last_flush_t >= self.flush_interval:
+            self.data_file.flush()
+            self.last_flush_t = t
+
+    def close(self):
+        if self.data_file is not None:
+            self.data_file.close()
+            self.data_file = None
+            self.columns = {}
+
+class SessionReader():
+    def __init__(self, data_file_path):
+        '''
+        Arguments:
+            data_file_path - session file in session layout; or the file, opened, which is
+                             then not closed by the reader (str or h5py.File)
+        '''
+        self.is_file_owner = not isinstance(data_file_path, h5py.File)
+        self.data_file = h5py.File(data_file_path,'r') if self.is_file_owner else data_file_path
+        self.index = self.data_file['trial_index'][()]
+        self.attrs = dict(self.data_file.attrs)
+        self.keys = list(self.data_file['columns'].keys())
+        self.cache = {} # column name -> whole column
+        self.rows = {}  # trial num. -> rows of the index; more than one only if its data was
+        for row_idx, trial_num in enumerate(self.index['trial_num'].tolist()): # not sent in a row
+            self.rows.setdefault(trial_num, []).append(row_idx)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.is_file_owner:
+            self.data_file.close()
+
+    def trial_nums(self):
+        '''
+        Returns:
+            trial_nums - in the order saved (list of int)
+        '''
+        return list(self.rows)
+
+    def column(self, key):
+        '''
+        Returns:
+            column - data of the entry for the whole session; read once (np.array)
+        '''
+        if key not in self.cache:
+            self.cache[key] = self.data_file['columns'][key][()]
+        return self.cache[key]
+
+    def trial(self, trial_num, keys=None):
+        '''
+        Arguments:
+            trial_num - trial number (int)
+            keys - entries to get; all if None (list of str)
+        Returns:
+            trial_data - entry name to data of the trial (dict); views of the cached columns,
+                         so the first call reads the columns and later calls copy nothing
+        '''
+        return self._trial(trial_num, keys, lambda key, start, stop: self.column(key)[start:stop])
+
+    def read_trial(self, trial_num, keys=None):
+        '''
+        same as 'trial' but reads only the trial's data from the file, e.g., to go through a
+        session with little memory
+        '''
+        return self._trial(trial_num, keys, lambda key, start, stop: self.data_file['columns'][key][start:stop])
+
+    def _trial(self, trial_num, keys, get):
+        rows = self.rows[trial_num]
+        trial_data = {}
+        for key in self.keys if keys is None else keys:
+            offset = [self.index[OFFSET_PREFIX+key][row_idx] for row_idx in rows]
+            if len(offset) == 1:
+                trial_data[key] = get(key, *offset[0])
+            else:
+                trial_data[key] = np.concatenate([get(key, start, stop) for start, stop in offset])
+        return trial_data
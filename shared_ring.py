@@ -0,0 +1,105 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+"""
+from multiprocessing import shared_memory
+import numpy as np
+
+HEADER_SIZE = 64 # bytes before records; holds write sequence number (int64)
+
+class SharedRing():
+    '''
+    single-producer/single-consumer ring buffer of fixed-size records (float64) in shared
+    memory, for passing every sample from FSM process to GUI process without a lock.
+    Producer writes a record and then advances the sequence number; consumer reads all
+    records up to the sequence number it sees. If the consumer falls more than 'capacity'
+    records behind, the oldest are dropped and counted in 'dropped'.
+    Create in the parent process and pass to both processes, which attach by name; once
+    both have attached, the parent may call 'unlink' as they keep their own mapping.
+    '''
+    def __init__(self, num_field, capacity=2**14, name=None):
+        '''
+        Arguments:
+            num_field - num. of values per record (int)
+            capacity - max. num. of unread records; rounded up to a power of 2 (int)
+            name - name of existing shared memory to attach to; None to create (str)
+        '''
+        self.num_field = num_field
+        self.capacity = 1 << (max(capacity,1) - 1).bit_length()
+        self.mask = self.capacity - 1
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + 8*num_field*self.capacity)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self._attach()
+
+    def _attach(self):
+        self._seq = self.shm.buf[:8].cast('q')
+        self._data = self.shm.buf[HEADER_SIZE:].cast('d')
+        self._records = np.ndarray((self.capacity, self.num_field), dtype=np.float64,
+                                   buffer=self.shm.buf, offset=HEADER_SIZE)
+        self.write_seq = self._seq[0]
+        self.read_seq = self.write_seq # consumer starts at newest record
+        self.dropped = 0
+
+    def __getstate__(self):
+        # Other process attaches by name (spawn)
+        return {'num_field': self.num_field, 'capacity': self.capacity, 'name': self.name}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def write(self, values):
+        '''
+        producer only; never blocks
+        Arguments:
+            values - one record, 'num_field' values (tuple or list of float)
+        '''
+        seq = self.write_seq
+        idx = (seq & self.mask)*self.num_field
+        data = self._data
+        for value in values:
+            data[idx] = value
+            idx += 1
+        self.write_seq = seq + 1
+        self._seq[0] = seq + 1 # publish after record is written
+
+    def read(self):
+        '''
+        consumer only
+        Returns:
+            records - all records written since last read, oldest first (Nxnum_field np.array)
+        '''
+        start = self.read_seq
+        end = self._seq[0]
+        if end - start > self.capacity:
+            self.dropped += end - start - self.capacity
+            start = end - self.capacity
+        records = self._records[np.arange(start, end) & self.mask]
+        # Records the producer overwrote (or started to) while they were copied are dropped
+        oldest = self._seq[0] + 1 - self.capacity
+        if oldest > start:
+            num_lost = min(oldest, end) - start
+            self.dropped += num_lost
+            records = records[num_lost:]
+        self.read_seq = end
+        return records
+
+    def close(self):
+        if self._records is None:
+            return
+        self._records = None
+        self._seq.release()
+        self._data.release()
+        self.shm.close()
+
+    def __del__(self):
+        # Views must go before the shared memory is closed
+        self.close()
+
+    def unlink(self):
+        '''
+        removes the name of shared memory; processes that have it mapped keep using it
+        '''
+        self.shm.unlink()
@@ -1,23 +1,37 @@
 from PyQt5.QtCore import QRunnable, pyqtSlot, QThreadPool
 
+from loop_timer import LoopTimer
+
+import threading, queue, time
 import numpy as np
 import simpleaudio
 
+def make_tone(freq, duration, fs=44100):
+    '''
+    Arguments:
+        freq - frequency in Hz (int)
+        duration - duration of beep in s (float)
+        fs - sampling rate in Hz (int)
+    Returns:
+        audio - 16-bit sine wave at full scale (np.array)
+    '''
+    # Generate array with duration*sample_rate steps, ranging between 0 and duration
+    t = np.linspace(0, duration, int(duration * fs), False)
+    # Generate a sine wave
+    note = np.sin(freq * t * 2 * np.pi)
+    
+    # Ensure that highest value is in 16-bit range
+    audio = note * (2**15 - 1) / np.max(np.abs(note))
+    # Convert to 16-bit data
+    return audio.astype(np.int16)
+
 class SoundWorker(QRunnable):
     def __init__(self, freq, duration):
         super().__init__()
         self.setAutoDelete(False)
         
         self.fs = 44100  # 44100 samples per second
-        # Generate array with duration*sample_rate steps, ranging between 0 and duration
-        t = np.linspace(0, duration, int(duration * self.fs), False)
-        # Generate a sine wave
-        note = np.sin(freq * t * 2 * np.pi)
-        
-        # Ensure that highest value is in 16-bit range
-        self.audio = note * (2**15 - 1) / np.max(np.abs(note))
-        # Convert to 16-bit data
-        self.audio = self.audio.astype(np.int16)
+        self.audio = make_tone(freq, duration, self.fs)
     @pyqtSlot()
     def run(self):
         simpleaudio.play_buffer(self.audio,1,2,self.fs)
@@ -28,4 +42,68 @@ class Sound():
         self.thread_pool = QThreadPool() 
     def play(self):
         # self.thread_pool.start(self.sound_worker)
-        self.sound_worker.run()
\ No newline at end of file
+        self.sound_worker.run()
+
+class ToneBank():
+    '''
+    tones synthesized once, e.g., at FSM process start, and played from a worker thread
+    so that the FSM loop only puts a request in a queue. Time from the request to the
+    start of playback and time spent in 'simpleaudio.play_buffer' are recorded in
+    'dispatch_timer' and 'play_timer' by the worker thread
+    '''
+    def __init__(self, tones, fs=44100):
+        '''
+        Arguments:
+            tones - (freq, duration) of each tone to synthesize (list of tuple)
+            fs - sampling rate in Hz (int)
+        '''
+        self.fs = fs
+        self.audio = {}
+        for freq, duration in tones:
+            self.audio[(freq, duration)] = make_tone(freq, duration, self.fs)
+        self.dispatch_timer = LoopTimer('tone_dispatch')
+        self.play_timer = LoopTimer('tone_play')
+        self.play_queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def play(self, freq, duration):
+        '''
+        requests a tone; returns right away
+        Arguments:
+            freq - frequency in Hz (int)
+            duration - duration of beep in s (float)
+        '''
+        self.play_queue.put((freq, duration, time.perf_counter()))
+
+    def call(self, func):
+        '''
+        runs 'func' in worker thread after the tones requested so far; needed for anything
+        that touches the timers, e.g., 'dispatch_timer.reset', so they are not cleared while recording
+        '''
+        self.play_queue.put(func)
+
+    def run(self):
+        while True:
+            request = self.play_queue.get()
+            if request is None:
+                break
+            if callable(request):
+                request()
+                continue
+            freq, duration, request_t = request
+            audio = self.audio.get((freq, duration))
+            if audio is None: # not in bank; synthesize here instead of in FSM loop
+                audio = make_tone(freq, duration, self.fs)
+                self.audio[(freq, duration)] = audio
+            start = time.perf_counter()
+            self.dispatch_timer.record(start - request_t)
+            simpleaudio.play_buffer(audio, 1, 2, self.fs)
+            self.play_timer.record(time.perf_counter() - start)
+
+    def close(self):
+        '''
+        stops worker thread after playing requested tones
+        '''
+        self.play_queue.put(None)
+        self.thread.join()
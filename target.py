@@ -3,9 +3,10 @@ from PyQt5.QtWidgets import QWidget,QVBoxLayout,QHBoxLayout,QLabel,QDoubleSpinBo
 from PyQt5.QtGui import QColor
 
 import app_lib as lib
+from parameter_store import set_parameter
 
 from pathlib import Path
-import os, json
+import os
 
 class TargetWidget(QWidget,QObject):
     def __init__(self,tgt_name, parent=None):
@@ -154,11 +155,7 @@ class TargetWidget(QWidget,QObject):
     def tgt_pos_QPushButton_clicked(self):
         self.parameter['pos'] = [self.tgt_pos_x_QDoubleSpinBox.value(),self.tgt_pos_y_QDoubleSpinBox.value()]
     def save_QPushButton_clicked(self):
-        with open(self.parameter_file_path,'r') as file:
-            all_parameter = json.load(file)
-        all_parameter[self.tgt_name] = self.parameter    
-        with open(self.parameter_file_path,'w') as file:
-            json.dump(all_parameter, file, indent=4)
+        set_parameter(self.parameter_file_path, self.parameter, self.tgt_name)
         self.save_QPushButton.setStyleSheet('background-color: #39E547')
     #%% FUNCTIONS
     def update_parameter(self):
@@ -0,0 +1,82 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Target positions of the saccade tasks, relative to the start target, as Nx2 arrays of
+[x, y] in deg. Each set is made in one vectorized pass and cached by its parameters, so
+running the same experiment again does not recompute it. Cached arrays are read-only.
+Layouts ('tgt_layout' in exp. parameters):
+    'circle' - 'num_prim_sac_dir' directions evenly spaced from 'first_prim_sac_dir', at
+               'prim_sac_amp' and every amplitude in 'extra_prim_sac_amp'. Each direction
+               can be jittered by up to +-'prim_dir_jitter' deg; jitter is drawn once from
+               'tgt_jitter_seed', so the set is the same every run
+    'grid' - 'grid_num' [num. of columns, rows] positions 'grid_spacing' deg apart,
+             centered on the start target, without the center itself
+Corrective targets are 'num_corr_sac_dir' directions at 'corr_sac_amp' around each primary
+target; primary targets are repeated for each of them.
+"""
+from functools import lru_cache
+import numpy as np
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+def _circle(num_dir, amp, first_dir, dir_jitter=0.0):
+    '''
+    Returns:
+        pos - 'num_dir' directions evenly spaced from 'first_dir' (deg) at each amplitude;
+              direction-major (Nx2 np.array)
+    '''
+    tgt_dir = 2*np.pi/num_dir*np.arange(num_dir) + first_dir*np.pi/180
+    if np.any(dir_jitter):
+        tgt_dir = tgt_dir + dir_jitter*np.pi/180
+    amp = np.asarray(amp, dtype=float)
+    return np.stack((np.outer(np.cos(tgt_dir), amp).ravel(), np.outer(np.sin(tgt_dir), amp).ravel()), axis=1)
+
+@lru_cache(maxsize=32)
+def _prim_target_pos(layout, num_dir, amp, first_dir, jitter, seed, grid_num, grid_spacing):
+    if layout == 'circle':
+        dir_jitter = np.random.default_rng(seed).uniform(-jitter, jitter, num_dir) if jitter else 0.0
+        pos = _circle(num_dir, amp, first_dir, dir_jitter)
+    elif layout == 'grid':
+        x = (np.arange(grid_num[0]) - (grid_num[0]-1)/2)*grid_spacing
+        y = (np.arange(grid_num[1]) - (grid_num[1]-1)/2)*grid_spacing
+        pos = np.stack(np.meshgrid(x, y), axis=-1).reshape(-1,2)
+        pos = pos[np.any(pos != 0, axis=1)]
+    else:
+        raise ValueError('unknown target layout: ' + str(layout))
+    return _read_only(pos)
+
+@lru_cache(maxsize=32)
+def _corr_target_pos(prim_key, num_corr_dir, corr_amp, first_corr_dir):
+    prim_pos = _prim_target_pos(*prim_key)
+    corr_offset = _circle(num_corr_dir, (corr_amp,), first_corr_dir)
+    prim_pos = np.repeat(prim_pos, num_corr_dir, axis=0)
+    corr_pos = prim_pos + np.tile(corr_offset, (len(prim_pos)//num_corr_dir, 1))
+    return _read_only(prim_pos), _read_only(corr_pos)
+
+def _prim_key(parameter):
+    amp = (float(parameter['prim_sac_amp']),) + tuple(float(value) for value in parameter.get('extra_prim_sac_amp', ()))
+    return (parameter.get('tgt_layout','circle'), int(parameter['num_prim_sac_dir']), amp, float(parameter['first_prim_sac_dir']),
+            float(parameter.get('prim_dir_jitter',0.0)), int(parameter.get('tgt_jitter_seed',0)),
+            tuple(int(value) for value in parameter.get('grid_num',(3,3))), float(parameter.get('grid_spacing',parameter['prim_sac_amp'])))
+
+def prim_target_pos(parameter):
+    '''
+    Arguments:
+        parameter - exp. parameters (dict)
+    Returns:
+        prim_pos - primary target positions (Nx2 np.array, read-only)
+    '''
+    return _prim_target_pos(*_prim_key(parameter))
+
+def corr_target_pos(parameter):
+    '''
+    Arguments:
+        parameter - exp. parameters (dict)
+    Returns:
+        prim_pos - primary target position of each set (Nx2 np.array, read-only)
+        corr_pos - corrective target position of each set (Nx2 np.array, read-only)
+    '''
+    return _corr_target_pos(_prim_key(parameter), int(parameter['num_corr_sac_dir']), float(parameter['corr_sac_amp']), float(parameter['first_corr_sac_dir']))
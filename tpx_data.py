@@ -0,0 +1,53 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+"""
+import numpy as np
+
+TPX_NUM_FIELD = 22 # num. of values per sample in 'TPxReadTPxData' buffer
+# Column of each field in a sample; (animal's) right eye is pink, left eye is cyan
+TPX_FIELD_IDX = {
+                'time': 0,
+                'eye_l_pupil': 3,
+                'eye_r_pupil': 6,
+                'din': 7,
+                'eye_l_blink': 8,
+                'eye_r_blink': 9,
+                'dout': 10,
+                'eye_lx_raw': 16,
+                'eye_ly_raw': 17,
+                'eye_rx_raw': 18,
+                'eye_ry_raw': 19
+                }
+
+def decode_tpx_data(tpx_buffer):
+    '''
+    Arguments:
+        tpx_buffer - flat buffer of 'TPxReadTPxData', i.e., 'TPxReadTPxData(0)[0]'
+                     (ctypes/array buffer of doubles, np.array or list)
+    Returns:
+        samples - one row per sample (Nx22 np.array); a view without copying if 'tpx_buffer'
+                  exposes its memory (buffer protocol), otherwise all values are converted once
+    '''
+    try:
+        samples = np.frombuffer(tpx_buffer, dtype=np.float64)
+    except TypeError: # e.g., list
+        samples = np.asarray(tpx_buffer, dtype=np.float64)
+    return samples.reshape(-1, TPX_NUM_FIELD)
+
+def tpx_columns(tpx_buffer, field_idx):
+    '''
+    Arguments:
+        tpx_buffer - flat buffer of 'TPxReadTPxData' (see 'decode_tpx_data')
+        field_idx - column of each field to return (list of int)
+    Returns:
+        columns - each field over all samples (list); views without copying if 'tpx_buffer'
+                  exposes its memory. For a list, fields are sliced as lists instead: converting
+                  the buffer once (np.asarray) costs as much as converting the sliced fields,
+                  and more than slicing, which is all that is done in the FSM loop; see
+                  'ColumnGroup.extend'
+    '''
+    if isinstance(tpx_buffer, list):
+        return [tpx_buffer[idx::TPX_NUM_FIELD] for idx in field_idx]
+    samples = decode_tpx_data(tpx_buffer)
+    return [samples[:,idx] for idx in field_idx]
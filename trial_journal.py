@@ -0,0 +1,186 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Write-ahead journal of a session. Every file attribute and trial data message is appended
+to '<data file>.journal' when it is received, before it is saved to HDF5. The journal is
+memory-mapped, so a record is in the OS page cache, and survives the GUI process dying, as
+soon as it is copied in; it is synced to disk at most every 'sync_interval' s, for power
+loss. Records are never changed, so the journal can always be read up to the last complete
+record, whatever state the HDF5 file was left in.
+    file: JOURNAL_MAGIC, then records of RECORD_HEADER (magic, kind, seq. num., payload
+          length, CRC32 of payload) + pickled payload; zeros after the last record
+When a session is stopped, the journal is compacted: anything not saved to HDF5 is saved,
+the HDF5 file is closed and checked, and the journal is deleted. After a crash, the session
+is rebuilt from the journal with 'recover_session', or from the command line:
+    python trial_journal.py <journal file> [layout] [storage profile]
+"""
+import os, sys, mmap, pickle, struct, threading, time, zlib
+
+JOURNAL_MAGIC = b'BHVJRN01'
+RECORD_MAGIC = 0x4A524543 # 'CERJ'
+RECORD_HEADER = struct.Struct('<IBxxxQII') # magic, kind, seq. num., payload length, CRC32
+RECORD_ATTRS = 1 # file attributes (dict)
+RECORD_TRIAL = 2 # (trial num., trial data)
+INITIAL_CAPACITY = 1 << 26 # bytes mapped at first; grows by doubling, up to GROWTH_LIMIT at once
+GROWTH_LIMIT = 1 << 30
+JOURNAL_SYNC_INTERVAL = 1.0 # s; see benchmark/trial_journal_bench.py for the cost of syncing more often
+
+class Journal():
+    def __init__(self, journal_path, sync_interval=JOURNAL_SYNC_INTERVAL):
+        '''
+        creates a new journal
+        Arguments:
+            journal_path - full path of journal file (str)
+            sync_interval - min. time between syncs to disk in s; 0 syncs every record,
+                            float('inf') leaves it to the OS (float)
+        '''
+        self.journal_path = journal_path
+        self.sync_interval = sync_interval
+        self.file = open(journal_path, 'w+b')
+        self.capacity = 0
+        self.mmap = None
+        self.resize(INITIAL_CAPACITY)
+        self.mmap[:len(JOURNAL_MAGIC)] = JOURNAL_MAGIC
+        self.offset = len(JOURNAL_MAGIC)
+        self.seq = 0
+        self.last_sync_t = time.monotonic()
+        self.lock = threading.Lock() # 'sync' may be called from another thread
+
+    def resize(self, capacity):
+        # Not synced here; written pages stay in the page cache after the map is closed
+        if self.mmap is not None:
+            self.mmap.close()
+        self.file.truncate(capacity)
+        self.mmap = mmap.mmap(self.file.fileno(), capacity)
+        self.capacity = capacity
+
+    def append(self, kind, payload):
+        '''
+        Arguments:
+            kind - RECORD_ATTRS or RECORD_TRIAL (int)
+            payload - attributes (dict) or (trial num., trial data) (tuple)
+        Returns:
+            seq - sequence num. of the record, from 1 (int)
+        '''
+        data = pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.seq += 1
+            size = RECORD_HEADER.size + len(data)
+            if self.offset + size > self.capacity:
+                self.resize(max(self.capacity + min(self.capacity, GROWTH_LIMIT), self.offset + size))
+            # Payload first, so a header is never followed by a partial payload
+            start = self.offset + RECORD_HEADER.size
+            self.mmap[start:start+len(data)] = data
+            self.mmap[self.offset:start] = RECORD_HEADER.pack(RECORD_MAGIC, kind, self.seq, len(data), zlib.crc32(data))
+            self.offset += size
+            seq = self.seq
+        self.sync(force=False)
+        return seq
+
+    def sync(self, force=True):
+        '''
+        Arguments:
+            force - sync even if 'sync_interval' has not passed since the last sync (bool)
+        '''
+        t = time.monotonic()
+        if force or t - self.last_sync_t >= self.sync_interval:
+            with self.lock:
+                if self.mmap is not None:
+                    self.mmap.flush()
+            self.last_sync_t = t
+
+    def close(self, delete=False):
+        '''
+        Arguments:
+            delete - delete the journal, e.g., when its data is in the HDF5 file (bool)
+        '''
+        with self.lock:
+            if self.mmap is not None:
+                self.mmap.flush()
+                self.mmap.close()
+                self.mmap = None
+                self.file.truncate(self.offset)
+                self.file.close()
+        if delete:
+            os.remove(self.journal_path)
+
+def read_journal(journal_path):
+    '''
+    reads records up to the first incomplete or corrupt one, e.g., cut off by a crash
+    Arguments:
+        journal_path - full path of journal file (str)
+    Yields:
+        kind, seq, payload - of each record (int, int, object)
+    '''
+    with open(journal_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < len(JOURNAL_MAGIC) or file.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+            raise ValueError('not a journal: ' + journal_path)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as journal:
+            offset = len(JOURNAL_MAGIC)
+            while offset + RECORD_HEADER.size <= len(journal):
+                magic, kind, seq, length, crc = RECORD_HEADER.unpack_from(journal, offset)
+                start = offset + RECORD_HEADER.size
+                if magic != RECORD_MAGIC or start + length > len(journal):
+                    return
+                data = journal[start:start+length]
+                if zlib.crc32(data) != crc:
+                    return
+                yield kind, seq, pickle.loads(data)
+                offset = start + length
+
+def replay(journal_path, writer, seqs=None):
+    '''
+    saves journal records with a trial_writer/session_layout writer
+    Arguments:
+        journal_path - full path of journal file (str)
+        writer - TrialWriter or SessionWriter
+        seqs - seq. num. of records to save; all if None (set)
+    Returns:
+        num_record - num. of records saved (int)
+    '''
+    num_record = 0
+    for kind, seq, payload in read_journal(journal_path):
+        if seqs is not None and seq not in seqs:
+            continue
+        if kind == RECORD_ATTRS:
+            writer.set_attrs(payload)
+        elif kind == RECORD_TRIAL:
+            writer.write_trial(*payload)
+        num_record += 1
+    return num_record
+
+def recover_session(journal_path, data_file_path=None, layout='trial', storage=None):
+    '''
+    rebuilds a session from its journal into a new HDF5 file; the file the session was
+    saved to, if any, is left as it is
+    Arguments:
+        journal_path - e.g., 'corr_saccade_101010.journal' (str)
+        data_file_path - file to write; '<journal name>_recovered.hdf5' if None (str)
+        layout - 'trial' or 'session' (str)
+        storage - storage profile; see trial_writer (str or dict)
+    Returns:
+        data_file_path - file written (str)
+        num_record - num. of records recovered (int)
+    '''
+    from trial_writer import TrialWriter, DEFAULT_STORAGE
+    from session_layout import SessionWriter
+    if data_file_path is None:
+        data_file_path = os.path.splitext(journal_path)[0] + '_recovered.hdf5'
+    if os.path.exists(data_file_path):
+        raise FileExistsError(data_file_path)
+    writer_class = {'trial': TrialWriter, 'session': SessionWriter}[layout]
+    writer = writer_class(data_file_path, storage=DEFAULT_STORAGE if storage is None else storage)
+    try:
+        num_record = replay(journal_path, writer)
+    finally:
+        writer.close()
+    return data_file_path, num_record
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    data_file_path, num_record = recover_session(sys.argv[1], layout=sys.argv[2] if len(sys.argv) > 2 else 'trial',
+                                                 storage=sys.argv[3] if len(sys.argv) > 3 else None)
+    print('Recovered {} records to "{}"'.format(num_record, data_file_path))
@@ -0,0 +1,155 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+"""
+from array import array
+import numpy as np
+
+class ColumnGroup():
+    '''
+    columns of doubles that share a length, e.g., data appended every FSM iteration
+    or every 2000 Hz sample. Each column is a preallocated array('d'); resetting only
+    sets the length to 0 so the memory is reused for the next trial. Lists given to
+    'extend' are kept as lists until the columns are viewed, so extending with them costs
+    no more than extending lists; converting Python floats is the slow part.
+    '''
+    def __init__(self, keys, capacity):
+        '''
+        Arguments:
+            keys - name of each column (list of str)
+            capacity - num. of samples to preallocate; grows if exceeded (int)
+        '''
+        self.keys = list(keys)
+        self.capacity = max(int(capacity),1)
+        self.columns = [array('d', bytes(8*self.capacity)) for _ in self.keys]
+        self.length = 0
+        self.pending = None # lists given to 'extend' since the last 'views'; one per column
+
+    def append(self, *values):
+        '''
+        appends one value to each column, in the order of 'keys'
+        '''
+        if self.pending is not None:
+            self.convert_pending()
+        n = self.length
+        if n == self.capacity:
+            self.grow(n + 1)
+        for column, value in zip(self.columns, values):
+            column[n] = value
+        self.length = n + 1
+
+    def extend(self, values):
+        '''
+        appends many values to each column, in the order of 'keys'
+        Arguments:
+            values - one sequence per column, all with the same length; lists are converted
+                     when the columns are viewed (list)
+        '''
+        if isinstance(values[0], list):
+            if self.pending is None:
+                self.pending = [[] for _ in self.keys]
+            for pending, value in zip(self.pending, values):
+                pending.extend(value)
+            return
+        if self.pending is not None:
+            self.convert_pending()
+        n = self.length
+        num_new = len(values[0])
+        if n + num_new > self.capacity:
+            self.grow(n + num_new)
+        for column, value in zip(self.columns, values):
+            np.frombuffer(column, dtype=np.float64)[n:n+num_new] = value
+        self.length = n + num_new
+
+    def convert_pending(self):
+        '''
+        copies lists given to 'extend' into the columns
+        '''
+        pending, self.pending = self.pending, None
+        n = self.length
+        num_new = len(pending[0])
+        if n + num_new > self.capacity:
+            self.grow(n + num_new)
+        for column, value in zip(self.columns, pending):
+            column[n:n+num_new] = array('d', value) # faster than numpy for a list
+        self.length = n + num_new
+
+    def grow(self, min_capacity):
+        '''
+        at least doubles the capacity, keeping the data
+        '''
+        new_capacity = max(2*self.capacity, min_capacity)
+        for i, column in enumerate(self.columns):
+            try:
+                column.extend(array('d', bytes(8*(new_capacity - self.capacity))))
+            except BufferError:
+                # A view of this column is still alive; leave it with the old buffer
+                new_column = array('d', bytes(8*new_capacity))
+                new_column[0:self.capacity] = column
+                self.columns[i] = new_column
+        self.capacity = new_capacity
+
+    def reset(self):
+        self.length = 0
+        self.pending = None
+
+    def views(self):
+        '''
+        Returns:
+            view - column name to np.array without copying (dict); only valid until
+                   the group is reset, so pickle/save before starting the next trial
+        '''
+        if self.pending is not None:
+            self.convert_pending()
+        return {key: np.frombuffer(column, dtype=np.float64, count=self.length)
+                for key, column in zip(self.keys, self.columns)}
+
+class TrialRecorder():
+    '''
+    trial data kept in typed column groups plus a dict of small per-trial entries ('field'),
+    such as state start times or calibration matrices. Buffers are allocated once per
+    session and reset in place between trials.
+    '''
+    def __init__(self):
+        self.field = {}
+        self.groups = []
+
+    def add_field(self, keys):
+        '''
+        Arguments:
+            keys - name of entries that start every trial as an empty list (list of str)
+        '''
+        for key in keys:
+            self.field[key] = []
+
+    def add_group(self, keys, capacity):
+        '''
+        Arguments:
+            keys - name of each column (list of str)
+            capacity - num. of samples to preallocate (int)
+        Returns:
+            group - ColumnGroup to append to
+        '''
+        group = ColumnGroup(keys, capacity)
+        self.groups.append(group)
+        return group
+
+    def reset(self):
+        '''
+        starts a new trial; entries are replaced, not cleared, since a field may hold
+        an object shared with others (e.g., calibration matrix from parameter)
+        '''
+        for key in self.field:
+            self.field[key] = []
+        for group in self.groups:
+            group.reset()
+
+    def to_dict(self):
+        '''
+        Returns:
+            trial_data - all fields and zero-copy views of all columns (dict)
+        '''
+        trial_data = dict(self.field)
+        for group in self.groups:
+            trial_data.update(group.views())
+        return trial_data
@@ -0,0 +1,103 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+"""
+import random
+import numpy as np
+
+class TrialSchedule():
+    '''
+    order of targets for a session, made in blocks when the experiment starts. Every block
+    has each target 'weights[i]' times in random order, so target counts stay balanced over
+    the session. Getting the next target is an index increment.
+    What happens to the target of an error trial (e.g., incorrect saccade, timeout):
+        'repeat' - same target is shown again until the trial succeeds
+        'skip' - next target of the schedule is shown instead
+        'requeue' - next target is shown and the failed one is moved to a random later
+                    position of the current block, not right after the failed trial; to
+                    the next block if the failed trial was the last of its block
+    '''
+    policies = ('repeat', 'skip', 'requeue')
+
+    def __init__(self, num_tgt, weights=None, error_policy='repeat', num_block=100, seed=None):
+        '''
+        Arguments:
+            num_tgt - num. of targets (int)
+            weights - num. of times each target is in a block; 1 each if None (list of int)
+            error_policy - one of TrialSchedule.policies (str)
+            num_block - num. of blocks made at start; more are made if needed (int)
+            seed - seed of the random generator; random if None (int)
+        '''
+        if error_policy not in self.policies:
+            raise ValueError('unknown error policy: ' + str(error_policy))
+        self.weights = np.ones(num_tgt, dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+        if len(self.weights) != num_tgt or np.any(self.weights < 0) or not np.any(self.weights > 0):
+            raise ValueError('need a non-negative weight for each target, not all 0')
+        self.error_policy = error_policy
+        self.seed = random.SystemRandom().randrange(1 << 32) if seed is None else int(seed)
+        self.rng = np.random.default_rng(self.seed)
+        self.block = np.repeat(np.arange(num_tgt), self.weights) # targets of one block
+        self.schedule = np.empty(0, dtype=np.int64)
+        self.block_id = np.empty(0, dtype=np.int64) # block of each entry of 'schedule'
+        self.num_block = 0
+        self.extend(num_block)
+        self.initial_schedule = self.schedule.copy()
+        self.idx = -1 # position of current target in 'schedule'
+        self.tgt_idx = -1
+
+    def extend(self, num_block):
+        '''
+        adds blocks to the end of the schedule
+        '''
+        new_blocks = np.tile(self.block, (num_block,1))
+        new_blocks = self.rng.permuted(new_blocks, axis=1)
+        self.schedule = np.concatenate((self.schedule, new_blocks.ravel()))
+        self.block_id = np.concatenate((self.block_id, np.repeat(np.arange(self.num_block, self.num_block+num_block), len(self.block))))
+        self.num_block += num_block
+
+    def next(self):
+        '''
+        Returns:
+            tgt_idx - target of next trial (int)
+        '''
+        self.idx += 1
+        if self.idx == len(self.schedule):
+            self.extend(len(self.initial_schedule)//len(self.block))
+        self.tgt_idx = int(self.schedule[self.idx])
+        return self.tgt_idx
+
+    def error(self):
+        '''
+        call when the trial failed and is tried again
+        Returns:
+            tgt_idx - target to show next according to 'error_policy' (int)
+        '''
+        if self.error_policy == 'repeat':
+            return self.tgt_idx
+        if self.error_policy == 'requeue':
+            # Not right after the failed trial, which would make it a repeat
+            block = self.block_id[self.idx]
+            block_end = int(np.searchsorted(self.block_id, block, side='right'))
+            first_idx = self.idx + 2
+            if first_idx > block_end: # last of its block; goes to the next block
+                block += 1
+                if block == self.num_block:
+                    self.extend(1)
+                block_end = int(np.searchsorted(self.block_id, block, side='right'))
+                first_idx = min(first_idx, block_end) # next block has only one target
+            insert_idx = int(self.rng.integers(first_idx, block_end+1))
+            self.schedule = np.insert(self.schedule, insert_idx, self.tgt_idx)
+            self.block_id = np.insert(self.block_id, insert_idx, block)
+        return self.next()
+
+    def attrs(self, prefix=''):
+        '''
+        Arguments:
+            prefix - put before every attribute name, e.g., for a schedule made after the
+                     one of the session start (str)
+        Returns:
+            attrs - schedule made at start and what is needed to make it again; saved with
+                    the session (dict)
+        '''
+        return {prefix + 'schedule_seed': self.seed, prefix + 'schedule_weights': self.weights,
+                prefix + 'schedule_error_policy': self.error_policy, prefix + 'schedule': self.initial_schedule}
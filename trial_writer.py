@@ -0,0 +1,155 @@
+"""
+Laboratory for Computational Motor Control, Johns Hopkins School of Medicine
+@author: Jay Pi <jay.s.314159@gmail.com>
+
+Writes trial data to the session HDF5 file. The file stays open for the session and each
+entry of a trial is an extendible, chunked dataset, so data sent mid-trial is appended in
+place: a message costs the same whether it is the first or the tenth of a trial, or the
+first or the last trial of the session. The file is flushed at most every 'flush_interval'
+s, and when closed. Files look the same to readers as before: 'trial_<num>' groups of
+datasets, each the concatenation of all data sent for that trial. Datasets can be compressed
+with a storage profile per entry (STORAGE_PROFILE); HDF5 readers decompress them on read.
+"""
+import time
+import numpy as np
+import h5py
+
+MIN_CHUNK_LEN = 16 # chunk length of entries with a few values per trial, e.g., state start times
+MAX_CHUNK_BYTES = 1 << 16 # chunk size limit of long entries, e.g., 2000 Hz data
+MIN_FILTER_LEN = 256 # entries shorter than this are not compressed; too small to gain anything
+
+# HDF5 filters of each storage profile. 'shuffle' groups bytes of the same significance, so
+# slowly changing doubles (time stamps, eye position) and 0/1 columns compress better. lzf
+# is fast but only h5py can read it; gzip can be read by MATLAB and any HDF5 library
+STORAGE_PROFILE = {'none': {},
+                   'lzf': {'compression':'lzf'},
+                   'gzip1': {'compression':'gzip','compression_opts':1},
+                   'gzip4': {'compression':'gzip','compression_opts':4},
+                   'gzip9': {'compression':'gzip','compression_opts':9},
+                   'shuffle_lzf': {'shuffle':True,'compression':'lzf'},
+                   'shuffle_gzip1': {'shuffle':True,'compression':'gzip','compression_opts':1},
+                   'shuffle_gzip4': {'shuffle':True,'compression':'gzip','compression_opts':4}}
+DEFAULT_STORAGE = 'shuffle_gzip1' # ~45 % of raw size; see benchmark/storage_profile_bench.py
+
+def _chunk_shape(value):
+    '''
+    Returns:
+        chunk_shape - length of the first data, within limits, so a trial sent in one
+                      message takes no more space than a contiguous dataset (tuple)
+    '''
+    row_bytes = value.dtype.itemsize*int(np.prod(value.shape[1:]))
+    max_len = max(MAX_CHUNK_BYTES//max(row_bytes,1), 1)
+    return (min(max(int(value.shape[0]), MIN_CHUNK_LEN), max_len),) + value.shape[1:]
+
+def _filters(storage, key, value):
+    '''
+    Arguments:
+        storage - profile name for all entries, or entry name to profile name with
+                  'default' for the rest (str or dict)
+    Returns:
+        filters - 'create_dataset' arguments of the entry's profile (dict)
+    '''
+    if value.shape[0] < MIN_FILTER_LEN:
+        return {}
+    if isinstance(storage, dict):
+        storage = storage.get(key, storage.get('default','none'))
+    return STORAGE_PROFILE[storage]
+
+class TrialWriter():
+    def __init__(self, file_path, flush_interval=5.0, storage='none'):
+        '''
+        Arguments:
+            file_path - full path of the HDF5 file (str)
+            flush_interval - min. time between flushes in s; 0 flushes every message (float)
+            storage - storage profile (key of STORAGE_PROFILE) for all entries, or entry
+                      name to profile with 'default' for the rest (str or dict)
+        '''
+        self.file_path = file_path
+        self.flush_interval = flush_interval
+        self.storage = storage
+        self.data_file = None
+        self.trial_grp = None # group of the last trial written and its datasets, to append
+        self.datasets = {}    # without looking them up again
+        self.last_flush_t = time.monotonic()
+
+    def open(self):
+        '''
+        Returns:
+            data_file - session file, opened if not open yet (h5py.File)
+        '''
+        if self.data_file is None:
+            self.data_file = h5py.File(self.file_path,'a',libver='latest')
+        return self.data_file
+
+    def write_trial(self, trial_num, trial_data):
+        '''
+        appends data to the trial group; creates the group if it is the first data of the trial
+        Arguments:
+            trial_num - trial number (int)
+            trial_data - entry name to data sent for the trial (dict)
+        '''
+        data_file = self.open()
+        group_name = "trial_"+str(trial_num)
+        if self.trial_grp is None or self.trial_grp.name != '/'+group_name:
+            self.trial_grp = data_file.require_group(group_name)
+            self.datasets = dict(self.trial_grp.items())
+        for key,value in trial_data.items():
+            value = np.asarray(value)
+            if value.ndim == 0:
+                value = value.reshape(1)
+            if key not in self.datasets:
+                self.datasets[key] = self.trial_grp.create_dataset(key,data=value,maxshape=(None,)+value.shape[1:],chunks=_chunk_shape(value),**_filters(self.storage,key,value))
+            elif value.size:
+                self.datasets[key] = self.append(self.trial_grp, self.datasets[key], value)
+        self.flush(force=False)
+
+    def append(self, trial_grp, dataset, value):
+        '''
+        appends to an existing dataset in place, unless the data does not fit its shape or
+        type; then it is rewritten once, flattened and/or with a wider type, as np.append would
+        Returns:
+            dataset - dataset with the data appended (h5py.Dataset)
+        '''
+        key = dataset.name.rsplit('/',1)[-1]
+        dtype = np.result_type(dataset.dtype, value.dtype)
+        if dataset.shape[1:] != value.shape[1:] or dtype != dataset.dtype:
+            if dataset.shape[1:] != value.shape[1:]:
+                value = value.reshape(-1)
+            old_value = dataset[()].reshape((-1,)+value.shape[1:])
+            del trial_grp[key]
+            value = np.concatenate((old_value.astype(dtype), value.astype(dtype)))
+            return trial_grp.create_dataset(key,data=value,maxshape=(None,)+value.shape[1:],chunks=_chunk_shape(value),**_filters(self.storage,key,value))
+        num_old = dataset.shape[0]
+        dataset.resize(num_old + value.shape[0], axis=0)
+        dataset[num_old:] = value
+        return dataset
+
+    def set_attrs(self, attrs):
+        '''
+        Arguments:
+            attrs - file attribute name to value; None values are not saved (dict)
+        '''
+        data_file = self.open()
+        for key,value in attrs.items():
+            if value is not None: # HDF5 has no None
+                data_file.attrs[key] = value
+        self.flush()
+
+    def flush(self, force=True):
+        '''
+        Arguments:
+            force - flush even if 'flush_interval' has not passed since the last flush (bool)
+        '''
+        if self.data_file is None:
+            return
+        t = time.monotonic()
+        if force or t - self.last_flush_t >= self.flush_interval:
+            self.data_file.flush()
+            self.last_flush_t = t
+
+    def close(self):
+        if self.data_file is not None:
+            self.data_file.close()
+            self.data_file = None
+            self.trial_grp = None
+            self.datasets = {}